@@ -7,10 +7,11 @@ from flask_restful import Api
 from flask_jwt_extended import JWTManager
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from pymongo import MongoClient
 from config import Config
 from app.swagger import setup_swagger
 from flask_cors import CORS
+from app.utils.connection import MongoConnectionManager, LazyDatabase
+from app.utils.json_provider import MongoJSONProvider
 
 # Initialize extensions
 mail = Mail()
@@ -19,16 +20,23 @@ limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["100 per minute"],
 )
-mongo_client = None
-db = None
+# The client itself is only created on first use, in the process that
+# uses it, which keeps preloading the app in the gunicorn master safe
+mongo = MongoConnectionManager()
+db = LazyDatabase(mongo)
 
 '''
 Application factory function for creating and configuring the Flask app.
 - Loads configuration from the provided config class.
 - Initializes Flask extensions (JWT, Mail, Limiter, CORS).
-- Sets up MongoDB connection and JWT token blacklist checking.
+- Configures the MongoDB connection and JWT token blacklist checking.
 - Registers all application blueprints for routing.
 - Configures Swagger UI for API documentation.
+- Compresses large responses.
+- Registers the CLI commands.
+The declared indexes are reconciled, and the expired cooldowns swept, by
+the gunicorn workers, see gunicorn_config.post_worker_init, or by
+`flask db ensure-indexes` and `flask cooldowns sweep`.
 Args:
     config_class (class, optional): The configuration class to use. Defaults to Config.
 Returns:
@@ -37,6 +45,8 @@ Returns:
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # jsonify encodes ObjectId, datetime and Decimal128 fields directly
+    app.json = MongoJSONProvider(app)
     app.url_map.strict_slashes = False
 
     raw_origins = app.config.get("CORS_ORIGINS", "")
@@ -59,18 +69,17 @@ def create_app(config_class=Config):
     limiter.init_app(app)
     mail.init_app(app)
     
-    # Initialize MongoDB connection
-    global mongo_client, db
-    mongo_client = MongoClient(app.config['MONGO_URI'])
-    db = mongo_client[app.config['DATABASE_NAME']]
+    # Configure the MongoDB connection, the client is created lazily
+    mongo.init_app(app)
+
+    from app.models.token_blacklist import TokenBlacklist
 
     # Blacklist check function
     @jwt.token_in_blocklist_loader
     def check_if_token_in_blacklist(jwt_header, jwt_payload):
         jti = jwt_payload['jti']  # Get the unique identifier of the token
-        # Check if the token exists in the blacklist collection
-        token = db.token_blacklist.find_one({"jti": jti})
-        return token is not None  # Return True if the token is blacklisted
+        # Answered from the per worker blocklist cache in most cases
+        return TokenBlacklist.is_revoked(jti)
     
     # Register blueprints
     from app.routes.auth import auth_bp
@@ -101,4 +110,15 @@ def create_app(config_class=Config):
     # Setup Swagger UI
     setup_swagger(app)
 
+    # Compress large responses, see app.utils.compression
+    from app.utils.compression import init_compression
+    init_compression(app)
+
+    # Register the maintenance commands (flask db ..., flask users ...)
+    from app.cli import db_cli, users_cli, cooldowns_cli, recommendations_cli
+    app.cli.add_command(db_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(cooldowns_cli)
+    app.cli.add_command(recommendations_cli)
+
     return app
@@ -0,0 +1,139 @@
+import click
+from flask.cli import AppGroup
+
+'''
+Command line interface for operating the application's database.
+The commands are registered on the Flask CLI by create_app, e.g.:
+    flask db ensure-indexes
+    flask db ensure-indexes --dry-run
+    flask db migrate-enrollments
+    flask db build-content-indexes
+    flask db migrate-content-blocks
+    flask users set-role someone@example.com admin
+    flask cooldowns sweep
+    flask recommendations build-similarities
+'''
+db_cli = AppGroup('db', help='Database maintenance commands.')
+users_cli = AppGroup('users', help='User administration commands.')
+cooldowns_cli = AppGroup('cooldowns', help='Assessment cooldown commands.')
+recommendations_cli = AppGroup('recommendations', help='Recommendation engine commands.')
+
+'''
+Reconciles the declared index registry against the live database.
+Builds every missing index in the background and reports indexes
+whose options drifted or that are not declared by any model.
+'''
+@db_cli.command('ensure-indexes')
+@click.option('--dry-run', is_flag=True, help='Only report what would be built.')
+def ensure_indexes_command(dry_run):
+    from app import db
+    from app.utils.indexes import ensure_indexes, format_index_report
+
+    report = ensure_indexes(db, dry_run=dry_run)
+    for line in format_index_report(report, dry_run=dry_run):
+        click.echo(line)
+
+'''
+Moves the enrolled_users and completed_users arrays out of the course
+documents into the enrollments collection, one course at a time. Safe
+to run again, e.g. after an interrupted run.
+'''
+@db_cli.command('migrate-enrollments')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Number of enrollments written per bulk write.')
+def migrate_enrollments_command(batch_size):
+    from app.models.enrollment import Enrollment
+
+    def report(course_id, migrated):
+        click.echo(f'{course_id}: {migrated} enrollments')
+
+    totals = Enrollment.migrate_from_courses(batch_size=batch_size, on_course=report)
+    click.echo(
+        f"Migrated {totals['enrollments']} enrollments of {totals['courses']} courses"
+    )
+
+'''
+Builds the content index of the courses created before it existed, see
+app.utils.content_index. Courses without one are indexed on their first
+content read or edit anyway, this does it ahead of time.
+'''
+@db_cli.command('build-content-indexes')
+def build_content_indexes_command():
+    from app.models.course import Course
+
+    indexed = Course.build_missing_content_indexes(
+        on_course=lambda course_id: click.echo(f'{course_id}: indexed')
+    )
+    click.echo(f'Indexed the content of {indexed} courses')
+
+'''
+Moves the content data embedded in the courses into the content_blocks
+collection, see ContentBlock. Set COURSE_CONTENT_STORAGE=blocks as well,
+so new courses store blocks too.
+'''
+@db_cli.command('migrate-content-blocks')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Number of blocks written per bulk write.')
+def migrate_content_blocks_command(batch_size):
+    from app.models.content_block import ContentBlock
+
+    def report(course_id, migrated):
+        click.echo(f'{course_id}: {migrated} blocks')
+
+    totals = ContentBlock.migrate_from_courses(batch_size=batch_size, on_course=report)
+    click.echo(f"Migrated {totals['blocks']} blocks of {totals['courses']} courses")
+
+'''
+Changes the role of a user. Roles must be changed through this command
+(or User.update_role) rather than edited in the database, since only
+then is the role version bumped and outstanding tokens re-checked.
+'''
+@users_cli.command('set-role')
+@click.argument('email')
+@click.argument('role', type=click.Choice(['user', 'admin']))
+def set_role_command(email, role):
+    from app.models.user import User
+
+    user = User.find_by_email(email)
+    if user is None:
+        raise click.ClickException(f'No user with email {email}')
+    User.update_role(user['_id'], role)
+    click.echo(f"{email} is now {role}")
+
+'''
+Removes every expired cooldown from the users collection at once.
+Expired cooldowns are already ignored when a user is read, so this only
+keeps the stored documents tidy.
+'''
+@cooldowns_cli.command('sweep')
+def sweep_cooldowns_command():
+    from app.utils.cooldown_manager import sweep_expired_cooldowns
+
+    cleared = sweep_expired_cooldowns()
+    click.echo(f'Cleared {cleared} expired cooldowns')
+
+'''
+Builds the nearest neighbors of every course from the courses users
+completed or are taking, see CourseSimilarityService, and replaces the
+stored ones. Collaborative recommendations only use the stored
+neighbors, so run it periodically, e.g. nightly from cron.
+'''
+@recommendations_cli.command('build-similarities')
+@click.option('--metric', type=click.Choice(['cosine', 'jaccard']), default=None,
+              help='How co-enrollments are scored. [default: COURSE_SIMILARITY_METRIC]')
+@click.option('--top-k', type=click.IntRange(min=1), default=None,
+              help='Neighbors kept per course. [default: COURSE_SIMILARITY_TOP_K]')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Number of users read, and of courses written, per round trip.')
+def build_similarities_command(metric, top_k, batch_size):
+    from flask import current_app
+    from app.services.course_similarity import CourseSimilarityService
+
+    metric = metric or current_app.config['COURSE_SIMILARITY_METRIC']
+    top_k = top_k or current_app.config['COURSE_SIMILARITY_TOP_K']
+    built, error = CourseSimilarityService.build(
+        metric=metric, top_k=top_k, batch_size=batch_size
+    )
+    if error:
+        raise click.ClickException(error)
+    click.echo(f'Built the {metric} neighbors of {built} courses')
@@ -1,12 +1,44 @@
+import sys
+import time
 from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from app import db
+from app.utils.cache import LRUCache
+from app.utils.indexes import register_indexes
+from app.utils.pagination import keyset_filter, decode_cursor, SORT_BY_NEWEST
 from app.utils.validation import html_tags_unconverter
+from config import Config
 
 assessments_collection = db.assessments
 results_collection = db.results
 questions_collection = db.questions
 
+register_indexes('assessments', [
+    IndexModel([('course_id', ASCENDING)], background=True),
+    # find_all, newest first with a total order for cursor pagination
+    IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], background=True),
+    # AnswerKey.invalidate_for_question
+    IndexModel([('questions', ASCENDING)], background=True),
+])
+
+register_indexes('results', [
+    # find_latest_by_user_and_assessment and find_by_course_and_user_id
+    IndexModel(
+        [('user_id', ASCENDING), ('assessment_id', ASCENDING), ('created_at', DESCENDING)],
+        background=True
+    ),
+    # find_by_user, with _id last for cursor pagination
+    IndexModel(
+        [('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        background=True
+    ),
+    # find_by_assessment, find_average_score and delete_by_assessment_id
+    IndexModel([('assessment_id', ASCENDING), ('created_at', DESCENDING)], background=True),
+    # Multikey index over the embedded question snapshots
+    IndexModel([('questions._id', ASCENDING)], background=True),
+])
+
 '''
 Assessment Model
 - Represents an assessment in the system
@@ -65,6 +97,24 @@ class Assessment:
         except Exception as e:
             return None
 
+    '''
+    Reads the version of an assessment, without the assessment itself,
+    see app.utils.conditional. Every update sets its updated_at.
+    Args:
+        assessment_id (str): ID of the assessment
+    Returns:
+        dict: The updated_at of the assessment, None if not found
+    '''
+    @staticmethod
+    def get_version(assessment_id):
+        """Get the version of an assessment"""
+        try:
+            return assessments_collection.find_one(
+                {'_id': ObjectId(assessment_id)}, {'_id': 0, 'updated_at': 1}
+            )
+        except Exception as e:
+            return None
+
     '''
     Finds assessments by course ID.
     Args:
@@ -77,11 +127,7 @@ class Assessment:
         """Find assessments for a specific course"""
         try:
             cursor = assessments_collection.find({'course_id': course_id})
-            results = []
-            for course in cursor:
-                course['_id'] = str(course['_id'])
-                results.append(course)
-            return results
+            return list(cursor)
         except Exception as e:
             return None
 
@@ -90,21 +136,23 @@ class Assessment:
     Args:
         limit (int): Maximum number of assessments to return
         skip (int): Number of assessments to skip for pagination
+        after (str, optional): Cursor of the previous page, see
+        app.utils.pagination. Takes precedence over skip.
     Returns:
-        list: List of assessment documents with pagination applied
+        list: List of assessment documents with pagination applied,
+        newest first
+    Raises:
+        ValueError: If after is not a valid cursor
     '''
     @staticmethod
-    def find_all(limit=20, skip=0):
+    def find_all(limit=20, skip=0, after=None):
         """Find all assessments with pagination"""
+        query = keyset_filter({}, SORT_BY_NEWEST, after)
         try:
             limit = int(limit)
-            skip = int(skip)
-            cursor = assessments_collection.find().sort('created_at', -1).skip(skip).limit(limit)
-            results = []
-            for course in cursor:
-                course['_id'] = str(course['_id'])
-                results.append(course)
-            return results
+            skip = 0 if after else int(skip)
+            cursor = assessments_collection.find(query).sort(SORT_BY_NEWEST).skip(skip).limit(limit)
+            return list(cursor)
         except Exception as e:
             return None
 
@@ -125,9 +173,8 @@ class Assessment:
                 {'_id': ObjectId(assessment_id)},
                 {'$set': update_data}
             )
-            result = assessments_collection.find_one({'_id': ObjectId(assessment_id)})
-            result['_id'] = str(result['_id'])
-            return result
+            AnswerKey.invalidate(assessment_id)
+            return assessments_collection.find_one({'_id': ObjectId(assessment_id)})
         except Exception as e:
             return None
 
@@ -143,11 +190,191 @@ class Assessment:
         """Delete an assessment"""
         try:
             result = assessments_collection.delete_one({'_id': ObjectId(assessment_id)})
+            AnswerKey.invalidate(assessment_id)
             return result.deleted_count > 0
         except Exception as e:
             return None
 
 
+# Compiled answer keys of this process, see AnswerKey, as (time their
+# version was last checked, answer key)
+_answer_keys = LRUCache(
+    max_entries=Config.ANSWER_KEY_CACHE_SIZE,
+    ttl=Config.ANSWER_KEY_CACHE_TTL_SECONDS,
+)
+
+'''
+Answer Key
+- Compiled, read only form of an assessment used to score submissions
+  without reading the assessment and its questions every time
+- Answer keys are cached per process. Writes through this process drop
+  the key right away. For edits made through other workers, a cached
+  key is checked against the updated_at of its assessment once it was
+  last checked more than ANSWER_KEY_VERSION_CHECK_SECONDS ago, and only
+  used while it still matches its version. Question edits touch the
+  updated_at of the assessments using the question for this reason
+- Fields of an answer key:
+    - assessment_id: ID of the assessment
+    - course_id: ID of the course associated with the assessment
+    - version: updated_at of the assessment the key was compiled from
+    - question_ids: Ordered question IDs of the assessment
+    - correct_answers: Correct answer of each question, as stored
+    - tags: Unescaped, interned tags of each question
+    - missing: Positions of questions that no longer exist
+'''
+class AnswerKey:
+    '''
+    Returns the answer key of an assessment, compiling it on a miss or
+    when the assessment changed since the cached key was compiled. The
+    version of a cached key is read at most once every
+    ANSWER_KEY_VERSION_CHECK_SECONDS, other lookups make no query.
+    Args:
+        assessment_id (str): ID of the assessment
+    Returns:
+        dict: The answer key, or None if the assessment does not exist
+    '''
+    @staticmethod
+    def get(assessment_id):
+        """Get the compiled answer key of an assessment"""
+        entry = _answer_keys.get(str(assessment_id))
+        if entry is not None:
+            checked_at, key = entry
+            now = time.monotonic()
+            if now - checked_at <= Config.ANSWER_KEY_VERSION_CHECK_SECONDS:
+                return key
+            current = Assessment.get_version(assessment_id)
+            if current is None:
+                AnswerKey.invalidate(assessment_id)
+                return None
+            if current.get('updated_at') == key['version']:
+                _answer_keys.set(str(assessment_id), (now, key))
+                return key
+
+        key = AnswerKey.compile(assessment_id)
+        if key is not None:
+            _answer_keys.set(str(assessment_id), (time.monotonic(), key))
+        return key
+
+    '''
+    Compiles the answer key of an assessment from the database.
+    Reads the assessment and all of its questions in two queries.
+    Args:
+        assessment_id (str): ID of the assessment
+    Returns:
+        dict: The answer key, or None if the assessment does not exist
+    '''
+    @staticmethod
+    def compile(assessment_id):
+        """Compile the answer key of an assessment"""
+        assessment = Assessment.find_by_id(assessment_id)
+        if not assessment:
+            return None
+
+        question_ids = [str(qid) for qid in assessment.get('questions', [])]
+        questions = {}
+        if question_ids:
+            cursor = questions_collection.find(
+                {'_id': {'$in': [ObjectId(qid) for qid in set(question_ids)]}},
+                {'correct_answer': 1, 'tags': 1}
+            )
+            questions = {str(question['_id']): question for question in cursor}
+
+        correct_answers = []
+        tags = []
+        missing = []
+        for i, question_id in enumerate(question_ids):
+            question = questions.get(question_id)
+            if question is None:
+                missing.append(i)
+                correct_answers.append(None)
+                tags.append(())
+                continue
+            correct_answers.append(question.get('correct_answer'))
+            tags.append(tuple(
+                sys.intern(html_tags_unconverter(tag))
+                for tag in question.get('tags', [])
+            ))
+
+        return {
+            'assessment_id': str(assessment['_id']),
+            'course_id': assessment.get('course_id'),
+            'version': assessment.get('updated_at'),
+            'question_ids': tuple(question_ids),
+            'correct_answers': tuple(correct_answers),
+            'tags': tuple(tags),
+            'missing': frozenset(missing),
+        }
+
+    '''
+    Drops the cached answer key of one or more assessments.
+    Args:
+        assessment_ids (str or list): ID or IDs of the assessments
+    Returns:
+        None
+    '''
+    @staticmethod
+    def invalidate(assessment_ids):
+        """Drop cached answer keys"""
+        if isinstance(assessment_ids, (str, ObjectId)):
+            assessment_ids = [assessment_ids]
+        for assessment_id in assessment_ids:
+            _answer_keys.pop(str(assessment_id))
+
+    '''
+    Marks assessments as changed, for changes that are not written to
+    the assessments themselves, e.g. question edits: their updated_at is
+    set to now, so every worker recompiles their answer key.
+    Args:
+        assessment_ids (str or list): ID or IDs of the assessments
+    Returns:
+        None
+    '''
+    @staticmethod
+    def touch(assessment_ids):
+        """Change the version of the answer keys of assessments"""
+        if isinstance(assessment_ids, (str, ObjectId)):
+            assessment_ids = [assessment_ids]
+        object_ids = [
+            ObjectId(assessment_id) for assessment_id in assessment_ids
+            if ObjectId.is_valid(assessment_id)
+        ]
+        if object_ids:
+            assessments_collection.update_many(
+                {'_id': {'$in': object_ids}},
+                {'$set': {'updated_at': datetime.now(timezone.utc).isoformat()}}
+            )
+        AnswerKey.invalidate(assessment_ids)
+
+    '''
+    Drops the answer keys of every assessment using a question, in
+    every worker (see AnswerKey.touch).
+    A question is linked to an assessment either through its
+    assessment_ids or through the questions list of the assessment.
+    Args:
+        question (dict): The question document
+    Returns:
+        None
+    '''
+    @staticmethod
+    def invalidate_for_question(question):
+        """Drop the cached answer keys that include a question"""
+        assessment_ids = set(str(aid) for aid in question.get('assessment_ids', []))
+        cursor = assessments_collection.find(
+            {'questions': str(question['_id'])}, {'_id': 1}
+        )
+        assessment_ids.update(str(assessment['_id']) for assessment in cursor)
+        AnswerKey.touch(list(assessment_ids))
+
+    '''
+    Returns the counters of the answer key cache.
+    Returns:
+        dict: Cache statistics, see LRUCache.stats
+    '''
+    @staticmethod
+    def cache_stats():
+        """Get the answer key cache statistics"""
+        return _answer_keys.stats()
+
 '''
 Assessment Result Model
 - Represents a user's result for an assessment
@@ -214,30 +441,35 @@ class AssessmentResult:
         user_id (str): ID of the user to find results for
         limit (int, optional): Maximum number of results to return. Defaults to 20.
         skip (int, optional): Number of results to skip for pagination. Defaults to 0
+        after (str, optional): Cursor of the previous page, see
+        app.utils.pagination. Takes precedence over skip.
     Returns:
-        list: List of assessment result documents for the specified user
+        list: List of assessment result documents for the specified user,
+        newest first
+    Raises:
+        ValueError: If after is not a valid cursor
     '''
     @staticmethod
-    def find_by_user(user_id, limit=20, skip=0):
+    def find_by_user(user_id, limit=20, skip=0, after=None):
         """Find assessment results for a specific user"""
+        if after:
+            decode_cursor(after, SORT_BY_NEWEST)
         try:
             limit = int(limit)
-            skip = int(skip)
+            skip = 0 if after else int(skip)
             if not isinstance(user_id, str):
                 user_id = str(user_id)
 
-            assessment_results_cursor = results_collection.find({'user_id': user_id}).sort(
-                'created_at', -1
+            query = keyset_filter({'user_id': user_id}, SORT_BY_NEWEST, after)
+            assessment_results_cursor = results_collection.find(query).sort(
+                SORT_BY_NEWEST
             ).skip(skip).limit(limit)
             if not assessment_results_cursor:
                 return None
             results = []
             for assessment_result in assessment_results_cursor:
-                assessment_result['_id'] = str(assessment_result['_id'])
                 questions = []
                 for question in assessment_result.get('questions', []):
-                    if isinstance(question.get('_id', ''), ObjectId):
-                        question['_id'] = str(question['_id'])
                     for field in question:
                         if field == 'question_text' or field == 'correct_answer':
                             question[field] = html_tags_unconverter(question[field])
@@ -282,13 +514,11 @@ class AssessmentResult:
             result['answers'] = [html_tags_unconverter(answer) for answer in result.get('answers', [])]
             questions = []
             for question in result.get('questions', []):
-                question['_id'] = str(question.get('_id'))
                 question['question_text'] = html_tags_unconverter(question.get('question_text'))
                 question['tags'] = [html_tags_unconverter(tag) for tag in question.get('tags', [])]
                 question['options'] = [html_tags_unconverter(opt) for opt in question.get('options', [])]
                 questions.append(question)
             result['questions'] = questions
-            result['_id'] = str(result.get('_id'))
             return result
         except Exception as e:
             return None
@@ -311,11 +541,7 @@ class AssessmentResult:
             cursor = results_collection.find({'assessment_id': assessment_id}).sort(
                 'created_at', -1
             ).skip(skip).limit(limit)
-            results = []
-            for course in cursor:
-                course['_id'] = str(course['_id'])
-                results.append(course)
-            return results
+            return list(cursor)
         except Exception as e:
             return None
 
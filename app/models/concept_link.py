@@ -1,10 +1,17 @@
 from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING
 from app import db
+from app.utils.indexes import register_indexes
+from app.utils.pagination import keyset_filter, SORT_BY_ID
 from app.utils.validation import validate_website_link, html_tags_converter
 
 concept_links_collection = db.concepts
 
+register_indexes('concepts', [
+    IndexModel([('concepts', ASCENDING)], background=True),
+])
+
 '''
 This is a model for concept links in the application.
 It provides methods to create, retrieve, update, and delete concept
@@ -51,8 +58,8 @@ class ConceptLinks:
                 'description': description,
                 'created_at': datetime.now(timezone.utc).isoformat()
             }
-            result = concept_links_collection.insert_one(concept)
-            concept['_id'] = str(result.inserted_id)
+            # insert_one sets the _id of the concept
+            concept_links_collection.insert_one(concept)
             return concept
         except Exception as e:
             return None
@@ -86,13 +93,19 @@ class ConceptLinks:
     Args:
         skip - number of documents to skip (for pagination)
         limit - maximum number of documents to return
+        after - cursor of the previous page (see app.utils.pagination),
+        takes precedence over skip
     Returns:
-        a list of all retrieved concept link objects
+        a list of all retrieved concept link objects, ordered by _id
+    Raises:
+        ValueError if after is not a valid cursor
     '''
     @staticmethod
-    def get_concepts(skip=0, limit=10):
+    def get_concepts(skip=0, limit=10, after=None):
+        query = keyset_filter({}, SORT_BY_ID, after)
         try:
-            return concept_links_collection.find({}).limit(limit).skip(skip)
+            return concept_links_collection.find(query).sort(SORT_BY_ID)\
+                .limit(limit).skip(0 if after else skip)
         except Exception as e:
             return None
 
@@ -0,0 +1,390 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from app import db
+from app.utils.content_index import build_content_index
+from app.utils.indexes import register_indexes
+
+content_blocks_collection = db.content_blocks
+
+register_indexes('content_blocks', [
+    # The blocks of a subsection in order, also serves the lookups of the
+    # blocks of a section or of a whole course
+    IndexModel(
+        [
+            ('course_id', ASCENDING),
+            ('section_id', ASCENDING),
+            ('subsection_id', ASCENDING),
+            ('order', ASCENDING)
+        ],
+        background=True
+    ),
+    IndexModel([('data_id', ASCENDING)], unique=True, background=True),
+])
+
+# Where the content data objects of a course are stored, see the
+# content_storage field of the course documents
+CONTENT_STORAGE_EMBEDDED = 'embedded'
+CONTENT_STORAGE_BLOCKS = 'blocks'
+CONTENT_STORAGES = (CONTENT_STORAGE_EMBEDDED, CONTENT_STORAGE_BLOCKS)
+
+# Leaves out the fields that only exist on blocks, so a block reads like
+# the data object embedded in a subsection
+DATA_PROJECTION = {
+    '_id': 0,
+    'course_id': 0,
+    'section_id': 0,
+    'subsection_id': 0,
+    'created_at': 0,
+    'updated_at': 0,
+}
+
+# Sort of the blocks of a course, by subsection and then by order
+COURSE_BLOCKS_SORT = [
+    ('section_id', ASCENDING),
+    ('subsection_id', ASCENDING),
+    ('order', ASCENDING)
+]
+
+'''
+ContentBlock Model
+- Stores the content data objects of the courses whose content_storage
+  is 'blocks', one document per data object, instead of the data arrays
+  nested in the subsections of the course document. The course document
+  then only keeps the outline of its sections and subsections, so
+  fetching or editing a course no longer carries all of its content.
+- Fields in a typical document:
+    - course_id, section_id and subsection_id: where the block belongs
+    - the fields of the data object: data_id, type, order, content, ...
+    - created_at and updated_at timestamps
+'''
+class ContentBlock:
+    '''
+    Finds the content data of a subsection.
+    Args:
+        course_id (str): ID of the course.
+        section_id (str): ID of the section.
+        subsection_id (str): ID of the subsection.
+    Returns:
+        list: The data objects, by order.
+    '''
+    @staticmethod
+    def find_by_subsection(course_id, section_id, subsection_id):
+        """Find the content data of a subsection"""
+        return list(content_blocks_collection.find(
+            {
+                'course_id': str(course_id),
+                'section_id': section_id,
+                'subsection_id': subsection_id
+            },
+            DATA_PROJECTION
+        ).sort('order', ASCENDING))
+
+    '''
+    Sets the data of every subsection of a course outline from the
+    blocks of the course, read with a single query.
+    Args:
+        course_id (str): ID of the course.
+        sections (list): The sections of the course, changed in place.
+        fields (tuple, optional): Only return these fields of the data
+        objects, e.g. ('data_id', 'order'). Defaults to all of them.
+    Returns:
+        list: The sections.
+    '''
+    @staticmethod
+    def attach(course_id, sections, fields=None):
+        """Attach the content data of a course to its outline"""
+        if fields is None:
+            projection = {
+                field: 0 for field in DATA_PROJECTION
+                if field not in ('section_id', 'subsection_id')
+            }
+        else:
+            projection = {
+                '_id': 0, 'section_id': 1, 'subsection_id': 1,
+                **{field: 1 for field in fields}
+            }
+
+        data = {}
+        for block in content_blocks_collection.find(
+            {'course_id': str(course_id)}, projection
+        ).sort(COURSE_BLOCKS_SORT):
+            key = (block.pop('section_id'), block.pop('subsection_id'))
+            data.setdefault(key, []).append(block)
+
+        for section in sections:
+            for subsection in section.get('sub_sections', []):
+                subsection['data'] = data.get(
+                    (section.get('section_id'), subsection.get('subsection_id')), []
+                )
+        return sections
+
+    '''
+    Adds a data object to a subsection, after its last block if the data
+    object has no order.
+    Args:
+        course_id (str): ID of the course.
+        section_id (str): ID of the section.
+        subsection_id (str): ID of the subsection.
+        data_object (dict): The data object, with its data_id.
+    Returns:
+        dict: The data object.
+    '''
+    @staticmethod
+    def add(course_id, section_id, subsection_id, data_object):
+        """Add a data object to a subsection"""
+        if 'order' not in data_object:
+            last = content_blocks_collection.find_one(
+                {
+                    'course_id': str(course_id),
+                    'section_id': section_id,
+                    'subsection_id': subsection_id
+                },
+                {'order': 1},
+                sort=[('order', DESCENDING)]
+            )
+            data_object['order'] = (last or {}).get('order', 0) + 1
+        content_blocks_collection.insert_one(
+            ContentBlock.to_blocks(course_id, section_id, subsection_id, [data_object])[0]
+        )
+        return data_object
+
+    '''
+    Updates fields of a data object.
+    Args:
+        course_id (str): ID of the course.
+        section_id (str): ID of the section.
+        subsection_id (str): ID of the subsection.
+        data_id (str): ID of the data object.
+        values (dict): The fields to set.
+    Returns:
+        bool: True if the data object was modified, False otherwise.
+    '''
+    @staticmethod
+    def update(course_id, section_id, subsection_id, data_id, values):
+        """Update a data object"""
+        result = content_blocks_collection.update_one(
+            {
+                'data_id': data_id,
+                'course_id': str(course_id),
+                'section_id': section_id,
+                'subsection_id': subsection_id
+            },
+            {'$set': {**values, 'updated_at': datetime.now(timezone.utc).isoformat()}}
+        )
+        return result.modified_count > 0
+
+    '''
+    Sets the order of data objects of a course.
+    Args:
+        course_id (str): ID of the course.
+        orders (dict): The new order of each data_id.
+    Returns:
+        None
+    '''
+    @staticmethod
+    def set_orders(course_id, orders):
+        """Set the order of data objects"""
+        if not orders:
+            return
+        updated_at = datetime.now(timezone.utc).isoformat()
+        content_blocks_collection.bulk_write([
+            UpdateOne(
+                {'data_id': data_id, 'course_id': str(course_id)},
+                {'$set': {'order': order, 'updated_at': updated_at}}
+            )
+            for data_id, order in orders.items()
+        ], ordered=False)
+
+    '''
+    Deletes a data object.
+    Args:
+        course_id (str): ID of the course.
+        section_id (str): ID of the section.
+        subsection_id (str): ID of the subsection.
+        data_id (str): ID of the data object.
+    Returns:
+        bool: True if the data object was deleted, False otherwise.
+    '''
+    @staticmethod
+    def delete(course_id, section_id, subsection_id, data_id):
+        """Delete a data object"""
+        result = content_blocks_collection.delete_one({
+            'data_id': data_id,
+            'course_id': str(course_id),
+            'section_id': section_id,
+            'subsection_id': subsection_id
+        })
+        return result.deleted_count > 0
+
+    '''
+    Deletes the blocks of a course, or of one of its sections or
+    subsections.
+    Args:
+        course_id (str): ID of the course.
+        section_id (str, optional): Only delete the blocks of this section.
+        subsection_id (str, optional): Only delete the blocks of this
+        subsection of the section.
+    Returns:
+        int: The number of blocks deleted.
+    '''
+    @staticmethod
+    def delete_many(course_id, section_id=None, subsection_id=None):
+        """Delete the blocks of a course, section or subsection"""
+        query = {'course_id': str(course_id)}
+        if section_id is not None:
+            query['section_id'] = section_id
+            if subsection_id is not None:
+                query['subsection_id'] = subsection_id
+        return content_blocks_collection.delete_many(query).deleted_count
+
+    '''
+    Inserts blocks made by to_blocks or split.
+    Args:
+        blocks (list): The blocks.
+    Returns:
+        None
+    '''
+    @staticmethod
+    def insert_many(blocks):
+        """Insert blocks"""
+        if blocks:
+            content_blocks_collection.insert_many(blocks, ordered=False)
+
+    '''
+    Makes the blocks of data objects of a subsection. Data objects
+    without a data_id get one, and those without an order their position.
+    Args:
+        course_id (str): ID of the course.
+        section_id (str): ID of the section.
+        subsection_id (str): ID of the subsection.
+        data (list): The data objects of the subsection.
+    Returns:
+        list: The blocks.
+    '''
+    @staticmethod
+    def to_blocks(course_id, section_id, subsection_id, data):
+        now = datetime.now(timezone.utc).isoformat()
+        return [
+            {
+                **data_object,
+                'data_id': data_object.get('data_id') or str(ObjectId()),
+                'order': data_object.get('order', position + 1),
+                'course_id': str(course_id),
+                'section_id': section_id,
+                'subsection_id': subsection_id,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for position, data_object in enumerate(data or [])
+        ]
+
+    '''
+    Splits subsections into their outline, without data, and the blocks
+    of their data. The subsections are left unchanged.
+    Args:
+        course_id (str): ID of the course.
+        section_id (str): ID of the section of the subsections.
+        sub_sections (list): The subsections.
+    Returns:
+        tuple: (sub_sections, blocks)
+    '''
+    @staticmethod
+    def split_subsections(course_id, section_id, sub_sections):
+        outline, blocks = [], []
+        for subsection in sub_sections or []:
+            outline.append({key: value for key, value in subsection.items() if key != 'data'})
+            blocks.extend(ContentBlock.to_blocks(
+                course_id, section_id, subsection.get('subsection_id'), subsection.get('data')
+            ))
+        return outline, blocks
+
+    '''
+    Splits sections into their outline, with subsections without data,
+    and the blocks of their data. The sections are left unchanged.
+    Args:
+        course_id (str): ID of the course.
+        sections (list): The sections.
+    Returns:
+        tuple: (sections, blocks)
+    '''
+    @staticmethod
+    def split(course_id, sections):
+        outline, blocks = [], []
+        for section in sections or []:
+            sub_sections, section_blocks = ContentBlock.split_subsections(
+                course_id, section.get('section_id'), section.get('sub_sections')
+            )
+            outline.append({
+                **{key: value for key, value in section.items() if key != 'sub_sections'},
+                'sub_sections': sub_sections
+            })
+            blocks.extend(section_blocks)
+        return outline, blocks
+
+    '''
+    Moves the content data of the courses that embed it into blocks. Each
+    course is read once, its blocks are upserted by data_id, and its tree
+    is replaced by the outline in a write guarded by content_version, so
+    a course whose tree moves meanwhile is migrated again. Running it
+    again is harmless.
+    Args:
+        batch_size (int): Number of blocks written per bulk write.
+        on_course (callable, optional): Called with the course ID and the
+        number of blocks migrated, after each course.
+        attempts (int): Times a course is read and written before it is
+        left for the next run, when its tree keeps moving.
+    Returns:
+        dict: courses and blocks, the numbers migrated.
+    '''
+    @staticmethod
+    def migrate_from_courses(batch_size=1000, on_course=None, attempts=3):
+        """Migrate the embedded content data of the courses"""
+        courses_collection = db.courses
+        cursor = courses_collection.find(
+            {'content_storage': {'$ne': CONTENT_STORAGE_BLOCKS}}, {'_id': 1}
+        ).batch_size(100)
+
+        totals = {'courses': 0, 'blocks': 0}
+        for course_id in (course['_id'] for course in cursor):
+            for _ in range(attempts):
+                course = courses_collection.find_one(
+                    {'_id': course_id, 'content_storage': {'$ne': CONTENT_STORAGE_BLOCKS}},
+                    {'content.sections': 1, 'content_version': 1}
+                )
+                if course is None:
+                    break
+                outline, blocks = ContentBlock.split(
+                    course_id, course.get('content', {}).get('sections', [])
+                )
+                for start in range(0, len(blocks), batch_size):
+                    content_blocks_collection.bulk_write([
+                        ReplaceOne({'data_id': block['data_id']}, block, upsert=True)
+                        for block in blocks[start:start + batch_size]
+                    ], ordered=False)
+
+                result = courses_collection.update_one(
+                    {'_id': course_id, 'content_version': course.get('content_version')},
+                    {
+                        '$set': {
+                            'content.sections': outline,
+                            'content_storage': CONTENT_STORAGE_BLOCKS,
+                            'content_index': build_content_index(outline),
+                            'updated_at': datetime.now(timezone.utc).isoformat(),
+                        },
+                        '$inc': {'content_version': 1, 'version': 1}
+                    }
+                )
+                if result.matched_count == 0:
+                    continue
+                # Blocks upserted by an attempt whose data was deleted since
+                content_blocks_collection.delete_many({
+                    'course_id': str(course_id),
+                    'data_id': {'$nin': [block['data_id'] for block in blocks]}
+                })
+                totals['courses'] += 1
+                totals['blocks'] += len(blocks)
+                if on_course is not None:
+                    on_course(str(course_id), len(blocks))
+                break
+        return totals
@@ -1,9 +1,15 @@
 from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING
 from app import db
+from app.utils.indexes import register_indexes
 
 cooldowns_collection = db.cooldown_history
 
+register_indexes('cooldown_history', [
+    IndexModel([('user_id', ASCENDING)], background=True),
+])
+
 '''
 This is a model for managing cooldown history of users in a course.
 It allows creating, updating, finding, and deleting cooldown
@@ -1,11 +1,349 @@
 from datetime import datetime, timezone
+import atexit
+import logging
+import os
+import threading
+import time
+import bson
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import IndexModel, ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import PyMongoError
 from app import db
+from app.models.content_block import (
+    ContentBlock, CONTENT_STORAGE_BLOCKS, CONTENT_STORAGE_EMBEDDED
+)
+from app.models.enrollment import Enrollment
 from app.models.user import User
+from app.utils.cache import LRUCache
+from app.utils.content_index import (
+    CONTENT_LEVELS, array_path, build_content_index, is_indexable, locate,
+    node_path, position_guard, remove_from_index
+)
+from app.utils.indexes import register_indexes
+from app.utils.pagination import keyset_filter, SORT_BY_ID
+from app.utils.text_similarity import TfidfIndex, tokenize
 from app.utils.validation import html_tags_unconverter
+from config import Config
 
 courses_collection = db.courses
 
+# Child of the Flask application logger
+logger = logging.getLogger('app.course')
+
+register_indexes('courses', [
+    IndexModel([('category', ASCENDING)], background=True),
+    # Multikey index used by tag filtering and knowledge gap matching
+    IndexModel([('content.tags', ASCENDING)], background=True),
+    # Popular and recent course listings
+    IndexModel([('enrollment_count', DESCENDING)], background=True),
+    IndexModel([('created_at', DESCENDING)], background=True),
+])
+
+'''
+Projection used by the list finders in summary view.
+It leaves out the content tree, and the enrolled and completed users
+arrays of courses that were not migrated to the enrollments collection
+yet, and computes the number of sections and subsections on the server
+instead.
+'''
+COURSE_SUMMARY_PROJECTION = {
+    'title': 1,
+    'description': 1,
+    'category': 1,
+    'difficulty': 1,
+    'prerequisites': 1,
+    'content.tags': 1,
+    'enrollment_count': 1,
+    'completion_count': 1,
+    'created_at': 1,
+    'updated_at': 1,
+    'section_count': {'$size': {'$ifNull': ['$content.sections', []]}},
+    'subsection_count': {
+        '$sum': {
+            '$map': {
+                'input': {'$ifNull': ['$content.sections', []]},
+                'as': 'section',
+                'in': {'$size': {'$ifNull': ['$$section.sub_sections', []]}}
+            }
+        }
+    },
+}
+
+'''
+Projection used wherever whole course documents are returned. It leaves
+out the position index of the content tree, see app.utils.content_index,
+and the internal version and content_storage fields.
+'''
+COURSE_FULL_PROJECTION = {
+    'content_index': 0,
+    'content_version': 0,
+    'version': 0,
+    'content_storage': 0,
+}
+
+# Projection of the course reads of the course cache, which keeps the
+# version and content_storage of the course beside the document
+COURSE_READ_PROJECTION = {'content_index': 0, 'content_version': 0}
+
+# Views accepted by the list finders
+COURSE_LIST_VIEWS = ('summary', 'full')
+
+# Attempts of a content write guarded by content_version, when concurrent
+# writes keep moving the content tree under it
+CONTENT_WRITE_ATTEMPTS = 3
+
+'''
+Course documents read by Course.find_by_id, by course ID, as
+(version, content_storage, BSON of the document). Every write to a
+course increments its version field, so an entry is only returned while
+the version of the course still matches it, which also covers writes of
+other workers.
+Writes of this worker drop the entry right away as well. The
+enrollment_count and completion_count counters are the exception: they
+change with every enrollment, so their writes keep the version, and the
+counters of a cached course, or of its rendered body and ETag, are only
+refreshed by its next write. The course lists read them from the
+database.
+Documents are kept encoded, so every hit returns a fresh copy that
+callers may change, and the byte bound is the size of the encoded
+documents.
+'''
+_courses = LRUCache(
+    max_entries=Config.COURSE_CACHE_SIZE,
+    max_bytes=Config.COURSE_CACHE_MAX_BYTES,
+    sizeof=lambda entry: len(entry[2])
+)
+# Lookups of _courses that found an entry of an older version
+_stale_reads = 0
+
+'''
+Drops the cached document of a course, after a write to it.
+Args:
+    course_id (str): ID of the course.
+Returns:
+    None
+'''
+def _course_changed(course_id):
+    _courses.pop(str(course_id))
+
+'''
+Fields of a course read by the content similarity index.
+'''
+COURSE_TEXT_PROJECTION = {
+    'title': 1,
+    'description': 1,
+    'category': 1,
+    'content.tags': 1,
+    'content.sections.title': 1,
+}
+
+'''
+Content similarity index of the courses, see TfidfIndex, over their
+title, description, category, tags and section titles. Each worker
+builds it from every course on first use, and rebuilds it in the
+background once it is older than SIMILAR_COURSES_INDEX_TTL seconds,
+which picks up the writes of other workers and the section edits, while
+the requests keep using the previous one. Course.create, update and
+remove_course update it right away.
+'''
+_text_index = None
+_text_index_built_at = 0.0
+# Held while the index is built
+_text_index_lock = threading.Lock()
+# Writes made while the index is built, by course ID, as the terms of the
+# course, None once deleted. The build reads the courses before them may
+# have missed them, so they are applied to the new index before it
+# replaces the previous one.
+_text_index_changes = None
+_text_index_changes_lock = threading.Lock()
+
+'''
+Returns the terms of a course indexed by _text_index.
+Args:
+    course (dict): The course, with at least the fields of
+    COURSE_TEXT_PROJECTION.
+Returns:
+    list: The terms.
+'''
+def _course_terms(course):
+    content = course.get('content') or {}
+    parts = [course.get('title'), course.get('description'), course.get('category')]
+    parts.extend(content.get('tags') or [])
+    parts.extend(section.get('title') for section in content.get('sections') or [])
+    return tokenize(' '.join(str(part) for part in parts if part))
+
+'''
+Builds the content similarity index from every course and makes it the
+current one. The caller holds _text_index_lock.
+Returns:
+    TfidfIndex: The index.
+'''
+def _build_text_index():
+    global _text_index, _text_index_built_at, _text_index_changes
+    with _text_index_changes_lock:
+        _text_index_changes = {}
+    index = TfidfIndex(top_k=Config.SIMILAR_COURSES_TOP_K)
+    try:
+        index.build(
+            (str(course['_id']), _course_terms(course))
+            for course in courses_collection.find({}, COURSE_TEXT_PROJECTION)
+        )
+    except BaseException:
+        with _text_index_changes_lock:
+            _text_index_changes = None
+        raise
+    # Writes wait until the new index is in place, so none is missed
+    with _text_index_changes_lock:
+        for course_id, terms in _text_index_changes.items():
+            if terms is None:
+                index.remove(course_id)
+            else:
+                index.upsert(course_id, terms)
+        _text_index, _text_index_built_at = index, time.monotonic()
+        _text_index_changes = None
+    return index
+
+'''
+Rebuilds the content similarity index, on a background thread.
+The caller acquired _text_index_lock, which is released once done.
+Returns:
+    None
+'''
+def _rebuild_text_index():
+    try:
+        _build_text_index()
+    except PyMongoError as e:
+        logger.error(f'Rebuilding the similar courses index failed: {e}')
+    finally:
+        _text_index_lock.release()
+
+'''
+Returns the content similarity index. It is built on first use, and
+rebuilt in the background once older than SIMILAR_COURSES_INDEX_TTL
+seconds, the previous one being returned in the meantime.
+Returns:
+    TfidfIndex: The index.
+'''
+def _get_text_index():
+    index = _text_index
+    if index is None:
+        with _text_index_lock:
+            # Unless another thread built it while this one waited
+            if _text_index is None:
+                return _build_text_index()
+            return _text_index
+    if (time.monotonic() - _text_index_built_at > Config.SIMILAR_COURSES_INDEX_TTL
+            and _text_index_lock.acquire(blocking=False)):
+        threading.Thread(
+            target=_rebuild_text_index,
+            name='similar-courses-index',
+            daemon=True,
+        ).start()
+    return index
+
+'''
+Updates the content similarity index after a course was written, when
+this worker built it already, and records the write for a build in
+progress.
+Args:
+    course_id (str): ID of the course.
+    course (dict, optional): The course as written, None once deleted.
+Returns:
+    None
+'''
+def _course_text_changed(course_id, course=None):
+    course_id = str(course_id)
+    terms = None if course is None else _course_terms(course)
+    with _text_index_changes_lock:
+        if _text_index_changes is not None:
+            _text_index_changes[course_id] = terms
+        index = _text_index
+    if index is None:
+        return
+    if terms is None:
+        index.remove(course_id)
+    else:
+        index.upsert(course_id, terms)
+
+'''
+Enrollment counts of the new enrollments of this worker that are not
+added to the courses yet, by course ID. Enrolling a user then does not
+write the course, see EnrollmentService.enroll: a thread started by the
+first enrollment of each worker adds them every
+ENROLLMENT_COUNT_FLUSH_SECONDS, in a single bulk write, and they are also
+added when the worker exits. The counts of a course may thus lag its
+enrollments by that long.
+'''
+_pending_enrollments = {}
+_pending_enrollments_lock = threading.Lock()
+# Process that started the flush thread, a forked worker starts its own
+_enrollment_flusher_pid = None
+
+'''
+Adds the pending enrollment counts to the courses. Counts whose write
+failed are kept for the next flush, counts of deleted courses are
+dropped.
+Returns:
+    int: The number of courses updated.
+'''
+def _flush_enrollment_counts():
+    global _pending_enrollments
+    with _pending_enrollments_lock:
+        pending, _pending_enrollments = _pending_enrollments, {}
+    if not pending:
+        return 0
+    try:
+        courses_collection.bulk_write([
+            UpdateOne(
+                {'_id': ObjectId(course_id)},
+                {'$inc': {'enrollment_count': count}}
+            )
+            for course_id, count in pending.items()
+        ], ordered=False)
+    except PyMongoError as e:
+        logger.error(f'Writing the enrollment counts failed: {e}')
+        with _pending_enrollments_lock:
+            for course_id, count in pending.items():
+                _pending_enrollments[course_id] = _pending_enrollments.get(course_id, 0) + count
+        return 0
+    return len(pending)
+
+def _run_enrollment_flusher():
+    while True:
+        time.sleep(Config.ENROLLMENT_COUNT_FLUSH_SECONDS)
+        _flush_enrollment_counts()
+
+'''
+Starts the thread that flushes the enrollment counts, once per process.
+The caller holds _pending_enrollments_lock.
+Returns:
+    None
+'''
+def _start_enrollment_flusher():
+    global _enrollment_flusher_pid
+    if _enrollment_flusher_pid == os.getpid():
+        return
+    _enrollment_flusher_pid = os.getpid()
+    threading.Thread(
+        target=_run_enrollment_flusher,
+        name='enrollment-counts',
+        daemon=True,
+    ).start()
+    atexit.register(_flush_enrollment_counts)
+
+'''
+Returns the projection of a list view.
+Args:
+    view (str): 'summary' or 'full'.
+Returns:
+    dict: The projection, or None to return whole documents.
+'''
+def _list_projection(view):
+    if view not in COURSE_LIST_VIEWS:
+        raise ValueError(f"view must be one of {', '.join(COURSE_LIST_VIEWS)}")
+    return COURSE_SUMMARY_PROJECTION if view == 'summary' else COURSE_FULL_PROJECTION
+
 '''
 Course Model.
 This model represents a course in the system.
@@ -21,33 +359,57 @@ class Course:
         description (str): Description of the course.
         category (str): Category of the course.
         prerequisites (list): List of prerequisite courses.
-        content (dict): Content of the course.
         difficulty (str): Difficulty level of the course.
         tags (list): Tags associated with the course.
+        sections (list, optional): Sections built by ContentTreeBuilder,
+        inserted along with the course. With COURSE_CONTENT_STORAGE set
+        to 'blocks', their content data is inserted as content blocks and
+        the course only keeps their outline.
     Returns:
         dict: Created course object.
     '''
     @staticmethod
-    def create(title, description, category, prerequisites=None, difficulty=None, tags=None):
+    def create(title, description, category, prerequisites=None, difficulty=None, tags=None,
+               sections=None):
         """Create a new course"""
+        course_id = ObjectId()
+        storage = CONTENT_STORAGE_EMBEDDED
+        if Config.COURSE_CONTENT_STORAGE == CONTENT_STORAGE_BLOCKS:
+            storage = CONTENT_STORAGE_BLOCKS
+            sections, blocks = ContentBlock.split(course_id, sections)
+            ContentBlock.insert_many(blocks)
         course = {
+            '_id': course_id,
             'title': title,
             'description': description,
             'category': category,
             'prerequisites': prerequisites or [],
             'content': {
-                'sections': [],
+                'sections': sections or [],
                 'tags': tags or []
             },
             'difficulty': difficulty or 'beginner',
             'created_at': datetime.now(timezone.utc).isoformat(),
             'updated_at': datetime.now(timezone.utc).isoformat(),
+            # Maintained counters, the enrollments themselves are
+            # stored in the enrollments collection
             'enrollment_count': 0,
-            'enrolled_users': [],
-            'completed_users': [],
+            'completion_count': 0,
+            # Where the content data is stored, see ContentBlock
+            'content_storage': storage,
+            # Position index of the content tree, see app.utils.content_index
+            'content_version': 0,
+            'content_index': build_content_index(sections),
+            # Incremented by every write, see _courses
+            'version': 1,
         }
         result = courses_collection.insert_one(course)
         course['_id'] = str(result.inserted_id)
+        course.pop('content_index')
+        course.pop('content_version')
+        course.pop('version')
+        course.pop('content_storage')
+        _course_text_changed(course_id, course)
         return course
 
     '''
@@ -56,24 +418,28 @@ class Course:
         limit (int): Number of courses to return.
         skip (int): Number of courses to skip.
         filters (dict): Filters to apply to the query.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
+        after (str, optional): Cursor of the previous page, see
+        app.utils.pagination. Takes precedence over skip.
     Returns:
-        list: List of courses matching the filters.
+        list: List of courses matching the filters, ordered by _id.
     '''
     @staticmethod
-    def find_all(limit=20, skip=0, filters=None):
+    def find_all(limit=20, skip=0, filters=None, view='full', after=None):
         limit = int(limit)
-        skip = int(skip)
+        skip = 0 if after else int(skip)
         """Find all courses with optional filtering"""
-        query = filters or {}
-        cursor = courses_collection.find(query).skip(skip).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        query = keyset_filter(filters or {}, SORT_BY_ID, after)
+        cursor = courses_collection.find(
+            query, _list_projection(view)
+        ).sort(SORT_BY_ID).skip(skip).limit(limit)
+        return list(cursor)
 
     '''
     A static method that finds a specific course by its ID.
+    The course is read from the course cache when its version did not
+    change, which only reads the version from the database.
     Args:
         course_id (str): ID of the course to find.
     Returns:
@@ -82,12 +448,98 @@ class Course:
     @staticmethod
     def find_by_id(course_id):
         """Find a course by ID"""
+        course, _ = Course.find_with_version(course_id)
+        return course
+
+    '''
+    A static method that finds a course along with its version and
+    content storage, which the course documents returned by the finders
+    leave out, e.g. to cache a response by version.
+    Args:
+        course_id (str): ID of the course to find.
+        attach_blocks (bool): Whether to attach the content blocks of a
+        course that stores blocks to its outline, see ContentBlock.attach.
+    Returns:
+        tuple: (course, stamp) with the version, updated_at and
+        content_storage of the course in stamp, (None, None) if not found.
+    '''
+    @staticmethod
+    def find_with_version(course_id, attach_blocks=False):
+        """Find a course and its version by ID"""
+        global _stale_reads
         if isinstance(course_id, str):
             try:
                 course_id = ObjectId(course_id)
-            except:
-                return None
-        return courses_collection.find_one({'_id': ObjectId(course_id)})
+            except InvalidId:
+                return None, None
+        course_id = ObjectId(course_id)
+        key = str(course_id)
+
+        course = None
+        cached = _courses.get(key)
+        if cached is not None:
+            current = courses_collection.find_one({'_id': course_id}, {'version': 1})
+            if current is None:
+                _course_changed(key)
+                return None, None
+            if current.get('version') == cached[0]:
+                version, storage, course = cached[0], cached[1], bson.decode(cached[2])
+            else:
+                _stale_reads += 1
+
+        if course is None:
+            course = courses_collection.find_one({'_id': course_id}, COURSE_READ_PROJECTION)
+            if course is None:
+                _course_changed(key)
+                return None, None
+            version = course.pop('version', None)
+            storage = course.pop('content_storage', CONTENT_STORAGE_EMBEDDED)
+            _courses.set(key, (version, storage, bson.encode(course)))
+
+        if attach_blocks and storage == CONTENT_STORAGE_BLOCKS:
+            ContentBlock.attach(key, course.get('content', {}).get('sections', []))
+        return course, {
+            'version': version,
+            'updated_at': course.get('updated_at'),
+            'content_storage': storage,
+        }
+
+    '''
+    A static method that reads the version of a course, without the
+    course itself, see app.utils.conditional.
+    Args:
+        course_id (str): ID of the course.
+    Returns:
+        dict: version and updated_at of the course, None if not found.
+    '''
+    @staticmethod
+    def get_version(course_id):
+        """Get the version of a course"""
+        if not ObjectId.is_valid(course_id):
+            return None
+        return courses_collection.find_one(
+            {'_id': ObjectId(course_id)}, {'_id': 0, 'version': 1, 'updated_at': 1}
+        )
+
+    '''
+    A static method that returns the counters of the course cache of
+    this worker. Lookups that found an outdated entry count as misses.
+    Returns:
+        dict: entries, bytes, hits, misses, stale, evictions and hit_ratio.
+    '''
+    @staticmethod
+    def cache_stats():
+        """Get the counters of the course cache"""
+        stats = _courses.stats()
+        hits = stats['hits'] - _stale_reads
+        misses = stats['misses'] + _stale_reads
+        return {
+            **stats,
+            'hits': hits,
+            'misses': misses,
+            'stale': _stale_reads,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        }
 
     '''
     A static method that finds courses by category.
@@ -95,42 +547,122 @@ class Course:
         category (str): Category to filter courses by.
         limit (int): Number of courses to return.
         skip (int): Number of courses to skip.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
     Returns:
         list: List of courses in the specified category.
     '''
     @staticmethod
-    def find_by_category(category, limit=20, skip=0):
+    def find_by_category(category, limit=20, skip=0, view='full'):
         """Find courses by category"""
         limit = int(limit)
         skip = int(skip)
         cursor = courses_collection.find(
-            {'category': category}
+            {'category': category}, _list_projection(view)
         ).skip(skip).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
 
     '''
     A static method that finds popular courses.
     Args:
         limit (int): Number of courses to return.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
     Returns:
         list: List of popular courses.
     '''
     @staticmethod
-    def find_popular_courses(limit=10):
+    def find_popular_courses(limit=10, view='full'):
         limit = int(limit)
         """Find popular courses based on enrollment count"""
         # We will use the enrollment_count field to determine popularity
-        cursor = courses_collection.find().sort(
+        cursor = courses_collection.find({}, _list_projection(view)).sort(
             'enrollment_count', -1).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
+
+    '''
+    A static method that finds courses by their IDs with a single query.
+    Args:
+        course_ids (list): IDs of the courses, invalid IDs are skipped.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
+    Returns:
+        list: The courses found, in the order of course_ids.
+    '''
+    @staticmethod
+    def find_by_ids(course_ids, view='full'):
+        """Find courses by IDs"""
+        object_ids = [ObjectId(course_id) for course_id in course_ids if ObjectId.is_valid(course_id)]
+        if not object_ids:
+            return []
+        cursor = courses_collection.find({'_id': {'$in': object_ids}}, _list_projection(view))
+        courses = {course['_id']: course for course in cursor}
+        return [courses[course_id] for course_id in object_ids if course_id in courses]
+
+    '''
+    A static method that finds the courses most similar to a course by
+    their text, from the content similarity index. A course the index
+    does not know yet, e.g. created by another worker, is added to it.
+    Args:
+        course_id (str): ID of the course.
+        limit (int): Number of courses to return.
+    Returns:
+        list: The most similar courses, most similar first, empty if the
+        course does not exist.
+    '''
+    @staticmethod
+    def find_similar(course_id, limit=3):
+        """Find the courses most similar to a course"""
+        index = _get_text_index()
+        course_id = str(course_id)
+        neighbors = index.neighbors(course_id, int(limit))
+        if neighbors is None:
+            course = Course.find_by_id(course_id)
+            if course is None:
+                return []
+            index.upsert(course_id, _course_terms(course))
+            neighbors = index.neighbors(course_id, int(limit))
+        return Course.find_by_ids([neighbor_id for neighbor_id, _ in neighbors])
+
+    '''
+    A static method that ranks the courses covering weighted tags, with a
+    single aggregation. The score of a course is the sum of the weights
+    of the tags it has, ties go to the more popular course, then to the
+    older one.
+    Args:
+        tag_weights (dict): The weight of each tag, by tag.
+        limit (int): Number of courses to return.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
+    Returns:
+        list: The best scored courses, best first.
+    '''
+    @staticmethod
+    def find_by_weighted_tags(tag_weights, limit=10, view='full'):
+        """Rank courses by the weights of their tags"""
+        limit = int(limit)
+        projection = _list_projection(view)
+        tags = list(tag_weights)
+        if not tags or limit <= 0:
+            return []
+        weighted_tags = [{'tag': tag, 'weight': tag_weights[tag]} for tag in tags]
+        pipeline = [
+            # Served by the multikey index on content.tags
+            {'$match': {'content.tags': {'$in': tags}}},
+            {'$addFields': {'tag_score': {'$sum': {'$map': {
+                'input': {'$literal': weighted_tags},
+                'as': 'weighted',
+                'in': {'$cond': [
+                    {'$in': ['$$weighted.tag', {'$ifNull': ['$content.tags', []]}]},
+                    '$$weighted.weight',
+                    0
+                ]},
+            }}}}},
+            {'$sort': {'tag_score': -1, 'enrollment_count': -1, '_id': 1}},
+            {'$limit': limit},
+            {'$project': projection if view == 'summary' else {**projection, 'tag_score': 0}},
+        ]
+        return list(courses_collection.aggregate(pipeline))
 
     '''
     A static method that finds courses by tags.
@@ -138,22 +670,20 @@ class Course:
         tags (list): List of tags to filter courses by.
         limit (int): Number of courses to return.
         skip (int): Number of courses to skip.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
     Returns:
         list: List of courses with the specified tags.
     '''
     @staticmethod
-    def find_by_tags(tags, limit=10, skip=0):
+    def find_by_tags(tags, limit=10, skip=0, view='full'):
         """Find courses by tags"""
         limit = int(limit)
         skip = int(skip)
         cursor = courses_collection.find(
-            {'content.tags': {'$in': tags}}
+            {'content.tags': {'$in': tags}}, _list_projection(view)
         ).skip(skip).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
 
     '''
     A static method that finds courses by difficulty level.
@@ -161,22 +691,20 @@ class Course:
         difficulty (str): Difficulty level to filter courses by.
         limit (int): Number of courses to return.
         skip (int): Number of courses to skip.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
     Returns:
         list: List of courses with the specified difficulty level.
     '''
     @staticmethod
-    def find_by_difficulty(difficulty, limit=10, skip=0):
+    def find_by_difficulty(difficulty, limit=10, skip=0, view='full'):
         """Find courses by difficulty level"""
         limit = int(limit)
         skip = int(skip)
         cursor = courses_collection.find(
-            {'difficulty': difficulty}
+            {'difficulty': difficulty}, _list_projection(view)
         ).skip(skip).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
 
     '''
     A static method that retrieves a user by their ID.
@@ -190,17 +718,13 @@ class Course:
     @staticmethod
     def get_user_by_id(user_id, limit=10, skip=0):
         """Finds courses by user's id"""
-        limit = int(limit)
-        skip = int(skip)
+        course_ids = Enrollment.find_course_ids_by_user(user_id, limit=limit, skip=skip)
         cursor = courses_collection.find(
-            {'enrolled_users': {'$in': user_id}}
-        ).skip(skip).limit(limit)
+            {'_id': {'$in': [ObjectId(course_id) for course_id in course_ids]}},
+            COURSE_FULL_PROJECTION
+        )
 
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
 
     '''
     A static method that updates a course by its ID.
@@ -216,15 +740,19 @@ class Course:
         if isinstance(course_id, str):
             try:
                 course_id = ObjectId(course_id)
-            except:
+            except InvalidId:
                 return None
         update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
         courses_collection.update_one(
             {'_id': ObjectId(course_id)},
-            {'$set': update_data}
+            {'$set': update_data, '$inc': {'version': 1}}
         )
-        updated_course = courses_collection.find_one({'_id': ObjectId(course_id)})
-        return {**updated_course, '_id': str(updated_course['_id'])}
+        _course_changed(course_id)
+        updated_course = courses_collection.find_one(
+            {'_id': ObjectId(course_id)}, COURSE_FULL_PROJECTION
+        )
+        _course_text_changed(course_id, updated_course)
+        return updated_course
     
     '''
     A static method that deletes a course whose ID is given
@@ -239,7 +767,7 @@ class Course:
         if isinstance(course_id, str):
             try:
                 course_id = ObjectId(course_id)
-            except:
+            except InvalidId:
                 return None
 
         # Ensure the course exists
@@ -247,6 +775,9 @@ class Course:
             return None
         
         deleted_course = courses_collection.delete_one({'_id': course_id})
+        _course_changed(course_id)
+        _course_text_changed(course_id)
+        ContentBlock.delete_many(course_id)
 
         return deleted_course.deleted_count > 0
 
@@ -265,36 +796,24 @@ class Course:
         """Add a new section to a course"""
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
-            
-        # Get the current highest order if not specified
-        if order is None:
-            course = courses_collection.find_one(
-                {'_id': ObjectId(course_id)}
-            )
-            if course and 'content' in course and\
-            'sections' in course['content']:
-                sections = course['content']['sections']
-                order = max([s.get('order', 0) for s in sections] + [0]) + 1
-            else:
-                order = 1
-        
+
         section_id = str(ObjectId())
-        
-        # Add the new section
-        courses_collection.update_one(
-            {'_id': ObjectId(course_id)},
-            {
-                '$push': {
-                    'content.sections': {
-                        'section_id': section_id,
-                        'title': title,
-                        'order': order,
-                        'sub_sections': []
-                    }
-                },
-                '$set': {'updated_at': datetime.now(
-                    timezone.utc).isoformat()}
+
+        def change(course):
+            sections = course.get('content', {}).get('sections', [])
+            section = {
+                'section_id': section_id,
+                'title': title,
+                # After the current highest order if not specified
+                'order': order if order is not None else max(
+                    [s.get('order', 0) for s in sections] + [0]
+                ) + 1,
+                'sub_sections': []
             }
+            return Course._push_node(course, section, [len(sections)])
+
+        Course._change_content(
+            course_id, {'content.sections.order': 1, 'content_index.sections': 1}, change
         )
         return section_id
     
@@ -321,21 +840,30 @@ class Course:
                     '_id': ObjectId(course_id),
                     'content.sections.section_id': section_id
                 },
-                {'$set': {
-                    'content.sections.$.title': update_data.get('title'),
-                    'content.sections.$.order': update_data.get('order'),
-                    'updated_at': datetime.now(timezone.utc).isoformat()
-                }}
+                {
+                    '$set': {
+                        'content.sections.$.title': update_data.get('title'),
+                        'content.sections.$.order': update_data.get('order'),
+                        'updated_at': datetime.now(timezone.utc).isoformat()
+                    },
+                    '$inc': {'version': 1}
+                }
             )
         if 'title' in update_data and 'order' not in update_data:          
             courses_collection.update_one(
                 {'_id': ObjectId(course_id), 'content.sections.section_id': section_id},
-                {'$set': {
-                    'content.sections.$.title': update_data.get('title'),
-                    'updated_at': datetime.now(timezone.utc).isoformat()
-                }}
+                {
+                    '$set': {
+                        'content.sections.$.title': update_data.get('title'),
+                        'updated_at': datetime.now(timezone.utc).isoformat()
+                    },
+                    '$inc': {'version': 1}
+                }
             )
-        return courses_collection.find_one({'_id': ObjectId(course_id)})
+        _course_changed(course_id)
+        return courses_collection.find_one(
+            {'_id': ObjectId(course_id)}, COURSE_FULL_PROJECTION
+        )
     
     '''
     A static method that deletes a section by its ID.
@@ -350,18 +878,12 @@ class Course:
         """Delete a section"""
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
-            
-        courses_collection.update_one(
-            {'_id': ObjectId(course_id)},
-            {
-                '$pull': {
-                    'content.sections': {'section_id': section_id}
-                }, # $pull removes the section from the array
-                '$set': {'updated_at': datetime.now(
-                    timezone.utc).isoformat()}
-            }
+
+        if Course._remove_node(course_id, (section_id,)) is not None:
+            ContentBlock.delete_many(course_id, section_id)
+        return courses_collection.find_one(
+            {'_id': ObjectId(course_id)}, COURSE_FULL_PROJECTION
         )
-        return courses_collection.find_one({'_id': ObjectId(course_id)})
     
     '''
     A static method that adds a new subsection to a section.
@@ -378,50 +900,35 @@ class Course:
         """Add a new subsection to a section"""
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
-            
-        # Get the current highest order if not specified
-        if order is None:
-            course = courses_collection.find_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id
-                }
-            )
-            if course:
-                for section in course.get('content', {}).get(
-                'sections', []
-                ):
-                    if section.get('section_id') == section_id:
-                        sub_sections = section.get(
-                            'sub_sections', []
-                        )
-                        order = max(
-                            [s.get('order', 0) for s in sub_sections] + [0]
-                        ) + 1
-                        break
-            else:
-                order = 1
-        
+
         subsection_id = str(ObjectId())
-        
-        # Add the new subsection
-        courses_collection.update_one(
+
+        def change(course):
+            sections = course.get('content', {}).get('sections', [])
+            for i, section in enumerate(sections):
+                if section.get('section_id') != section_id:
+                    continue
+                sub_sections = section.get('sub_sections', [])
+                subsection = {
+                    'subsection_id': subsection_id,
+                    'title': title,
+                    # After the current highest order if not specified
+                    'order': order if order is not None else max(
+                        [s.get('order', 0) for s in sub_sections] + [0]
+                    ) + 1,
+                    'data': []
+                }
+                return Course._push_node(course, subsection, [i, len(sub_sections)])
+            return None
+
+        Course._change_content(
+            course_id,
             {
-                '_id': ObjectId(course_id),
-                'content.sections.section_id': section_id
+                'content.sections.section_id': 1,
+                'content.sections.sub_sections.order': 1,
+                'content_index.sections': 1
             },
-            {
-                '$push': {
-                    'content.sections.$.sub_sections': {
-                        'subsection_id': subsection_id,
-                        'title': title,
-                        'order': order,
-                        'data': []
-                    }
-                }, # $push adds the subsection to the array
-                '$set': {'updated_at': datetime.now(
-                    timezone.utc).isoformat()}
-            }
+            change
         )
         return subsection_id
     
@@ -443,51 +950,24 @@ class Course:
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
 
-        if 'order' in update_data:
-            courses_collection.update_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id,
-                    'content.sections.sub_sections.subsection_id': subsection_id
-                },
-                {
-                    '$set': {
-                        'content.sections.$[section].sub_sections.$[subsection].title': update_data.get('title'),
-                        'content.sections.$[section].sub_sections.$[subsection].order': update_data.get('order'),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                array_filters=[
-                    {'section.section_id': section_id},
-                    {'subsection.subsection_id': subsection_id}
-                ]
-            )
-        else:
-            courses_collection.update_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id,
-                    'content.sections.sub_sections.subsection_id': subsection_id
-                },
-                {
-                    '$set': {
-                        'content.sections.$[section].sub_sections.$[subsection].title': update_data.get('title'),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                array_filters=[
-                    {'section.section_id': section_id},
-                    {'subsection.subsection_id': subsection_id}
-                ]
-            )
-        '''array_filters allows us to filter the array elements that we want to update.
-        Both $[section] and $[subsection] are placeholders that reference the two objects,
-        specified in the array_filters (i.e {'section.section_id': section_id} and 
-        {'subsection.subsection_id': subsection_id}).
-        This allows us to update the specific subsection in the array without having to pull
-        it out and push it back in.
-        This is a MongoDB feature that allows us to update array elements in place.'''
-        return courses_collection.find_one({'_id': ObjectId(course_id)})
+        fields = ['title', 'order'] if 'order' in update_data else ['title']
+        # The subsection is addressed by its position in the content
+        # index, e.g. content.sections.2.sub_sections.0
+        position, _ = Course._find_position(course_id, (section_id, subsection_id))
+        Course._update_node(
+            course_id,
+            (section_id, subsection_id),
+            position,
+            lambda path: {
+                '$set': {
+                    **{f'{path}.{field}': update_data.get(field) for field in fields},
+                    'updated_at': datetime.now(timezone.utc).isoformat()
+                }
+            }
+        )
+        return courses_collection.find_one(
+            {'_id': ObjectId(course_id)}, COURSE_FULL_PROJECTION
+        )
     
     '''
     A static method that deletes a subsection by its ID.
@@ -503,17 +983,12 @@ class Course:
         """Delete a subsection"""
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
-            
-        courses_collection.update_one(
-            {'_id': ObjectId(course_id), 'content.sections.section_id': section_id},
-            {
-                '$pull': {
-                    'content.sections.$.sub_sections': {'subsection_id': subsection_id}
-                },
-                '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
-            }
+
+        if Course._remove_node(course_id, (section_id, subsection_id)) is not None:
+            ContentBlock.delete_many(course_id, section_id, subsection_id)
+        return courses_collection.find_one(
+            {'_id': ObjectId(course_id)}, COURSE_FULL_PROJECTION
         )
-        return courses_collection.find_one({'_id': ObjectId(course_id)})
     
     '''
     A static method that adds a data object to a subsection.
@@ -530,58 +1005,52 @@ class Course:
         """Add a data object to a subsection"""
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
-            
-        # Find the section and subsection
-        course = courses_collection.find_one({
-            '_id': ObjectId(course_id),
-            'content.sections.section_id': section_id
-        })
-        
-        if not course:
-            return False
-        
-        # Find the highest order in the data array
-        order = 1
-        for section in course.get('content', {}).get('sections', []):
-            if section.get('section_id') == section_id:
-                for subsection in section.get('sub_sections', []):
-                    if subsection.get('subsection_id') == subsection_id:
-                        data = subsection.get('data', [])
-                        if data:
-                            order = max([d.get('order', 0) for d in data]) + 1
-                        break
-                break
-        
-        # Set the order if not already specified
-        if 'order' not in data_object:
-            data_object['order'] = order
-        
+
         # Add a unique ID to the data object
         data_object['data_id'] = str(ObjectId())
-        
-        # Add the data object
-        result = courses_collection.update_one(
-            {
-                '_id': ObjectId(course_id),
-                'content.sections.section_id': section_id,
-                'content.sections.sub_sections.subsection_id': subsection_id
-            },
+
+        position, storage = Course._find_position(course_id, (section_id, subsection_id))
+        if storage == CONTENT_STORAGE_BLOCKS:
+            if position is None:
+                return False
+            ContentBlock.add(course_id, section_id, subsection_id, data_object)
+            Course.touch(course_id)
+            return True
+
+        def change(course):
+            sections = course.get('content', {}).get('sections', [])
+            for i, section in enumerate(sections):
+                if section.get('section_id') != section_id:
+                    continue
+                for j, subsection in enumerate(section.get('sub_sections', [])):
+                    if subsection.get('subsection_id') != subsection_id:
+                        continue
+                    data = subsection.get('data', [])
+                    # After the highest order in the data array if not specified
+                    if 'order' not in data_object:
+                        data_object['order'] = max(
+                            [d.get('order', 0) for d in data] + [0]
+                        ) + 1
+                    return Course._push_node(course, data_object, [i, j, len(data)])
+                return None
+            return None
+
+        result = Course._change_content(
+            course_id,
             {
-                '$push': {
-                    'content.sections.$[section].sub_sections.$[subsection].data': data_object
-                },
-                '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
+                'content.sections.section_id': 1,
+                'content.sections.sub_sections.subsection_id': 1,
+                'content.sections.sub_sections.data.order': 1,
+                'content_index.sections': 1
             },
-            array_filters=[
-                {'section.section_id': section_id},
-                {'subsection.subsection_id': subsection_id}
-            ]
+            change
         )
-        
-        return result.modified_count > 0
+        return result is not None and result.modified_count > 0
     
     '''
     A static method that updates a data object in a subsection.
+    content, order and type are always written, along with alt_text,
+    caption and url if all three are given, or else language if given.
     Args:
         course_id (str): ID of the course to update the data object in.
         section_id (str): ID of the section to update the data object in.
@@ -596,158 +1065,39 @@ class Course:
         """Update a data object"""
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
-            
-        # Update the data object
-        if 'order' in update_data and\
-            'alt_text' in update_data and\
-            'caption' in update_data and\
-            'url' in update_data:
-            result = courses_collection.update_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id,
-                    'content.sections.sub_sections.subsection_id': subsection_id,
-                    'content.sections.sub_sections.data.data_id': data_id
-                },
-                {
-                    '$set': {
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].content': update_data.get('content'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].order': update_data.get('order'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].type': update_data.get('type'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].alt_text': update_data.get('alt_text'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].caption': update_data.get('caption'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].url': update_data.get('url'),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                array_filters=[
-                    {'section.section_id': section_id},
-                    {'subsection.subsection_id': subsection_id},
-                    {'data.data_id': data_id}
-                ]
-            )
-        elif 'order' in update_data and\
-            'language' in update_data:
-            result = courses_collection.update_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id,
-                    'content.sections.sub_sections.subsection_id': subsection_id,
-                    'content.sections.sub_sections.data.data_id': data_id
-                },
-                {
-                    '$set': {
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].content': update_data.get('content'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].order': update_data.get('order'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].type': update_data.get('type'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].language': update_data.get('language'),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                array_filters=[
-                    {'section.section_id': section_id},
-                    {'subsection.subsection_id': subsection_id},
-                    {'data.data_id': data_id}
-                ]
-            )
-        elif 'order' in update_data:
-            result = courses_collection.update_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id,
-                    'content.sections.sub_sections.subsection_id': subsection_id,
-                    'content.sections.sub_sections.data.data_id': data_id
-                },
-                {
-                    '$set': {
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].content': update_data.get('content'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].order': update_data.get('order'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].type': update_data.get('type'),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                array_filters=[
-                    {'section.section_id': section_id},
-                    {'subsection.subsection_id': subsection_id},
-                    {'data.data_id': data_id}
-                ]
-            )
-        elif 'order' not in update_data and\
-            'alt_text' in update_data and\
-            'caption' in update_data and\
-            'url' in update_data:
-            result = courses_collection.update_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id,
-                    'content.sections.sub_sections.subsection_id': subsection_id,
-                    'content.sections.sub_sections.data.data_id': data_id
-                },
-                {
-                    '$set': {
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].content': update_data.get('content'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].order': update_data.get('order'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].type': update_data.get('type'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].alt_text': update_data.get('alt_text'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].caption': update_data.get('caption'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].url': update_data.get('url'),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                array_filters=[
-                    {'section.section_id': section_id},
-                    {'subsection.subsection_id': subsection_id},
-                    {'data.data_id': data_id}
-                ]
-            )
-        elif 'order' not in update_data and\
-            'language' in update_data:
-            result = courses_collection.update_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id,
-                    'content.sections.sub_sections.subsection_id': subsection_id,
-                    'content.sections.sub_sections.data.data_id': data_id
-                },
-                {
-                    '$set': {
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].content': update_data.get('content'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].order': update_data.get('order'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].type': update_data.get('type'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].language': update_data.get('language'),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                array_filters=[
-                    {'section.section_id': section_id},
-                    {'subsection.subsection_id': subsection_id},
-                    {'data.data_id': data_id}
-                ]
-            )
-        elif 'order' not in update_data:
-            result = courses_collection.update_one(
-                {
-                    '_id': ObjectId(course_id),
-                    'content.sections.section_id': section_id,
-                    'content.sections.sub_sections.subsection_id': subsection_id,
-                    'content.sections.sub_sections.data.data_id': data_id
-                },
-                {
-                    '$set': {
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].content': update_data.get('content'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].order': update_data.get('order'),
-                        'content.sections.$[section].sub_sections.$[subsection].data.$[data].type': update_data.get('type'),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    }
-                },
-                array_filters=[
-                    {'section.section_id': section_id},
-                    {'subsection.subsection_id': subsection_id},
-                    {'data.data_id': data_id}
-                ]
-            )
-        
-        return result.modified_count > 0
+
+        fields = ['content', 'order', 'type']
+        if all(field in update_data for field in ('alt_text', 'caption', 'url')):
+            fields += ['alt_text', 'caption', 'url']
+        elif 'language' in update_data:
+            fields.append('language')
+
+        node_ids = (section_id, subsection_id, data_id)
+        position, storage = Course._find_position(course_id, node_ids)
+        if storage == CONTENT_STORAGE_BLOCKS:
+            # position is the one of the subsection, the data is in a block
+            if position is None or not ContentBlock.update(
+                course_id, section_id, subsection_id, data_id,
+                {field: update_data.get(field) for field in fields}
+            ):
+                return False
+            Course.touch(course_id)
+            return True
+
+        # The data object is addressed by its position in the content
+        # index, e.g. content.sections.2.sub_sections.0.data.5
+        result = Course._update_node(
+            course_id,
+            node_ids,
+            position,
+            lambda path: {
+                '$set': {
+                    **{f'{path}.{field}': update_data.get(field) for field in fields},
+                    'updated_at': datetime.now(timezone.utc).isoformat()
+                }
+            }
+        )
+        return result is not None and result.modified_count > 0
     
     '''
     A static method that deletes a data object from a subsection.
@@ -764,30 +1114,222 @@ class Course:
         """Delete a data object"""
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
-            
-        # Delete the data object
-        result = courses_collection.update_one(
-            {
-                '_id': ObjectId(course_id),
-                'content.sections.section_id': section_id,
-                'content.sections.sub_sections.subsection_id': subsection_id
-            },
-            {
-                '$pull': {
-                    'content.sections.$[section].sub_sections.$[subsection].data': {'data_id': data_id}
+
+        if Course.get_content_storage(course_id) == CONTENT_STORAGE_BLOCKS:
+            if not ContentBlock.delete(course_id, section_id, subsection_id, data_id):
+                return False
+            Course.touch(course_id)
+            return True
+
+        result = Course._remove_node(course_id, (section_id, subsection_id, data_id))
+        return result is not None and result.modified_count > 0
+
+    '''
+    A static method that rebuilds the content index of a course from its
+    content tree, see app.utils.content_index. Courses get their index
+    when they are created, this covers the ones created before, and
+    indexes dropped by writes that did not maintain them. The index is
+    only stored if the tree did not move in the meantime.
+    Args:
+        course_id (str): ID of the course.
+    Returns:
+        tuple: (sections, content_index) of the course, or None if the
+        course does not exist.
+    '''
+    @staticmethod
+    def rebuild_content_index(course_id):
+        """Rebuild the content index of a course"""
+        course = courses_collection.find_one(
+            {'_id': ObjectId(course_id)}, {'content.sections': 1, 'content_version': 1}
+        )
+        if course is None:
+            return None
+        sections = course.get('content', {}).get('sections', [])
+        content_index = build_content_index(sections)
+        version = course.get('content_version')
+        courses_collection.update_one(
+            {'_id': course['_id'], 'content_version': version},
+            {'$set': {'content_index': content_index, 'content_version': version or 0}}
+        )
+        return sections, content_index
+
+    '''
+    A static method that builds the content index of every course that
+    has none, e.g. after an upgrade.
+    Args:
+        on_course (callable, optional): Called with the ID of each course
+        after its index was built.
+    Returns:
+        int: The number of courses indexed.
+    '''
+    @staticmethod
+    def build_missing_content_indexes(on_course=None):
+        """Build the content index of the courses that have none"""
+        cursor = courses_collection.find(
+            {'content_index': {'$exists': False}}, {'_id': 1}
+        ).batch_size(100)
+        indexed = 0
+        for course in cursor:
+            if Course.rebuild_content_index(course['_id']) is not None:
+                indexed += 1
+                if on_course is not None:
+                    on_course(str(course['_id']))
+        return indexed
+
+    '''
+    Returns the change that appends a node to the content tree at the
+    given position, the end of its array, and adds it to the content
+    index if the course has one. See _change_content.
+    '''
+    @staticmethod
+    def _push_node(course, node, position):
+        key, id_field, _ = CONTENT_LEVELS[len(position) - 1]
+        update = {'$push': {array_path(position): node}}
+        if 'content_index' in course:
+            update['$set'] = {f'content_index.{key}.{node[id_field]}': position}
+        return {}, update
+
+    '''
+    Removes a node and its descendants from the content tree of a course,
+    and from its content index.
+    '''
+    @staticmethod
+    def _remove_node(course_id, node_ids):
+        id_field = CONTENT_LEVELS[len(node_ids) - 1][1]
+
+        def change(course):
+            content_index = course['content_index']
+            position = locate(content_index, node_ids)
+            if position is None:
+                return None
+            return position_guard(position, node_ids), {
+                '$pull': {array_path(position): {id_field: node_ids[-1]}},
+                '$set': {'content_index': remove_from_index(content_index, position)}
+            }
+
+        return Course._change_content(
+            course_id, {'content_index': 1}, change, needs_index=True
+        )
+
+    '''
+    Applies a change that moves nodes of the content tree of a course,
+    e.g. adds or removes one. The change is computed from the course read
+    with the given projection, and written with a single update that
+    increments content_version and is guarded by the content_version that
+    was read, so the positions it writes to are still those of the tree.
+    Args:
+        course_id (ObjectId): ID of the course.
+        projection (dict): Fields of the course the change needs.
+        change (callable): Returns (conditions, update) for the course
+        read, or None if the nodes it changes do not exist.
+        needs_index (bool): Whether the change needs the content index,
+        which is rebuilt first if the course has none.
+    Returns:
+        UpdateResult: The result of the update, or None if the course or
+        the nodes do not exist, or the tree kept moving.
+    '''
+    @staticmethod
+    def _change_content(course_id, projection, change, needs_index=False):
+        stale = False
+        for _ in range(CONTENT_WRITE_ATTEMPTS):
+            if needs_index and stale:
+                Course.rebuild_content_index(course_id)
+            course = courses_collection.find_one(
+                {'_id': course_id}, {**projection, 'content_version': 1}
+            )
+            if course is None:
+                return None
+            if needs_index and 'content_index' not in course:
+                stale = True
+                continue
+            changed = change(course)
+            if changed is None:
+                return None
+            conditions, update = changed
+            update.setdefault('$set', {})['updated_at'] = datetime.now(timezone.utc).isoformat()
+            update['$inc'] = {'content_version': 1, 'version': 1}
+            result = courses_collection.update_one(
+                {
+                    '_id': course_id,
+                    'content_version': course.get('content_version'),
+                    **conditions
                 },
-                '$set': {'updated_at': datetime.now(timezone.utc).isoformat()}
-            },
-            array_filters=[
-                {'section.section_id': section_id},
-                {'subsection.subsection_id': subsection_id}
-            ]
+                update
+            )
+            if result.matched_count:
+                _course_changed(course_id)
+                return result
+            # Either the tree moved, or the index does not match it
+            stale = True
+        return None
+
+    '''
+    Updates a node of the content tree of a course in place, through the
+    dotted path of its position in the content index. The update only
+    applies if the node and its ancestors are still at that position,
+    otherwise the index is rebuilt and the update retried.
+    Args:
+        course_id (ObjectId): ID of the course.
+        node_ids (tuple): IDs of the node and its ancestors, from the
+        section down.
+        position (list): Position of the node, see _find_position.
+        update (callable): Returns the update, given the path of the node.
+    Returns:
+        UpdateResult: The result of the update, or None if the node does
+        not exist.
+    '''
+    @staticmethod
+    def _update_node(course_id, node_ids, position, update):
+        for _ in range(CONTENT_WRITE_ATTEMPTS):
+            if position is None:
+                return None
+            result = courses_collection.update_one(
+                {'_id': course_id, **position_guard(position, node_ids)},
+                {**update(node_path(position)), '$inc': {'version': 1}}
+            )
+            if result.matched_count:
+                _course_changed(course_id)
+                return result
+            rebuilt = Course.rebuild_content_index(course_id)
+            position = locate(rebuilt[1], node_ids) if rebuilt else None
+        return None
+
+    '''
+    Returns the position of a node of the content tree of a course, read
+    from its content index, which is built first if the course has none,
+    along with the content storage of the course. Only the entries of the
+    node and its ancestors are read. Data objects of a course that stores
+    blocks are not in its tree, the position of their subsection is
+    returned instead.
+    '''
+    @staticmethod
+    def _find_position(course_id, node_ids):
+        if not all(is_indexable(node_id) for node_id in node_ids):
+            return None, None
+        course = courses_collection.find_one(
+            {'_id': course_id},
+            {
+                'content_storage': 1,
+                **{
+                    f'content_index.{CONTENT_LEVELS[depth][0]}.{node_id}': 1
+                    for depth, node_id in enumerate(node_ids)
+                }
+            }
         )
-        
-        return result.modified_count > 0
+        if course is None:
+            return None, None
+        storage = course.get('content_storage', CONTENT_STORAGE_EMBEDDED)
+        if storage == CONTENT_STORAGE_BLOCKS:
+            node_ids = node_ids[:2]
+        if 'content_index' not in course:
+            rebuilt = Course.rebuild_content_index(course_id)
+            return (locate(rebuilt[1], node_ids) if rebuilt else None), storage
+        return locate(course['content_index'], node_ids), storage
     
     '''
     A static method that retrieves a specific section by its ID.
+    The content data of a course that stores blocks is attached to its
+    subsections.
     Args:
         course_id (str): ID of the course to retrieve the section from.
         section_id (str): ID of the section to retrieve.
@@ -802,16 +1344,21 @@ class Course:
             
         course = courses_collection.find_one(
             {'_id': ObjectId(course_id), 'content.sections.section_id': section_id},
-            {'content.sections.$': 1}
+            {'content.sections.$': 1, 'content_storage': 1}
         )
         
         if course and 'content' in course and 'sections' in course['content'] and len(course['content']['sections']) > 0:
-            return course['content']['sections'][0]
+            section = course['content']['sections'][0]
+            if course.get('content_storage') == CONTENT_STORAGE_BLOCKS:
+                ContentBlock.attach(course_id, [section])
+            return section
         
         return None
     
     '''
     A static method that retrieves a specific subsection by its ID.
+    The content data of a course that stores blocks is loaded for this
+    subsection only.
     Args:
         course_id (str): ID of the course to retrieve the subsection from.
         section_id (str): ID of the section to retrieve the subsection from.
@@ -825,108 +1372,309 @@ class Course:
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
             
-        # This requires MongoDB 3.6+ for the aggregation pipeline
+        if not (is_indexable(section_id) and is_indexable(subsection_id)):
+            return None
+
+        # Picks the subsection at its position in the content index,
+        # instead of unwinding every section and subsection
+        position = f'$content_index.sub_sections.{subsection_id}'
         pipeline = [
             {'$match': {'_id': ObjectId(course_id)}},
-            {'$unwind': '$content.sections'},
-            {'$match': {'content.sections.section_id': section_id}},
-            {'$unwind': '$content.sections.sub_sections'},
-            {'$match': {'content.sections.sub_sections.subsection_id': subsection_id}},
-            {'$project': {'subsection': '$content.sections.sub_sections'}}
+            {'$project': {
+                'storage': '$content_storage',
+                'indexed': {'$ne': [{'$ifNull': ['$content_index', None]}, None]},
+                'position': position,
+                'section': {
+                    '$arrayElemAt': ['$content.sections', {'$arrayElemAt': [position, 0]}]
+                },
+            }},
+            {'$project': {
+                'storage': 1,
+                'indexed': 1,
+                'section_id': '$section.section_id',
+                'subsection': {
+                    '$arrayElemAt': ['$section.sub_sections', {'$arrayElemAt': ['$position', 1]}]
+                },
+            }},
         ]
-        
-        result = list(courses_collection.aggregate(pipeline))
-        
-        if result and len(result) > 0:
-            return result[0]['subsection']
-        
-        return None
+        result = next(courses_collection.aggregate(pipeline), None)
+        if result is None:
+            return None
+
+        subsection = result.get('subsection')
+        if not result['indexed'] or (
+            subsection is not None and subsection.get('subsection_id') != subsection_id
+        ):
+            # No index yet, or one that does not match the tree
+            rebuilt = Course.rebuild_content_index(course_id)
+            if rebuilt is None:
+                return None
+            sections, content_index = rebuilt
+            position = locate(content_index, (section_id, subsection_id))
+            subsection = None
+            if position is not None:
+                subsection = sections[position[0]]['sub_sections'][position[1]]
+        elif result.get('section_id') != section_id:
+            subsection = None
+
+        if subsection is not None and result.get('storage') == CONTENT_STORAGE_BLOCKS:
+            subsection['data'] = ContentBlock.find_by_subsection(
+                course_id, section_id, subsection_id
+            )
+        return subsection
     
     '''
-    A static method that enrolls a user in a course.
+    A static method that returns the content sections of a course along
+    with its updated_at, which guards later writes (see set_content_array),
+    and its content storage.
     Args:
-        course_id (str): ID of the course to enroll the user in.
-        user_id (str): ID of the user to enroll.
+        course_id (str): ID of the course.
     Returns:
-        bool: True if the user was enrolled successfully, False otherwise.
+        tuple: (sections, updated_at, content_storage), or None if the
+        course does not exist.
     '''
     @staticmethod
-    def enroll_user(course_id, user_id):
-        """Enroll a user in a course"""
-        if isinstance(course_id, str):
-            course_id = ObjectId(course_id)
-        
-        # Increment the enrollment count
-        courses_collection.update_one(
+    def get_sections_with_version(course_id):
+        """Get the sections of a course and when it was last updated"""
+        if not ObjectId.is_valid(course_id):
+            return None
+        course = courses_collection.find_one(
             {'_id': ObjectId(course_id)},
-            {'$inc': {'enrollment_count': 1}}
+            {'content.sections': 1, 'updated_at': 1, 'content_storage': 1}
         )
-        
-        # Add the user to the course's enrolled users
-        courses_collection.update_one(
-            {'_id': ObjectId(course_id)},
-            {'$addToSet': {'enrolled_users': str(user_id)}},
+        if course is None:
+            return None
+        return (
+            course.get('content', {}).get('sections', []),
+            course.get('updated_at'),
+            course.get('content_storage', CONTENT_STORAGE_EMBEDDED),
         )
 
-        # Check if the user was enrolled successfully
-        course = courses_collection.find_one({'_id': ObjectId(course_id)})
+    '''
+    A static method that returns where the content data of a course is
+    stored, see ContentBlock.
+    Args:
+        course_id (str): ID of the course.
+    Returns:
+        str: 'embedded' or 'blocks', or None if the course does not exist.
+    '''
+    @staticmethod
+    def get_content_storage(course_id):
+        """Get the content storage of a course"""
+        if not ObjectId.is_valid(course_id):
+            return None
+        course = courses_collection.find_one(
+            {'_id': ObjectId(course_id)}, {'content_storage': 1}
+        )
+        if course is None:
+            return None
+        return course.get('content_storage', CONTENT_STORAGE_EMBEDDED)
 
-        if course is not None and 'enrolled_users' not in course:
-            return False
-        
-        if str(user_id) not in course['enrolled_users']:
-            return False
+    '''
+    A static method that marks a course as updated, for writes to its
+    content blocks, optionally only if it was not updated since it was
+    read.
+    Args:
+        course_id (str): ID of the course.
+        expected_updated_at (str, optional): updated_at of the course when
+        it was read.
+    Returns:
+        str: The new updated_at of the course, or None if the course does
+        not exist or was updated in the meantime.
+    '''
+    @staticmethod
+    def touch(course_id, expected_updated_at=None):
+        """Mark a course as updated"""
+        query = {'_id': ObjectId(course_id)}
+        if expected_updated_at is not None:
+            query['updated_at'] = expected_updated_at
+        updated_at = datetime.now(timezone.utc).isoformat()
+        result = courses_collection.update_one(
+            query, {'$set': {'updated_at': updated_at}, '$inc': {'version': 1}}
+        )
+        if result.matched_count == 0:
+            return None
+        _course_changed(course_id)
+        return updated_at
 
-        updated_user = User.update_course_progress(
-            user_id=user_id,
-            progress_data={
-                'course_id': str(course_id),
-                'percentage': 0
+    '''
+    A static method that replaces an array of the content tree, e.g.
+    content.sections or content.sections.2.sub_sections, but only if the
+    course was not updated since it was read. Array positions in the path
+    are only valid for the version of the course that was read, so the
+    updated_at precondition also guarantees they still point at the
+    right nodes.
+    Args:
+        course_id (str): ID of the course.
+        path (str): Dotted path of the array to replace.
+        nodes (list): The new content of the array.
+        expected_updated_at (str): updated_at of the course when it was read.
+        content_index (dict): The content index of the whole tree once
+        the array is replaced, see app.utils.content_index.
+    Returns:
+        str: The new updated_at of the course, or None if the course was
+        updated in the meantime.
+    '''
+    @staticmethod
+    def set_content_array(course_id, path, nodes, expected_updated_at, content_index):
+        """Replace an array of the content tree of a course"""
+        updated_at = datetime.now(timezone.utc).isoformat()
+        result = courses_collection.update_one(
+            {'_id': ObjectId(course_id), 'updated_at': expected_updated_at},
+            {
+                '$set': {path: nodes, 'content_index': content_index, 'updated_at': updated_at},
+                '$inc': {'content_version': 1, 'version': 1}
             }
         )
+        if result.matched_count == 0:
+            return None
+        _course_changed(course_id)
+        return updated_at
 
-        if updated_user is None:
-            return False
-        
-        return True
+    '''
+    A static method that appends content built by ContentTreeBuilder to a
+    course, with a single bulk write. New sections are pushed at once,
+    subsections and content data are pushed into their existing parents.
+    The batch drops the content index of the course, which is rebuilt
+    on its next access. A course that stores blocks gets the outline of
+    the nodes, and their content data is inserted as blocks first.
+    Args:
+        course_id (str): ID of the course.
+        tree (dict): The nodes returned by ContentTreeBuilder.build.
+        storage (str): The content storage of the course.
+    Returns:
+        bool: True if the course exists and was updated, False otherwise.
+    '''
+    @staticmethod
+    def append_content(course_id, tree, storage=CONTENT_STORAGE_EMBEDDED):
+        """Append sections, subsections and content data to a course"""
+        course_id = ObjectId(course_id)
+        sections, sub_sections, data = tree['sections'], tree['sub_sections'], tree['data']
+        blocks = []
+        if storage == CONTENT_STORAGE_BLOCKS:
+            sections, blocks = ContentBlock.split(course_id, sections)
+            outlines = []
+            for section_id, nodes in sub_sections:
+                outline, subsection_blocks = ContentBlock.split_subsections(
+                    course_id, section_id, nodes
+                )
+                outlines.append((section_id, outline))
+                blocks.extend(subsection_blocks)
+            sub_sections = outlines
+            for section_id, subsection_id, data_objects in data:
+                blocks.extend(ContentBlock.to_blocks(
+                    course_id, section_id, subsection_id, data_objects
+                ))
+            data = []
+            ContentBlock.insert_many(blocks)
+
+        updated_at = datetime.now(timezone.utc).isoformat()
+        # The content index is not maintained here, so each operation drops
+        # it and increments content_version, which stops a concurrent
+        # rebuild from storing an index of the tree it read
+        invalidate = {
+            '$unset': {'content_index': ''},
+            '$inc': {'content_version': 1, 'version': 1}
+        }
+        operations = []
+        # Pushes into different levels of the tree conflict within one
+        # update, so each target gets its own operation of the batch
+        if sections:
+            operations.append(UpdateOne(
+                {'_id': course_id},
+                {
+                    '$push': {'content.sections': {'$each': sections}},
+                    '$set': {'updated_at': updated_at},
+                    **invalidate
+                }
+            ))
+        for section_id, nodes in sub_sections:
+            operations.append(UpdateOne(
+                {'_id': course_id},
+                {
+                    '$push': {
+                        'content.sections.$[section].sub_sections': {'$each': nodes}
+                    },
+                    '$set': {'updated_at': updated_at},
+                    **invalidate
+                },
+                array_filters=[{'section.section_id': section_id}]
+            ))
+        for section_id, subsection_id, data_objects in data:
+            operations.append(UpdateOne(
+                {'_id': course_id},
+                {
+                    '$push': {
+                        'content.sections.$[section].sub_sections.$[subsection].data': {
+                            '$each': data_objects
+                        }
+                    },
+                    '$set': {'updated_at': updated_at},
+                    **invalidate
+                },
+                array_filters=[
+                    {'section.section_id': section_id},
+                    {'subsection.subsection_id': subsection_id}
+                ]
+            ))
+        if not operations:
+            if blocks:
+                return Course.touch(course_id) is not None
+            return courses_collection.count_documents({'_id': course_id}, limit=1) > 0
+        result = courses_collection.bulk_write(operations)
+        _course_changed(course_id)
+        return result.matched_count > 0
+
+    '''
+    A static method that counts a new enrollment in a course (see
+    EnrollmentService.enroll). The count is added to the course later,
+    along with the other new enrollments of this worker, see
+    _pending_enrollments.
+    Args:
+        course_id (str): ID of the course.
+    Returns:
+        None
+    '''
+    @staticmethod
+    def increment_enrollment_count(course_id):
+        """Increment the enrollment count of a course"""
+        course_id = str(course_id)
+        with _pending_enrollments_lock:
+            _pending_enrollments[course_id] = _pending_enrollments.get(course_id, 0) + 1
+            _start_enrollment_flusher()
 
     '''
     A static method that marks a course as completed for a user, only if 
     the user has not completed the course before. If the user has completed
     the course before, it will not be marked again and it will return nothing.
-    This method also inserts the user's ID in to the course's completed_users array.
+    This method also marks the user's enrollment in the course as completed
+    and increments the course's completion_count.
     Args:
         course_id (str): ID of the course to mark as completed.
         user_id (str): ID of the user who completed the course.
     Returns:
-        bool: True if the course was marked as completed successfully, False otherwise.
+        bool: True if the course was marked as completed, or was already,
+        False if the course does not exist.
     '''
     @staticmethod
     def mark_course_as_completed(course_id, user_id):
         """Mark a course as completed for a user"""
         if isinstance(course_id, str):
             course_id = ObjectId(course_id)
-        
-        # Check if the user has already completed the course
-        course = courses_collection.find_one(
-            {
-                '_id': ObjectId(course_id),
-                'completed_users': {'$in': [user_id]}
-            }
-        )
-        
-        if course is not None:
-            return True  # User has already completed the course before, do nothing
-        
-        # Updates and checks if the course update was successful
-        result = courses_collection.update_one(
-            {'_id': ObjectId(course_id)},
-            {'$addToSet': {'completed_users': user_id}}
-        )
-        if result.modified_count == 0:
+
+        if courses_collection.count_documents({'_id': course_id}, limit=1) == 0:
             return False
-        
-        # Apply the update also on user's course_progress
+
+        completed = Enrollment.complete(course_id, user_id)
+        if completed:
+            courses_collection.update_one(
+                {'_id': course_id},
+                {'$inc': {'completion_count': 1}}
+            )
+
+        # Apply the update also on user's course_progress. It only changes
+        # the user once, so it also completes a call that failed after
+        # completing the enrollment.
         updated_user = User.update_course_progress(
             user_id=user_id,
             progress_data={
@@ -934,8 +1682,10 @@ class Course:
             }
         )
 
-        if updated_user.modified_count == 0:
-            return False
+        # The cached recommendations of the user are built from the
+        # completed courses, once they are written
+        if completed or updated_user is not None:
+            User.invalidate_recommendations(user_id)
 
         return True
 
@@ -947,25 +1697,25 @@ class Course:
         sort (str): Sorting criteria. Default is 'popular'. Popularity is
         based on number of enrollments. Other possible values could be
         'recent', etc.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
 
     Returns:
         list: A list of popular courses.
     '''
     @staticmethod
-    def find_popular(limit=20, sort='popular'):
+    def find_popular(limit=20, sort='popular', view='full'):
         limit = int(limit)
         # Determine the sorting field based on the sort parameter
         sort_field = 'enrollment_count' if sort == 'popular' else 'created_at'
 
         # Query the database to fetch courses sorted by the specified field
-        cursor = courses_collection.find().sort(sort_field, -1).limit(limit)
+        cursor = courses_collection.find(
+            {}, _list_projection(view)
+        ).sort(sort_field, -1).limit(limit)
 
         # Convert the cursor to a list and return it
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
     
     '''
     Finds courses by category and title.
@@ -974,12 +1724,14 @@ class Course:
         title (str): The title of the course.
         limit (int): Maximum number of courses to return. Default is 10.
         skip (int): Number of courses to skip. Default is 0.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
     Returns:
         list: A list of courses that match the category and title.
     '''
     @staticmethod
     def find_by_category_and_title(
-        category, title, limit=10, skip=0
+        category, title, limit=10, skip=0, view='full'
     ):
         cursor = courses_collection.find(
             {
@@ -987,14 +1739,11 @@ class Course:
                 'title': {
                     '$regex': html_tags_unconverter(title)
                 }
-            }
+            },
+            _list_projection(view)
         ).limit(limit).skip(skip)
         # Convert the cursor to a list and return it
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
     
     '''
     Finds courses by title.
@@ -1002,22 +1751,21 @@ class Course:
         title (str): The title of the course.
         limit (int): Maximum number of courses to return. Default is 10.
         skip (int): Number of courses to skip. Default is 0.
+        view (str): 'full' returns whole documents, 'summary' only the
+        fields of COURSE_SUMMARY_PROJECTION. Defaults to 'full'.
     Returns:
         list: A list of courses that match the title.
     '''
     @staticmethod
     def find_by_title(
-        title, limit=10, skip=0
+        title, limit=10, skip=0, view='full'
     ):
         cursor = courses_collection.find(
             {
                 'title': {
                     '$regex': html_tags_unconverter(title)
                 }
-            }
+            },
+            _list_projection(view)
         ).limit(limit).skip(skip)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+from pymongo import IndexModel, ASCENDING, ReplaceOne
+from app import db
+from app.utils.indexes import register_indexes
+
+course_similarities_collection = db.course_similarities
+
+register_indexes('course_similarities', [
+    IndexModel([('course_id', ASCENDING)], unique=True, background=True),
+])
+
+'''
+CourseSimilarity Model
+- Stores the nearest neighbors of every course by co-enrollment, as
+  built offline by CourseSimilarityService.build, one document per
+  course. Collaborative recommendations read the documents of the
+  courses of a user with a single query and merge their neighbors.
+- Fields in a typical document:
+    - course_id: ID of the course, as a string
+    - neighbors: The most similar courses, most similar first, each with
+      its course_id, its score and its support, the number of users
+      who took both courses
+    - metric: 'cosine' or 'jaccard', how the scores were computed
+    - built_at: When the build that wrote the document started
+'''
+class CourseSimilarity:
+    '''
+    Finds the neighbors of courses.
+    Args:
+        course_ids (list): IDs of the courses.
+    Returns:
+        dict: The neighbors of each course that has some, by course ID.
+    '''
+    @staticmethod
+    def find_neighbors(course_ids):
+        """Find the neighbors of courses"""
+        course_ids = [str(course_id) for course_id in course_ids if course_id]
+        if not course_ids:
+            return {}
+        cursor = course_similarities_collection.find(
+            {'course_id': {'$in': course_ids}}, {'_id': 0, 'course_id': 1, 'neighbors': 1}
+        )
+        return {document['course_id']: document.get('neighbors', []) for document in cursor}
+
+    '''
+    Replaces the stored neighbors with those of a new build. Documents of
+    courses that are not part of the build, e.g. courses nobody takes
+    anymore, are deleted once the build is written.
+    Args:
+        neighbors (dict): The neighbors of each course, by course ID,
+        as returned by CourseSimilarityService.compute.
+        metric (str): How the scores were computed.
+        batch_size (int): Number of documents written per bulk write.
+    Returns:
+        int: The number of courses written.
+    '''
+    @staticmethod
+    def replace_all(neighbors, metric, batch_size=1000):
+        """Replace the neighbors of every course"""
+        built_at = datetime.now(timezone.utc).isoformat()
+        operations = []
+        for course_id, course_neighbors in neighbors.items():
+            operations.append(ReplaceOne(
+                {'course_id': course_id},
+                {
+                    'course_id': course_id,
+                    'neighbors': course_neighbors,
+                    'metric': metric,
+                    'built_at': built_at,
+                },
+                upsert=True
+            ))
+            if len(operations) >= batch_size:
+                course_similarities_collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            course_similarities_collection.bulk_write(operations, ordered=False)
+
+        course_similarities_collection.delete_many({'built_at': {'$ne': built_at}})
+        return len(neighbors)
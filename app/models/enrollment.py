@@ -0,0 +1,256 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app import db
+from app.utils.indexes import register_indexes
+
+enrollments_collection = db.enrollments
+
+register_indexes('enrollments', [
+    # One enrollment per user and course, also serves the course lookups
+    IndexModel([('course_id', ASCENDING), ('user_id', ASCENDING)], unique=True, background=True),
+    # Courses of a user, optionally by status
+    IndexModel([('user_id', ASCENDING), ('status', ASCENDING)], background=True),
+])
+
+ENROLLMENT_STATUSES = ('enrolled', 'completed')
+
+'''
+Enrollment Model
+- Represents the enrollment of a user in a course, one document per
+  (course_id, user_id) pair
+- Replaces the enrolled_users and completed_users arrays that used to
+  grow inside the course documents
+- Fields in a typical document:
+    - course_id: ID of the course, as a string
+    - user_id: ID of the user, as a string
+    - status: 'enrolled' or 'completed'
+    - enrolled_at: When the user enrolled in the course
+    - completed_at: When the user completed the course, if they did
+    - created_at and updated_at timestamps
+'''
+class Enrollment:
+    '''
+    Enrolls a user in a course, unless they are enrolled already.
+    Args:
+        course_id (str): ID of the course.
+        user_id (str): ID of the user.
+    Returns:
+        bool: True if a new enrollment was created, False if the user
+        was already enrolled in the course.
+    '''
+    @staticmethod
+    def enroll(course_id, user_id):
+        """Enroll a user in a course"""
+        now = datetime.now(timezone.utc).isoformat()
+        result = enrollments_collection.update_one(
+            {'course_id': str(course_id), 'user_id': str(user_id)},
+            {
+                '$setOnInsert': {
+                    'status': 'enrolled',
+                    'enrolled_at': now,
+                    'created_at': now,
+                    'updated_at': now,
+                }
+            },
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    '''
+    Marks the enrollment of a user in a course as completed. A user who
+    completes a course without an enrollment gets one.
+    Args:
+        course_id (str): ID of the course.
+        user_id (str): ID of the user.
+    Returns:
+        bool: True if the enrollment became completed, False if it was
+        completed already.
+    '''
+    @staticmethod
+    def complete(course_id, user_id):
+        """Mark an enrollment as completed"""
+        now = datetime.now(timezone.utc).isoformat()
+        try:
+            result = enrollments_collection.update_one(
+                {
+                    'course_id': str(course_id),
+                    'user_id': str(user_id),
+                    'status': {'$ne': 'completed'}
+                },
+                {
+                    '$set': {
+                        'status': 'completed',
+                        'completed_at': now,
+                        'updated_at': now,
+                    },
+                    '$setOnInsert': {'enrolled_at': now, 'created_at': now}
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The completed enrollment exists, so the upsert collided
+            return False
+        return result.modified_count > 0 or result.upserted_id is not None
+
+    '''
+    Deletes the enrollment of a user in a course.
+    Args:
+        course_id (str): ID of the course.
+        user_id (str): ID of the user.
+    Returns:
+        bool: True if an enrollment was deleted.
+    '''
+    @staticmethod
+    def delete(course_id, user_id):
+        """Delete the enrollment of a user in a course"""
+        result = enrollments_collection.delete_one(
+            {'course_id': str(course_id), 'user_id': str(user_id)}
+        )
+        return result.deleted_count > 0
+
+    '''
+    Finds the enrollment of a user in a course.
+    Args:
+        course_id (str): ID of the course.
+        user_id (str): ID of the user.
+    Returns:
+        dict: The enrollment document, or None if the user is not enrolled.
+    '''
+    @staticmethod
+    def find(course_id, user_id):
+        """Find the enrollment of a user in a course"""
+        return enrollments_collection.find_one(
+            {'course_id': str(course_id), 'user_id': str(user_id)}
+        )
+
+    '''
+    Finds the IDs of the courses a user is enrolled in.
+    Args:
+        user_id (str): ID of the user.
+        status (str, optional): Only return enrollments with this status.
+        limit (int): Number of course IDs to return.
+        skip (int): Number of course IDs to skip.
+    Returns:
+        list: The course IDs, as strings.
+    '''
+    @staticmethod
+    def find_course_ids_by_user(user_id, status=None, limit=10, skip=0):
+        """Find the courses of a user"""
+        query = {'user_id': str(user_id)}
+        if status is not None:
+            query['status'] = status
+        cursor = enrollments_collection.find(
+            query, {'course_id': 1, '_id': 0}
+        ).skip(int(skip)).limit(int(limit))
+        return [enrollment['course_id'] for enrollment in cursor]
+
+    '''
+    Counts the enrollments of a course.
+    Args:
+        course_id (str): ID of the course.
+        status (str, optional): Only count enrollments with this status.
+    Returns:
+        int: The number of enrollments.
+    '''
+    @staticmethod
+    def count_by_course(course_id, status=None):
+        """Count the enrollments of a course"""
+        query = {'course_id': str(course_id)}
+        if status is not None:
+            query['status'] = status
+        return enrollments_collection.count_documents(query)
+
+    '''
+    Moves the enrolled_users and completed_users arrays of the course
+    documents into the enrollments collection. Courses are streamed one
+    at a time and their users written in batches, so the whole dataset
+    is never held in memory. Each migrated course gets its
+    enrollment_count and completion_count recounted from the
+    enrollments and loses both arrays. Running it again is harmless.
+    Args:
+        batch_size (int): Number of enrollments written per bulk write.
+        on_course (callable, optional): Called with the course ID and the
+        number of users migrated, after each course.
+    Returns:
+        dict: courses and enrollments, the numbers migrated.
+    '''
+    @staticmethod
+    def migrate_from_courses(batch_size=1000, on_course=None):
+        """Migrate the enrollment arrays of the courses"""
+        courses_collection = db.courses
+        cursor = courses_collection.find(
+            {
+                '$or': [
+                    {'enrolled_users': {'$exists': True}},
+                    {'completed_users': {'$exists': True}},
+                ]
+            },
+            {'enrolled_users': 1, 'completed_users': 1}
+        ).batch_size(100)
+
+        totals = {'courses': 0, 'enrollments': 0}
+        for course in cursor:
+            course_id = str(course['_id'])
+            now = datetime.now(timezone.utc).isoformat()
+            operations = []
+            migrated = 0
+            # Enrolled users first, so a completion always wins
+            for user_id in course.get('enrolled_users') or []:
+                operations.append(UpdateOne(
+                    {'course_id': course_id, 'user_id': str(user_id)},
+                    {
+                        '$setOnInsert': {
+                            'status': 'enrolled',
+                            'enrolled_at': now,
+                            'created_at': now,
+                            'updated_at': now,
+                        }
+                    },
+                    upsert=True
+                ))
+                if len(operations) >= batch_size:
+                    migrated += Enrollment._write(operations)
+                    operations = []
+            for user_id in course.get('completed_users') or []:
+                operations.append(UpdateOne(
+                    {'course_id': course_id, 'user_id': str(user_id)},
+                    {
+                        '$set': {'status': 'completed', 'updated_at': now},
+                        '$min': {'completed_at': now},
+                        '$setOnInsert': {'enrolled_at': now, 'created_at': now},
+                    },
+                    upsert=True
+                ))
+                if len(operations) >= batch_size:
+                    migrated += Enrollment._write(operations)
+                    operations = []
+            migrated += Enrollment._write(operations)
+
+            courses_collection.update_one(
+                {'_id': ObjectId(course_id)},
+                {
+                    '$set': {
+                        'enrollment_count': Enrollment.count_by_course(course_id),
+                        'completion_count': Enrollment.count_by_course(
+                            course_id, status='completed'
+                        ),
+                    },
+                    '$unset': {'enrolled_users': '', 'completed_users': ''},
+                    # Drops the course from the course caches, see Course
+                    '$inc': {'version': 1}
+                }
+            )
+            totals['courses'] += 1
+            totals['enrollments'] += migrated
+            if on_course is not None:
+                on_course(course_id, migrated)
+        return totals
+
+    @staticmethod
+    def _write(operations):
+        if not operations:
+            return 0
+        enrollments_collection.bulk_write(operations, ordered=False)
+        return len(operations)
@@ -1,9 +1,17 @@
 from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING
 from app import db
+from app.utils.indexes import register_indexes
+from app.utils.pagination import keyset_filter, SORT_BY_ID
 
 learning_paths_collection = db.learning_paths
 
+register_indexes('learning_paths', [
+    IndexModel([('target_skills', ASCENDING)], background=True),
+    IndexModel([('prerequisites.skills', ASCENDING)], background=True),
+])
+
 '''
 This is a model for magaging learning paths.
 It allows for creating, finding, and updating learning paths.
@@ -32,8 +40,8 @@ class LearningPath:
             'created_at': datetime.now(timezone.utc).isoformat(),
             'updated_at': datetime.now(timezone.utc).isoformat()
         }
-        result = learning_paths_collection.insert_one(path)
-        path['_id'] = str(result.inserted_id)
+        # insert_one sets the _id of the path
+        learning_paths_collection.insert_one(path)
         return path
     
     '''
@@ -42,24 +50,22 @@ class LearningPath:
         filters (dict, optional): Filters to apply to the query.
         limit (int, optional): Maximum number of paths to return. Defaults to 20.
         skip (int, optional): Number of paths to skip. Defaults to 0.
+        after (str, optional): Cursor of the previous page, see
+        app.utils.pagination. Takes precedence over skip.
     Returns:
-        list: A list of learning paths that match the filters.
-        Each path will have its '_id' field converted to a string.
+        list: A list of learning paths that match the filters, ordered
+        by _id, with their '_id' as an ObjectId.
     '''
     @staticmethod
-    def find_all(filters={}, limit=20, skip=0):
+    def find_all(filters={}, limit=20, skip=0, after=None):
         """Find all learning paths"""
         limit = int(limit)
-        skip = int(skip)
+        skip = 0 if after else int(skip)
 
-        cursor = learning_paths_collection.find(filters).skip(skip).limit(limit)
-        
-        results = []
+        query = keyset_filter(filters, SORT_BY_ID, after)
+        cursor = learning_paths_collection.find(query).sort(SORT_BY_ID).skip(skip).limit(limit)
         
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
     
     '''
     Find a learning path by its ID.
@@ -74,7 +80,24 @@ class LearningPath:
     def find_by_id(path_id):
         """Find a learning path by ID"""
         return learning_paths_collection.find_one({'_id': ObjectId(path_id)})
-    
+
+    '''
+    Read the version of a learning path, without the path itself, see
+    app.utils.conditional. Every update sets its updated_at.
+    Args:
+        path_id (str): The ID of the learning path.
+    Returns:
+        dict: The updated_at of the learning path, or None if not found.
+    '''
+    @staticmethod
+    def get_version(path_id):
+        """Get the version of a learning path"""
+        if not ObjectId.is_valid(path_id):
+            return None
+        return learning_paths_collection.find_one(
+            {'_id': ObjectId(path_id)}, {'_id': 0, 'updated_at': 1}
+        )
+
     '''
     Find learning paths by target skill.
     Args:
@@ -82,8 +105,8 @@ class LearningPath:
         limit (int, optional): Maximum number of paths to return. Defaults to 20.
         skip (int, optional): Number of paths to skip. Defaults to 0.
     Returns:
-        list: A list of learning paths that target the specified skill.
-        Each path will have its '_id' field converted to a string.
+        list: A list of learning paths that target the specified skill,
+        with their '_id' as an ObjectId.
         If no paths are found, an empty list is returned.
     '''
     @staticmethod
@@ -94,11 +117,7 @@ class LearningPath:
         cursor = learning_paths_collection.find(
             {'target_skills': skill}
         ).skip(skip).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        return list(cursor)
     
     '''
     Update a learning path by its ID.
@@ -1,10 +1,24 @@
+import copy
+import random
 from datetime import datetime, timezone
 from bson import ObjectId
+from flask import g, has_request_context
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from app import db
+from app.utils.indexes import register_indexes
+from app.utils.pagination import keyset_filter, SORT_BY_NEWEST
 from app.utils.validation import html_tags_converter
 
 questions_collection = db.questions
 
+register_indexes('questions', [
+    # Multikey indexes over the assessment and tag arrays
+    IndexModel([('assessment_ids', ASCENDING)], background=True),
+    IndexModel([('tags', ASCENDING)], background=True),
+    # find_all, newest first with a total order for cursor pagination
+    IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], background=True),
+])
+
 '''
 Question Model
 - Represents a question in the system
@@ -49,16 +63,12 @@ class Question:
         return question
     
     '''
-    Find all questions with optional filters, limit, and skip.
+    Find a question by its ID.
     Args:
-        filters (dict, optional): Filters to apply to the query.
-        limit (int, optional): Maximum number of questions to
-        return. Defaults to 20.
-        skip (int, optional): Number of questions to skip.
-        Defaults to 0.
+        question_id (str): The ID of the question to find.
     Returns:
-        list: A list of questions that match the filters.
-        Each question will have its '_id' field converted to a string.
+        dict: The question object if found, with its '_id' as an
+        ObjectId, or None if not found.
     '''
     @staticmethod
     def find_by_id(question_id):
@@ -75,28 +85,40 @@ class Question:
         """Count the total number of questions"""
         return questions_collection.count_documents({})
     
+    '''
+    Returns the question loader of the current request.
+    Outside of a request a new loader is returned, so nothing is
+    memoized across calls.
+    Returns:
+        QuestionLoader: The loader to batch question lookups with.
+    '''
+    @staticmethod
+    def loader():
+        """Get the request scoped question loader"""
+        if not has_request_context():
+            return QuestionLoader()
+        if 'question_loader' not in g:
+            g.question_loader = QuestionLoader()
+        return g.question_loader
+
     '''
     Find multiple questions by their ObjectIds.
     Args:
         object_ids (list): List of ObjectId instances.
     Returns:
-        list: List of question objects.
+        list: List of question objects, in random order, each once.
+        Ids that match no question are left out.
     '''
     @staticmethod
     def find_by_ids(object_ids):
-        pipeline = [
-        {'$match': {'_id': {'$in': object_ids}}},
-        {'$sample': {'size': len(object_ids)}}
+        # A repeated id returns its question once, as the former $in did
+        unique_ids = list(dict.fromkeys(str(object_id) for object_id in object_ids))
+        questions = [
+            question for question in Question.loader().load_many(unique_ids)
+            if question is not None
         ]
-
-        cursor = questions_collection.aggregate(pipeline=pipeline)
-        
-        # Convert the cursor to a list and format the _id field as a string
-        questions = []
-        for question in cursor:
-            question['_id'] = str(question['_id'])  # Convert ObjectId to string
-            questions.append(question)
-        
+        # The questions are served shuffled, as the former $sample did
+        random.shuffle(questions)
         return questions
 
     '''
@@ -109,7 +131,6 @@ class Question:
         Defaults to 0.
     Returns:
         list: A list of questions that match the tags.
-        Each question will have its '_id' field converted to a string.
         If no questions are found, an empty list is returned.
     '''
     @staticmethod
@@ -130,16 +151,9 @@ class Question:
             ]
         }
 
-        cursor = questions_collection.find(
+        return list(questions_collection.find(
             query
-        ).skip(skip).limit(limit)
-        
-        results = []
-        
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        ).skip(skip).limit(limit))
 
     '''
     Find questions by assessment ID.
@@ -149,19 +163,12 @@ class Question:
     Returns:
         list: A list of questions that are associated with
         the specified assessment ID.
-        Each question will have its '_id' field
-        converted to a string.
         If no questions are found, an empty list is returned.
     '''
     @staticmethod
     def find_by_assessment_id(assessment_id):
         """Find questions by assessment ID"""
-        cursor = questions_collection.find({'assessment_ids': str(assessment_id)})
-        questions = []
-        for question in cursor:
-            question['_id'] = str(question['_id'])
-            questions.append(question)
-        return questions
+        return list(questions_collection.find({'assessment_ids': str(assessment_id)}))
     
     '''
     Find all questions with pagination.
@@ -170,22 +177,19 @@ class Question:
         to return. Defaults to 20.
         skip (int, optional): Number of questions to skip.
         Defaults to 0.
+        after (str, optional): Cursor of the previous page, see
+        app.utils.pagination. Takes precedence over skip.
     Returns:
-        list: A list of questions, each with its '_id'
-        field converted to a string.
+        list: A list of questions, newest first.
         If no questions are found, an empty list is returned.
     '''
     @staticmethod
-    def find_all(limit=20, skip=0):
+    def find_all(limit=20, skip=0, after=None):
         """Find all questions with pagination"""
         limit = int(limit)
-        skip = int(skip)
-        cursor = questions_collection.find().sort('created_at', -1).skip(skip).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        skip = 0 if after else int(skip)
+        query = keyset_filter({}, SORT_BY_NEWEST, after)
+        return list(questions_collection.find(query).sort(SORT_BY_NEWEST).skip(skip).limit(limit))
     
     '''
     Update a question by its ID.
@@ -205,6 +209,7 @@ class Question:
             {'_id': ObjectId(question_id)},
             {'$set': update_data}
         )
+        Question.loader().clear([question_id])
         return questions_collection.find_one({'_id': ObjectId(question_id)})
     
     '''
@@ -220,6 +225,7 @@ class Question:
     def delete(question_id):
         """Delete a question"""
         questions_collection.delete_one({'_id': ObjectId(question_id)})
+        Question.loader().clear([question_id])
         # Confirm question deletion was successful
         if questions_collection.find_one({'_id': ObjectId(question_id)}):
             return False
@@ -280,7 +286,6 @@ class Question:
         Defaults to 0.
     Returns:
         list: A list of questions that match the assessment IDs.
-        Each question will have its '_id' field converted to a string.
         If no questions are found, an empty list is returned.
     '''
     @staticmethod
@@ -288,14 +293,9 @@ class Question:
         """Find questions by multiple assessment IDs"""
         limit = int(limit)
         skip = int(skip)
-        cursor = questions_collection.find(
+        return list(questions_collection.find(
             {'assessment_ids': {'$in': assessment_ids}}
-        ).skip(skip).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
+        ).skip(skip).limit(limit))
     
     '''
     Find questions by assessment ID and tags.
@@ -308,7 +308,6 @@ class Question:
         skip (int, optional): Number of questions to skip. Defaults to 0.
     Returns:
         list: A list of questions that match the assessment ID and tags.
-        Each question will have its '_id' field converted to a string.
         If no questions are found, an empty list is returned.
     '''
     @staticmethod
@@ -317,12 +316,74 @@ class Question:
         limit = int(limit)
         skip = int(skip)
 
-        cursor = questions_collection.find(
+        return list(questions_collection.find(
             {'assessment_ids': assessment_id, 'tags': {'$in': tags}}
-        ).skip(skip).limit(limit)
-        results = []
-        for course in cursor:
-            course['_id'] = str(course['_id'])
-            results.append(course)
-        return results
-    
\ No newline at end of file
+        ).skip(skip).limit(limit))
+    
+
+'''
+Batch loader for questions
+- Collects the ids asked for, fetches the ones it has not seen yet
+  with a single $in query and memoizes the result
+- One loader lives for the duration of a request (see Question.loader),
+  so scoring and storing a submission share the same lookups
+- Returned questions are deep copies, callers may modify them,
+  including their options and tags
+'''
+class QuestionLoader:
+    def __init__(self):
+        # Maps a question id (str) to its document, or None if not found
+        self._cache = {}
+
+    '''
+    Load several questions at once.
+    Args:
+        question_ids (list): Question ids, as str or ObjectId.
+    Returns:
+        list: The questions in the order of question_ids, with None
+        in place of ids that match no question.
+    '''
+    def load_many(self, question_ids):
+        """Load questions by ID, querying only the ones not loaded yet"""
+        keys = [str(question_id) for question_id in question_ids]
+        missing = list(dict.fromkeys(key for key in keys if key not in self._cache))
+        if missing:
+            cursor = questions_collection.find(
+                {'_id': {'$in': [ObjectId(key) for key in missing]}}
+            )
+            for question in cursor:
+                self._cache[str(question['_id'])] = question
+            for key in missing:
+                self._cache.setdefault(key, None)
+
+        return [
+            copy.deepcopy(self._cache[key]) if self._cache[key] is not None else None
+            for key in keys
+        ]
+
+    '''
+    Load a single question.
+    Args:
+        question_id (str): The question id.
+    Returns:
+        dict: The question, or None if it does not exist.
+    '''
+    def load(self, question_id):
+        """Load a question by ID"""
+        return self.load_many([question_id])[0]
+
+    '''
+    Forget loaded questions, e.g. after they were updated.
+    Args:
+        question_ids (list, optional): Ids to forget. Forgets every
+        question when omitted.
+    Returns:
+        None
+    '''
+    def clear(self, question_ids=None):
+        """Forget memoized questions"""
+        if question_ids is None:
+            self._cache.clear()
+            return
+        for question_id in question_ids:
+            self._cache.pop(str(question_id), None)
@@ -0,0 +1,121 @@
+from datetime import datetime
+from pymongo import IndexModel, ASCENDING
+from app import db
+from app.utils.indexes import register_indexes
+from app.utils.token_blocklist import TokenBlocklistCache
+from config import Config
+
+token_blacklist_collection = db.token_blacklist
+
+# jti lookups run on every authenticated request; expires_at lets
+# MongoDB purge revoked tokens once they could no longer be used.
+register_indexes('token_blacklist', [
+    IndexModel([('jti', ASCENDING)], unique=True, background=True),
+    IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0, background=True),
+])
+
+'''
+Token Blacklist Model
+- Represents JWT tokens that were revoked before their expiry
+- Fields in a typical document:
+    - jti: Unique identifier of the revoked token
+    - expires_at: Time after which the entry is removed automatically
+'''
+class TokenBlacklist:
+    '''
+    Revokes a token by adding its jti to the blacklist.
+    Args:
+        jti (str): Unique identifier of the token.
+        expires_at (datetime): Time after which the entry may be purged.
+    Returns:
+        dict: The created blacklist entry.
+    '''
+    @staticmethod
+    def add(jti, expires_at):
+        """Add a token to the blacklist"""
+        entry = {'jti': jti, 'expires_at': expires_at}
+        result = token_blacklist_collection.insert_one(entry)
+        entry['_id'] = result.inserted_id
+        # Applies at once in this worker, the others catch up on sync
+        blocklist_cache.add(jti)
+        return entry
+
+    '''
+    Checks whether a token has been revoked, using the blocklist cache
+    of this process. This runs on every authenticated request.
+    Args:
+        jti (str): Unique identifier of the token.
+    Returns:
+        bool: True if the token is revoked, False otherwise.
+    '''
+    @staticmethod
+    def is_revoked(jti):
+        """Check if a token is revoked"""
+        return blocklist_cache.contains(jti)
+
+    '''
+    Checks whether a token has been revoked.
+    Args:
+        jti (str): Unique identifier of the token.
+    Returns:
+        bool: True if the token is in the blacklist, False otherwise.
+    '''
+    @staticmethod
+    def contains(jti):
+        """Check if a token is blacklisted"""
+        return token_blacklist_collection.find_one(
+            {'jti': jti}, {'_id': 1}
+        ) is not None
+
+    '''
+    Lists the revocations that have not expired yet, oldest first.
+    Returns:
+        Cursor: Entries with their jti.
+    '''
+    @staticmethod
+    def find_active():
+        """Find the revocations that are still in effect"""
+        return token_blacklist_collection.find(
+            {'expires_at': {'$gt': datetime.utcnow()}},
+            {'jti': 1, '_id': 0}
+        ).sort('_id', ASCENDING)
+
+    '''
+    Lists the revocations inserted after a given ObjectId.
+    Args:
+        object_id (ObjectId): Entries with a greater _id are returned.
+    Returns:
+        Cursor: Entries with their jti.
+    '''
+    @staticmethod
+    def find_since(object_id):
+        """Find the revocations inserted since an ObjectId"""
+        return token_blacklist_collection.find(
+            {'_id': {'$gt': object_id}},
+            {'jti': 1, '_id': 0}
+        )
+
+    '''
+    Opens a change stream over the newly revoked tokens.
+    Requires a replica set or sharded cluster.
+    Returns:
+        ChangeStream: Insert events of the blacklist collection.
+    '''
+    @staticmethod
+    def watch_inserts():
+        """Watch the blacklist for new revocations"""
+        return token_blacklist_collection.watch(
+            [{'$match': {'operationType': 'insert'}}],
+            max_await_time_ms=1000,
+        )
+
+
+# Revocations known to this process, see TokenBlocklistCache
+blocklist_cache = TokenBlocklistCache(
+    TokenBlacklist,
+    max_staleness=Config.JWT_BLOCKLIST_MAX_STALENESS_SECONDS,
+    rebuild_interval=Config.JWT_BLOCKLIST_REBUILD_SECONDS,
+    capacity=Config.JWT_BLOCKLIST_BLOOM_CAPACITY,
+    error_rate=Config.JWT_BLOCKLIST_BLOOM_ERROR_RATE,
+    use_change_stream=Config.JWT_BLOCKLIST_CHANGE_STREAM,
+)
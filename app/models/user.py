@@ -2,9 +2,28 @@ from datetime import datetime, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
 from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, ReturnDocument
+from app.utils.cache import LRUCache
+from app.utils.cooldown_manager import strip_expired_cooldown
+from app.utils.indexes import register_indexes
+from app.utils.pagination import keyset_filter, SORT_BY_ID
+from config import Config
 
 users_collection = db.users
 
+# Current role_version of recently seen users, see User.get_role_version
+_role_versions = LRUCache(
+    max_entries=Config.ROLE_VERSION_CACHE_SIZE,
+    ttl=Config.ROLE_VERSION_CACHE_TTL_SECONDS,
+)
+
+register_indexes('users', [
+    IndexModel([('email', ASCENDING)], unique=True, background=True),
+    IndexModel([('username', ASCENDING)], unique=True, background=True),
+    # Only users under a cooldown are indexed, for the expiry sweep
+    IndexModel([('cooldown.duration', ASCENDING)], sparse=True, background=True),
+])
+
 '''
 User model for managing user data and operations.
 This model provides methods for creating, finding, updating,
@@ -40,6 +59,10 @@ class User:
             'created_at': datetime.now(timezone.utc).isoformat(),
             'updated_at': datetime.now(timezone.utc).isoformat(),
             'role': 'user',
+            'role_version': 0,
+            # Incremented by every change that affects the user's
+            # recommendations, see User.invalidate_recommendations
+            'recommendations_version': 0,
             'progress': {
                 'completed_courses': [],
                 'in_progress_courses': '',
@@ -77,7 +100,7 @@ class User:
     @staticmethod
     def find_by_email(email):
         """Find a user by email"""
-        return users_collection.find_one({'email': email})
+        return strip_expired_cooldown(users_collection.find_one({'email': email}))
     
     '''
     Find a user by username.
@@ -98,7 +121,7 @@ class User:
     @staticmethod
     def find_by_username(username):
         """Find a user by username"""
-        return users_collection.find_one({'username': username})
+        return strip_expired_cooldown(users_collection.find_one({'username': username}))
     
     '''
     Find a user by ID.
@@ -119,7 +142,7 @@ class User:
     @staticmethod
     def find_by_id(user_id):
         """Find a user by ID"""
-        return users_collection.find_one({'_id': ObjectId(user_id)})
+        return strip_expired_cooldown(users_collection.find_one({'_id': ObjectId(user_id)}))
     
     '''
     Find all users with optional filters, limit, and skip.
@@ -128,6 +151,8 @@ class User:
         limit (int): The maximum number of users to return.
         skip (int): The number of users to skip before
         returning results.
+        after (str, optional): Cursor of the previous page, see
+        app.utils.pagination. Takes precedence over skip.
     Returns:
         list: A list of user objects matching the filters.
         Each user object includes fields for name, email,
@@ -140,24 +165,50 @@ class User:
         The created_at and updated_at fields are set to
         the current UTC time.
         If no users match the filters, an empty list is returned.
-        The user IDs are converted to strings for easier handling.
     '''
     @staticmethod
-    def find_all_users(filters=None, limit=20, skip=0):
+    def find_all_users(filters=None, limit=20, skip=0, after=None):
         """Find all users"""
-        filters = filters or {}
+        filters = keyset_filter(filters or {}, SORT_BY_ID, after)
         limit = int(limit)
-        skip = int(skip)
-        cursor = users_collection.find(filters).limit(limit).skip(skip)
+        skip = 0 if after else int(skip)
+        cursor = users_collection.find(filters).sort(SORT_BY_ID).limit(limit).skip(skip)
         
         results =[]
 
         if cursor is not None:
             for user in cursor:
-                user['_id'] = str(user['_id'])
-                results.append(user)
+                results.append(strip_expired_cooldown(user))
 
         return results
+
+    '''
+    Yields the courses taken by every user, completed or in progress,
+    reading only the progress of the users.
+    Args:
+        batch_size (int): Number of users read per round trip.
+    Returns:
+        generator: The set of course IDs of each user who took any.
+    '''
+    @staticmethod
+    def iter_taken_courses(batch_size=1000):
+        """Iterate over the courses taken by every user"""
+        cursor = users_collection.find(
+            {},
+            {'_id': 0, 'progress.completed_courses': 1, 'progress.in_progress_courses': 1}
+        ).batch_size(batch_size)
+        for user in cursor:
+            progress = user.get('progress') or {}
+            courses = set(progress.get('completed_courses') or [])
+            # The course in progress, a single ID
+            in_progress = progress.get('in_progress_courses')
+            if isinstance(in_progress, list):
+                courses.update(in_progress)
+            elif in_progress:
+                courses.add(in_progress)
+            courses.discard('')
+            if courses:
+                yield courses
     
     '''
     Update a user's profile by user ID.
@@ -177,6 +228,8 @@ class User:
         update_data.pop('progress', None)
         update_data.pop('course_progress', None)
         update_data.pop('role', None)
+        update_data.pop('role_version', None)
+        update_data.pop('recommendations_version', None)
         update_data.pop('_id', None)
 
         update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
@@ -184,7 +237,7 @@ class User:
             {'_id': ObjectId(user_id)},
             {'$set': update_data}
         )
-        return users_collection.find_one({'_id': ObjectId(user_id)})
+        return strip_expired_cooldown(users_collection.find_one({'_id': ObjectId(user_id)}))
     
     '''
     Update user course progress.
@@ -214,20 +267,27 @@ class User:
         """Update user course progress"""
 
         if progress_data.get('completed_course_id'):
+            completed_course_id = str(progress_data.get('completed_course_id'))
+            # Only applies while the completion is not recorded yet, so a
+            # repeated completion changes nothing
+            query = {
+                '_id': ObjectId(user_id),
+                'progress.completed_courses': {'$ne': completed_course_id}
+            }
+            update = {
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+                'progress.in_progress_courses': ''
+            }
+            # Course.mark_course_as_completed sends no course progress
+            if progress_data.get('course_id'):
+                query['course_progress.course_id'] = str(progress_data.get('course_id'))
+                update['course_progress.$'] = progress_data
             result = users_collection.update_one(
+                query,
                 {
-                    '_id': ObjectId(user_id), 
-                    'course_progress.course_id': str(progress_data.get('course_id'))
-                },
-                {
-                    '$set': {
-                        'updated_at': datetime.now(timezone.utc).isoformat(),
-                        'course_progress.$': progress_data,
-                        'course_progress.$.completed_course_id': progress_data.get('completed_course'),
-                        'progress.in_progress_courses': ''
-                    },
+                    '$set': update,
                     '$addToSet': {
-                        'progress.completed_courses': progress_data.get('completed_course_id')
+                        'progress.completed_courses': completed_course_id
                     }
                 }
             )
@@ -246,9 +306,41 @@ class User:
             )
 
         if result.modified_count > 0:
-            return users_collection.find_one({'_id': ObjectId(user_id)})
+            return strip_expired_cooldown(users_collection.find_one({'_id': ObjectId(user_id)}))
         return None
     
+    '''
+    Starts a course for a user, in a single conditional update. A user
+    takes one course at a time, so the update only applies if the user
+    has no course in progress. Starting a course changes the
+    recommendations of the user, so they are invalidated as well.
+    Args:
+        user_id (str): The ID of the user.
+        course_id (str): The ID of the course to start.
+    Returns:
+        dict: The _id and progress of the updated user, or None if the
+        user does not exist or has a course in progress, this one
+        included.
+    '''
+    @staticmethod
+    def start_course(user_id, course_id):
+        """Set the course a user has in progress"""
+        return users_collection.find_one_and_update(
+            {
+                '_id': ObjectId(user_id),
+                'progress.in_progress_courses': {'$in': ['', None]}
+            },
+            {
+                '$set': {
+                    'progress.in_progress_courses': str(course_id),
+                    'updated_at': datetime.now(timezone.utc).isoformat()
+                },
+                '$inc': {'recommendations_version': 1}
+            },
+            projection={'progress': 1},
+            return_document=ReturnDocument.AFTER
+        )
+
     '''
     Update user learning preferences.
     Args:
@@ -303,10 +395,10 @@ class User:
             
             users_collection.update_one(
                 {'_id': ObjectId(user_id)},
-                {'$set': valid_preferences}
+                {'$set': valid_preferences, '$inc': {'recommendations_version': 1}}
             )
         
-        return users_collection.find_one({'_id': ObjectId(user_id)})
+        return strip_expired_cooldown(users_collection.find_one({'_id': ObjectId(user_id)}))
 
     @staticmethod
     def check_password(user, password):
@@ -326,7 +418,7 @@ class User:
                 'updated_at': datetime.now(timezone.utc).isoformat()
             }}
         )
-        return users_collection.find_one({'_id': user['_id']})
+        return strip_expired_cooldown(users_collection.find_one({'_id': user['_id']}))
     
     @staticmethod
     def remove_cooldown_field(user_id):
@@ -335,3 +427,137 @@ class User:
             {'_id': ObjectId(user_id)},
             {'$unset': {'cooldown': ''}}
         )
+
+    '''
+    Removes every cooldown that has ended, in a single update.
+    The durations are ISO timestamps in UTC, so comparing them as
+    strings against the current time selects the expired ones.
+    Returns:
+        int: The number of users whose cooldown was removed.
+    '''
+    @staticmethod
+    def clear_expired_cooldowns():
+        """Remove the expired cooldown fields of all users"""
+        result = users_collection.update_many(
+            {'cooldown.duration': {'$lt': datetime.now(timezone.utc).isoformat()}},
+            {'$unset': {'cooldown': ''}}
+        )
+        return result.modified_count
+
+    '''
+    Builds the claims that are embedded in a user's access token.
+    Args:
+        user (dict): The user document.
+    Returns:
+        dict: The role of the user and the version of that role.
+    '''
+    @staticmethod
+    def token_claims(user):
+        """Get the access token claims of a user"""
+        return {
+            'role': user.get('role', 'user'),
+            'role_version': user.get('role_version', 0),
+        }
+
+    '''
+    Returns the current role version of a user.
+    The version is cached for a short time, so a role change made by
+    another worker is seen within ROLE_VERSION_CACHE_TTL_SECONDS.
+    Args:
+        user_id (str): The ID of the user.
+    Returns:
+        int: The role version, or None if the user does not exist.
+    '''
+    @staticmethod
+    def get_role_version(user_id):
+        """Get the current role version of a user"""
+        role_version = _role_versions.get(str(user_id))
+        if role_version is None:
+            user = users_collection.find_one(
+                {'_id': ObjectId(user_id)}, {'role_version': 1}
+            )
+            if user is None:
+                return None
+            role_version = user.get('role_version', 0)
+            _role_versions.set(str(user_id), role_version)
+        return role_version
+
+    '''
+    Marks the recommendations of a user as outdated, e.g. after an
+    assessment submission. Starting or completing a course and editing
+    the preferences do it in the same write.
+    Args:
+        user_id (str): The ID of the user.
+    Returns:
+        None
+    '''
+    @staticmethod
+    def invalidate_recommendations(user_id):
+        """Increment the recommendations version of a user"""
+        users_collection.update_one(
+            {'_id': ObjectId(user_id)}, {'$inc': {'recommendations_version': 1}}
+        )
+
+    '''
+    Returns the recommendations version of a user, see the cached
+    recommendations of RecommendationService.
+    Args:
+        user_id (str): The ID of the user.
+    Returns:
+        int: The version, or None if the user does not exist.
+    '''
+    @staticmethod
+    def get_recommendations_version(user_id):
+        """Get the recommendations version of a user"""
+        if not ObjectId.is_valid(user_id):
+            return None
+        user = users_collection.find_one(
+            {'_id': ObjectId(user_id)}, {'_id': 0, 'recommendations_version': 1}
+        )
+        if user is None:
+            return None
+        return user.get('recommendations_version', 0)
+
+    '''
+    Returns the role of a user, reading nothing else from the document.
+    Args:
+        user_id (str): The ID of the user.
+    Returns:
+        str: The role, or None if the user does not exist.
+    '''
+    @staticmethod
+    def find_role(user_id):
+        """Find the role of a user"""
+        user = users_collection.find_one(
+            {'_id': ObjectId(user_id)}, {'role': 1}
+        )
+        if user is None:
+            return None
+        return user.get('role', 'user')
+
+    '''
+    Changes the role of a user.
+    Bumps the role version, so that access tokens carrying the former
+    role stop being trusted.
+    Args:
+        user_id (str): The ID of the user.
+        role (str): The new role, 'user' or 'admin'.
+    Returns:
+        dict: The updated user object, or None if the user does not exist.
+    '''
+    @staticmethod
+    def update_role(user_id, role):
+        """Change the role of a user"""
+        user = users_collection.find_one_and_update(
+            {'_id': ObjectId(user_id)},
+            {
+                '$set': {
+                    'role': role,
+                    'updated_at': datetime.now(timezone.utc).isoformat()
+                },
+                '$inc': {'role_version': 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        _role_versions.pop(str(user_id))
+        return user
@@ -4,12 +4,13 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import requests
 from app.utils.swagger_utils import yaml_from_file
-from app.utils.cooldown_manager import manage_cooldown
-from app.models.assessment import Assessment, AssessmentResult
+from app.models.assessment import Assessment, AssessmentResult, AnswerKey
 from app.models.cooldown_history import CooldownHistory
 from app.models.user import User
 from app.services.assessment import AssessmentService
+from app.utils.pagination import next_cursor, SORT_BY_NEWEST
 from app.utils.auth import admin_required
+from app.utils.conditional import make_validators, not_modified, with_validators
 from app.utils.validation import validate_json, sanitize_input
 from config import Config
 
@@ -30,16 +31,20 @@ GET /api/assessments/<assessment_id>
 @yaml_from_file('docs/swagger/assessments/get_assessment.yaml')
 def get_an_assessment(assessment_id):
     try:
-        user_id = get_jwt_identity()
-        if user_id:
-            manage_cooldown(user_id=user_id)
+        version = Assessment.get_version(assessment_id)
+        if version is None:
+            return jsonify({"error": "No assessments found for the given ID"}), 404
+        validators = make_validators('assessment', assessment_id, version)
+        response = not_modified(validators)
+        if response is not None:
+            return response
 
         assessments = Assessment.find_by_id(assessment_id)
         
         if not assessments:
             return jsonify({"error": "No assessments found for the given ID"}), 404
         
-        return jsonify({
+        return with_validators(jsonify({
             "assessment": {
                 "_id": str(assessments['_id']),
                 "title": assessments['title'],
@@ -49,7 +54,7 @@ def get_an_assessment(assessment_id):
                 "created_at": assessments.get('created_at'),
                 "updated_at": assessments.get('updated_at')
             }
-        }), 200
+        }), validators), 200
 
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
@@ -66,7 +71,6 @@ GET /api/assessments
 - Requires admin privileges.
 - If the user is not authenticated, returns an error message.
 - If the user does not have admin privileges, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessments, returns an error message.
 '''
 @assessments_bp.route('', methods=['GET'])
@@ -77,21 +81,22 @@ def get_assessments():
     try:
         limit = int(request.args.get('limit', 20))
         skip = int(request.args.get('skip', 0))
+        after = request.args.get('cursor')
 
-        user_id = get_jwt_identity()
-        if user_id:
-            manage_cooldown(user_id=user_id)
-        
         # Get all assessments with pagination
-        assessments = Assessment.find_all(limit, skip)
+        assessments = Assessment.find_all(limit, skip, after=after)
         
         return jsonify({
             "assessments": assessments,
             "count": len(assessments),
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor(assessments, SORT_BY_NEWEST, limit)
         }), 200
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -104,7 +109,6 @@ GET /api/assessments/course/<course_id>
 - Returns a list of assessments or an error message if not found.
 - If the request fails, returns a network error message.
 - If an internal server error occurs, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessments, returns an error message.
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
@@ -115,10 +119,6 @@ GET /api/assessments/course/<course_id>
 @yaml_from_file('docs/swagger/assessments/get_course_assessments.yaml')
 def get_assessment_for_course(course_id):
     try:
-        user_id = get_jwt_identity()
-        if user_id:
-            manage_cooldown(user_id=user_id)
-
         assessments = Assessment.find_by_course_id(course_id)
         
         if not assessments:
@@ -170,8 +170,7 @@ def submit_assessment(assessment_id):
             current_time = datetime.now(timezone.utc)
             cooldown_duration = current_time + cool_down_hour
             knowledge_gaps = result.get('knowledge_gaps', [])
-            assessment = Assessment.find_by_id(assessment_id)
-            course_id = assessment.get('course_id')
+            course_id = AnswerKey.get(assessment_id).get('course_id')
 
             # Add the cooldown history for the user and add the cooldown object to the user's document
             if CooldownHistory.find_by_user(user_id) is None:
@@ -229,7 +228,6 @@ GET /api/assessments/results
 - If an internal server error occurs, returns an error message.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the assessment results, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessment results, returns an error message.
 '''
 @assessments_bp.route('/results', methods=['GET'])
@@ -241,22 +239,25 @@ def get_assessment_results():
         user_id = get_jwt_identity()
         limit = int(request.args.get('limit', 20))
         skip = request.args.get('skip', 0)
+        after = request.args.get('cursor')
         
         if not user_id:
             return jsonify({"error": "Invalid or missing user ID"}), 400
         
-        manage_cooldown(user_id=user_id)
-
         # Get assessment results for the user
-        results = AssessmentResult.find_by_user(user_id, limit, skip)
+        results = AssessmentResult.find_by_user(user_id, limit, skip, after=after)
         
         return jsonify({
             "results": results,
             "count": len(results),
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor(results, SORT_BY_NEWEST, limit)
         }), 200
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -269,7 +270,6 @@ GET /api/assessments/results/<course_id>
 - Returns the assessment result or an error message if not found.
 - If the request fails, returns a network error message.
 - If an internal server error occurs, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessment results, returns an error message.
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
@@ -285,8 +285,6 @@ def get_assessment_result_by_course_id(course_id):
         if not user_id:
             return jsonify({"error": "Invalid or missing user ID"}), 400
         
-        manage_cooldown(user_id=user_id)
-        
         result = AssessmentResult.find_by_course_and_user_id(course_id=course_id, user_id=user_id)
 
         if result is None:
@@ -314,7 +312,6 @@ POST /api/assessments
 - Requires admin privileges.
 - If the user is not authenticated, returns an error message.
 - If the user does not have admin privileges, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessments, returns an error message.
 '''
 @assessments_bp.route('', methods=['POST'])
@@ -332,8 +329,6 @@ def create_assessment():
             time_limit=data.get('time_limit', 25),
             course_id=data.get('course_id'),
         )
-        assessment['_id'] = str(assessment['_id'])
-        
         return jsonify({
             "message": "Assessment created successfully",
             "assessment": assessment
@@ -354,7 +349,6 @@ PUT /api/assessments/<assessment_id>
 - Requires admin privileges.
 - If the user is not authenticated, returns an error message.
 - If the user does not have admin privileges, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessments, returns an error message.
 '''
 @assessments_bp.route('/<assessment_id>', methods=['PUT'])
@@ -402,7 +396,6 @@ DELETE /api/assessments/<assessment_id>
 - Requires admin privileges.
 - If the user is not authenticated, returns an error message.
 - If the user does not have admin privileges, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessments, returns an error message.
 '''
 @assessments_bp.route('/<assessment_id>', methods=['DELETE'])
@@ -438,7 +431,6 @@ GET /api/assessments/<assessment_id>/average_score
 - Requires admin privileges.
 - If the user is not authenticated, returns an error message.
 - If the user does not have admin privileges, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessment results, returns an error message.
 - If the user does not have access to the assessment, returns an error message.
 '''
@@ -469,7 +461,6 @@ GET /api/assessments/<course_id>/advice
 - Returns a list of advice links or an error message if not found.
 - If the request fails, returns a network error message.
 - If an internal server error occurs, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessment results, returns an error message.
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
@@ -482,8 +473,6 @@ def get_assessment_advice(course_id):
     try:
         user_id = get_jwt_identity()
 
-        manage_cooldown(user_id=user_id)
-
         # Get the assessment result
         assessment_result = AssessmentResult.find_by_course_and_user_id(course_id=course_id, user_id=user_id)
 
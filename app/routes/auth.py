@@ -10,6 +10,7 @@ from flask_jwt_extended import (
     decode_token
 )
 from app.models.user import User
+from app.models.token_blacklist import TokenBlacklist
 from app.utils.validation import (
     validate_json,
     validate_full_name,
@@ -18,13 +19,12 @@ from app.utils.validation import (
     validate_username,
     sanitize_input
 )
-from app import limiter, db
+from app import limiter
 from app.utils.swagger_utils import yaml_from_file
 from app.utils.email import (
     send_reset_email, 
     send_login_email
 )
-from app.utils.cooldown_manager import manage_cooldown
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -78,7 +78,10 @@ def register():
         user = User.create(name, email, username, password)
         
         # Generate access token
-        access_token = create_access_token(identity=str(user['_id']))
+        access_token = create_access_token(
+            identity=str(user['_id']),
+            additional_claims=User.token_claims(user)
+        )
 
         # Send login link to the user's email        
         send_login_email(user.get('email'), user.get('name'))
@@ -126,15 +129,16 @@ def login():
         # Find user by email
         user = User.find_by_email(email)
 
-        manage_cooldown(user_id=user.get('_id', ''))
-        
         # Check password
         if not user or not User.check_password(user, password):
             return jsonify({"error": "Invalid email or password"}), 401
         
 
         # Generate access token
-        access_token = create_access_token(identity=str(user['_id']))
+        access_token = create_access_token(
+            identity=str(user['_id']),
+            additional_claims=User.token_claims(user)
+        )
         
         return jsonify({
             "message": "Login successful",
@@ -173,10 +177,9 @@ def logout():
         jti = get_jwt()['jti']
         # Set expiry time (e.g., 24 hours)
         expires_at = datetime.utcnow() + timedelta(hours=24)
-        # Add the token to the blacklist collection in MongoDB
-        db.token_blacklist.insert_one({"jti": jti, "expires_at": expires_at})
-        # Automatically remove expired tokens
-        db.token_blacklist.create_index("expires_at", expireAfterSeconds=0)
+        # Add the token to the blacklist collection in MongoDB. Expired
+        # entries are removed by the TTL index declared on the model.
+        TokenBlacklist.add(jti, expires_at)
         
         return jsonify({"message": "Logout successful"}), 200
     except Exception as e:
@@ -206,8 +209,6 @@ def get_user():
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        manage_cooldown(user_id=user_id)
-        
         return jsonify({
             "user": {
                 "_id": str(user['_id']),
@@ -255,8 +256,6 @@ def reset_password():
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        manage_cooldown(user_id=user.get('_id', ''))
-        
         # Generate reset token
         reset_token = create_access_token(identity=str(user['_id']), expires_delta=timedelta(hours=1))
 
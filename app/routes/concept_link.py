@@ -1,10 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import requests
-from bson import ObjectId
 from app.utils.swagger_utils import yaml_from_file
-from app.utils.cooldown_manager import manage_cooldown
 from app.models.concept_link import ConceptLinks
+from app.utils.pagination import next_cursor, SORT_BY_ID
 from app.utils.auth import admin_required
 from app.utils.validation import (
     validate_json,
@@ -41,8 +40,6 @@ def create_concept():
             links=data.get('links'),
             description=data.get('description')
         )
-        concept['_id'] = str(concept['_id'])
-
         return jsonify({
             'message': 'Concept created successfully',
             'concept': concept
@@ -74,15 +71,11 @@ def get_by_id(concept_link_id):
 
         if not user_id:
             return jsonify({"error": "Invalid or missing user ID"}), 400
-        
-        manage_cooldown(user_id=user_id)
 
         result = ConceptLinks.get_by_id(concept_link_id=concept_link_id)
         for field, value in result.items():
             if isinstance(value, str):
                 result[field] = html_tags_unconverter(value)
-            elif isinstance(value, ObjectId):
-                result[field] = str(value)
             elif isinstance(value, list):
                 result[field] = [
                     html_tags_unconverter(v) for v in value
@@ -117,19 +110,16 @@ def get_concepts():
 
         if not user_id:
             return jsonify({"error": "Invalid or missing user ID"})
-        
-        manage_cooldown(user_id=user_id)
 
         limit = int(request.args.get('limit', 10))
         skip = int(request.args.get('skip', 0))
-        results_obj = ConceptLinks.get_concepts(skip=skip, limit=limit)
+        after = request.args.get('cursor')
+        results_obj = ConceptLinks.get_concepts(skip=skip, limit=limit, after=after)
         results = []
         for result in results_obj:
             for field, value in result.items():
                 if isinstance(value, str):
                     result[field] = html_tags_unconverter(value)
-                elif isinstance(value, ObjectId):
-                    result[field] = str(value)
                 elif isinstance(value, list):
                     result[field] = [
                         html_tags_unconverter(v) for v in value
@@ -138,8 +128,12 @@ def get_concepts():
 
         return jsonify({
             'concepts': results,
-            'count': ConceptLinks.get_document_count()
+            'count': ConceptLinks.get_document_count(),
+            'next_cursor': next_cursor(results, SORT_BY_ID, limit)
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
     
@@ -182,8 +176,6 @@ def update_concept(concept_link_id):
             for field, value in result.items():
                 if isinstance(value, str):
                     result[field] = html_tags_unconverter(value)
-                elif isinstance(value, ObjectId):
-                    result[field] = str(value)
                 elif isinstance(value, list):
                     result[field] = [
                         html_tags_unconverter(v) for v in value
@@ -249,8 +241,6 @@ def search_concepts():
 
         if not user_id:
             return jsonify({"error": "Invalid or missing user ID"}), 400
-        
-        manage_cooldown(user_id=user_id)
 
         query = request.args.get('query', '').strip()
         limit = int(request.args.get('limit', 10))
@@ -270,8 +260,6 @@ def search_concepts():
             for field, value in result.items():
                 if isinstance(value, str):
                     result[field] = html_tags_unconverter(value)
-                elif isinstance(value, ObjectId):
-                    result[field] = str(value)
                 elif isinstance(value, list):
                     result[field] = [
                         html_tags_unconverter(v) for v in value
@@ -38,8 +38,6 @@ def create_cooldown_history():
             knowledge_gaps=knowledge_gaps
         )
 
-        cooldown_entry['_id'] = str(cooldown_entry['_id'])
-
         return jsonify(cooldown_entry), 201
     except requests.RequestException as e:
         return jsonify({"error": f'Network error: {str(e)}'}), 503
@@ -64,8 +62,6 @@ def get_cooldown_history_by_user_id(user_id):
         if not cooldown_history:
             return jsonify({"message": "No cooldown history found for this user"}), 200
 
-        # Convert ObjectId to string for JSON serialization
-        cooldown_history['_id'] = str(cooldown_history['_id'])
         return jsonify({'cooldown': cooldown_history}), 200
 
     except requests.RequestException as e:
@@ -1,25 +1,81 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import requests
-from app.models.course import Course
-from app.models.user import User
+from app.models.course import Course, COURSE_LIST_VIEWS
+from app.utils.pagination import next_cursor, SORT_BY_ID
 from app.services.recommendation import RecommendationService
 from app.services.content_service import ContentService
+from app.services.enrollment import EnrollmentService
 from app.utils.auth import admin_required
+from app.utils.cache import LRUCache
+from app.utils.conditional import make_validators, not_modified, with_validators
 from app.utils.validation import validate_json, sanitize_input, validate_content_structure
 from app.utils.swagger_utils import yaml_from_file
 from app.utils.validation import (
     transform_sanitized_course,
     transform_sanitized_course_list
 )
-from app.utils.cooldown_manager import manage_cooldown
+from config import Config
 
 courses_bp = Blueprint('courses', __name__)
 
+'''
+Rendered JSON bodies of course reads, by (course_id, version, updated_at,
+view), so a course is only sanitized and serialized once per version.
+Entries are keyed by the version of the course they were rendered from;
+requests look them up with the version they read, so a write makes its
+previous entries unreachable and they age out of the cache.
+'''
+_rendered_courses = LRUCache(
+    max_entries=Config.RENDERED_COURSE_CACHE_SIZE,
+    max_bytes=Config.RENDERED_COURSE_CACHE_MAX_BYTES,
+    sizeof=len
+)
+
+'''
+Returns the cache key of a rendered course read.
+Args:
+    course_id (str): ID of the course.
+    view (str): The response, e.g. 'course' or 'sections'.
+    stamp (dict): The version and updated_at of the course, see
+    Course.get_version and Course.find_with_version.
+Returns:
+    tuple: The key.
+'''
+def _rendered_key(course_id, view, stamp):
+    return (str(course_id), stamp.get('version'), stamp.get('updated_at'), view)
+
+'''
+Returns the cached response of a course read.
+Args:
+    key (tuple): See _rendered_key.
+Returns:
+    Response: The response, or None if it is not cached.
+'''
+def _cached_course_response(key):
+    body = _rendered_courses.get(key)
+    if body is None:
+        return None
+    return current_app.response_class(body, mimetype=current_app.json.mimetype)
+
+'''
+Renders the response of a course read and caches its body.
+Args:
+    key (tuple): See _rendered_key, with the version of the rendered course.
+    payload (dict): The response data.
+Returns:
+    Response: The response.
+'''
+def _render_course_response(key, payload):
+    response = jsonify(payload)
+    _rendered_courses.set(key, response.get_data())
+    return response
+
 '''
 GET /api/courses
 - Returns a list of courses with optional filtering
 by category or title.
+- Courses are summarized unless 'view=full' is given.
 '''
 @courses_bp.route('', methods=['GET'])
 @yaml_from_file('docs/swagger/courses/get_courses.yaml')
@@ -29,36 +85,51 @@ def get_courses():
         skip = int(request.args.get('skip', 0))
         category = request.args.get('category', None)
         title = request.args.get('search', None)
+        view = request.args.get('view', 'summary')
+        after = request.args.get('cursor')
+
+        if view not in COURSE_LIST_VIEWS:
+            return jsonify({"error": "view must be 'summary' or 'full'"}), 400
 
+        cursor = None
         if category and title:
             # DONE: implemented
             courses = Course.find_by_category_and_title(
                 category=category,
                 title=title,
                 limit=limit,
-                skip=skip
+                skip=skip,
+                view=view
             )
         elif category:
             courses = Course.find_by_category(
                 category=category,
                 limit=limit,
-                skip=skip
+                skip=skip,
+                view=view
             )
         elif title:
             # DONE: implemented
             courses = Course.find_by_title(
                 title=title,
                 limit=limit,
-                skip=skip
+                skip=skip,
+                view=view
             )
         else:
-            courses = Course.find_all(limit, skip)
+            # Only the unfiltered list supports cursor pagination
+            courses = Course.find_all(limit, skip, view=view, after=after)
+            cursor = next_cursor(courses, SORT_BY_ID, limit)
         return jsonify({
             "courses": courses,
             "count": len(courses),
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": cursor
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -68,20 +139,34 @@ def get_courses():
 '''
 GET /api/courses/<course_id>
 - Returns the course details for the specified course ID.
+- Returns 304 if the If-None-Match or If-Modified-Since of the request
+  show that the client has the current version of the course.
 '''
 @courses_bp.route('/<course_id>', methods=['GET'])
 @yaml_from_file('docs/swagger/courses/get_course.yaml')
 def get_course(course_id):
     try:
 
-        course = Course.find_by_id(course_id)
-        if not course:
+        version = Course.get_version(course_id)
+        if version is None:
             return jsonify({"error": "Course not found"}), 404
-        course['_id'] = str(course['_id'])
-        
-        course = transform_sanitized_course(course_object=course)
+        validators = make_validators('course', course_id, version)
+        response = not_modified(validators)
+        if response is not None:
+            return response
+
+        response = _cached_course_response(_rendered_key(course_id, 'course', version))
+        if response is None:
+            course, stamp = Course.find_with_version(course_id, attach_blocks=True)
+            if not course:
+                return jsonify({"error": "Course not found"}), 404
+
+            course = transform_sanitized_course(course_object=course)
+            response = _render_course_response(
+                _rendered_key(course_id, 'course', stamp), {"course": course}
+            )
 
-        return jsonify({"course": course}), 200
+        return with_validators(response, validators), 200
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -99,8 +184,6 @@ def get_recommended_courses():
     try:
         user_id = get_jwt_identity()
 
-        manage_cooldown(user_id=user_id)
-        
         # Get personalized course recommendations
         recommended_courses = RecommendationService.get_course_recommendations(user_id)
 
@@ -128,6 +211,7 @@ def get_recommended_courses():
 '''
 GET /api/courses/popular
 - Returns a list of popular courses based on the specified limit and sort order.
+- Courses are summarized unless 'view=full' is given.
 '''
 @courses_bp.route('/popular', methods=['GET'], endpoint='get_popular_courses')
 @yaml_from_file('docs/swagger/courses/get_popular_courses.yaml')
@@ -137,9 +221,13 @@ def get_popular_courses():
         # Get query parameters
         limit = int(request.args.get('limit', 20))  # Default limit is 20
         sort = request.args.get('sort', 'popular')  # Default sort is "popular"
+        view = request.args.get('view', 'summary')  # Default view is "summary"
+
+        if view not in COURSE_LIST_VIEWS:
+            return jsonify({"error": "view must be 'summary' or 'full'"}), 400
 
         # Fetch popular courses based on the sort value
-        courses = Course.find_popular(limit=limit, sort=sort)
+        courses = Course.find_popular(limit=limit, sort=sort, view=view)
 
         # If no courses are found, return a 404 response
         if not courses:
@@ -169,6 +257,28 @@ def get_popular_courses():
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+'''
+GET /api/courses/cache-stats
+- Returns the counters of the course cache, of the rendered course
+  cache and of the compressed response cache of the worker that serves
+  the request (admin only).
+'''
+@courses_bp.route('/cache-stats', methods=['GET'], endpoint='get_course_cache_stats')
+@jwt_required()
+@admin_required
+@yaml_from_file('docs/swagger/courses/get_course_cache_stats_admin_only.yaml')
+def get_course_cache_stats():
+    try:
+        compressed = current_app.extensions.get('compression')
+        return jsonify({
+            "cache": Course.cache_stats(),
+            "rendered": _rendered_courses.stats(),
+            "compressed": compressed.stats() if compressed is not None else None
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 '''
 POST /api/courses
 - Creates a new course with the provided details.
@@ -223,23 +333,35 @@ def create_course():
 '''
 GET /api/courses/<course_id>/sections
 - Returns a list of sections for the specified course ID.
+- Returns 304 if the client has the current version of the course.
 '''
 @courses_bp.route('/<course_id>/sections', methods=['GET'])
 @yaml_from_file('docs/swagger/courses/get_course_sections.yaml')
 def get_course_sections(course_id):
     try:
 
-        course = Course.find_by_id(course_id)
-        
-        if not course:
+        version = Course.get_version(course_id)
+        if version is None:
             return jsonify({"error": "Course not found"}), 404
-        
-        sections = course.get('content', {}).get('sections', [])
-        
-        return jsonify({
-            "sections": sections,
-            "count": len(sections)
-        }), 200
+        validators = make_validators('sections', course_id, version)
+        response = not_modified(validators)
+        if response is not None:
+            return response
+
+        response = _cached_course_response(_rendered_key(course_id, 'sections', version))
+        if response is None:
+            course, stamp = Course.find_with_version(course_id, attach_blocks=True)
+
+            if not course:
+                return jsonify({"error": "Course not found"}), 404
+
+            sections = course.get('content', {}).get('sections', [])
+            response = _render_course_response(
+                _rendered_key(course_id, 'sections', stamp),
+                {"sections": sections, "count": len(sections)}
+            )
+
+        return with_validators(response, validators), 200
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -281,6 +403,51 @@ def add_course_section(course_id):
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+'''
+POST /api/courses/<course_id>/content
+- Appends sections, subsections and content data to the specified course.
+- Expects a JSON payload with a 'sections' content structure. Sections and
+  subsections that carry the ID of an existing one add their children to it.
+- Returns the appended nodes, with their IDs, or an error message.
+'''
+@courses_bp.route('/<course_id>/content', methods=['POST'])
+@jwt_required()
+@admin_required
+@validate_json('sections')
+@yaml_from_file('docs/swagger/courses/append_course_content_admin_only.yaml')
+def append_course_content(course_id):
+    try:
+        data = sanitize_input(request.get_json())
+
+        tree = ContentService.append_content(
+            course_id=course_id,
+            content_structure=data.get('sections')
+        )
+
+        if tree is None:
+            return jsonify({"error": "Course not found"}), 404
+
+        return jsonify({
+            "message": "Content appended successfully",
+            "sections": tree['sections'],
+            "sub_sections": [
+                {'section_id': section_id, 'sub_sections': sub_sections}
+                for section_id, sub_sections in tree['sub_sections']
+            ],
+            "data": [
+                {'section_id': section_id, 'subsection_id': subsection_id, 'data': data}
+                for section_id, subsection_id, data in tree['data']
+            ]
+        }), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except requests.RequestException as e:
+        return jsonify({'error': f'Network error: {str(e)}'}), 503
+
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 '''
 GET /api/courses/<course_id>/sections/<section_id>
 - Returns the details of a specific section for the specified course ID.
@@ -445,12 +612,21 @@ def delete_section(course_id, section_id):
 '''
 GET /api/courses/<course_id>/sections/<section_id>/subsections
 - Returns a list of subsections for the specified section ID.
+- Returns 304 if the client has the current version of the course.
 '''
 @courses_bp.route('/<course_id>/sections/<section_id>/subsections', methods=['GET'])
 @yaml_from_file('docs/swagger/courses/get_course_section_subsections.yaml')
 def get_subsections(course_id, section_id):
     try:
-            
+
+        version = Course.get_version(course_id)
+        if version is None:
+            return jsonify({"error": "Section not found"}), 404
+        validators = make_validators(f'subsections:{section_id}', course_id, version)
+        response = not_modified(validators)
+        if response is not None:
+            return response
+
         section = Course.get_section(course_id, section_id)
         
         if not section:
@@ -458,10 +634,10 @@ def get_subsections(course_id, section_id):
         
         subsections = section.get('sub_sections', [])
         
-        return jsonify({
+        return with_validators(jsonify({
             "subsections": subsections,
             "count": len(subsections)
-        }), 200
+        }), validators), 200
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -700,6 +876,132 @@ def delete_content_data(course_id, section_id, subsection_id, data_id):
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+'''
+PUT /api/courses/<course_id>/sections/order
+- Reorders the sections of a course in a single update.
+- Expects a JSON payload with 'section_order', a list of section_id and
+  order pairs, and optionally the 'updated_at' of the course being edited.
+- Returns the new outline of the course or an error message.
+'''
+@courses_bp.route('/<course_id>/sections/order', methods=['PUT'])
+@jwt_required()
+@admin_required
+@validate_json('section_order')
+@yaml_from_file('docs/swagger/courses/reorder_sections_admin_only.yaml')
+def reorder_sections(course_id):
+    try:
+        data = sanitize_input(request.get_json())
+
+        outline, error = ContentService.reorder_sections(
+            course_id=course_id,
+            section_order=data.get('section_order'),
+            updated_at=data.get('updated_at')
+        )
+
+        if error == "Course was modified, reload it and try again":
+            return jsonify({"error": error}), 409
+
+        if error in ("Course not found", "Section or subsection not found"):
+            return jsonify({"error": error}), 404
+
+        if error:
+            return jsonify({"error": error}), 400
+
+        return jsonify({
+            "message": "Sections reordered successfully",
+            **outline
+        }), 200
+    except requests.RequestException as e:
+        return jsonify({'error': f'Network error: {str(e)}'}), 503
+
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+'''
+PUT /api/courses/<course_id>/sections/<section_id>/subsections/order
+- Reorders the subsections of a section in a single update.
+- Expects a JSON payload with 'subsection_order', a list of subsection_id
+  and order pairs, and optionally the 'updated_at' of the course being edited.
+- Returns the new outline of the course or an error message.
+'''
+@courses_bp.route('/<course_id>/sections/<section_id>/subsections/order', methods=['PUT'])
+@jwt_required()
+@admin_required
+@validate_json('subsection_order')
+@yaml_from_file('docs/swagger/courses/reorder_subsections_admin_only.yaml')
+def reorder_subsections(course_id, section_id):
+    try:
+        data = sanitize_input(request.get_json())
+
+        outline, error = ContentService.reorder_subsections(
+            course_id=course_id,
+            section_id=section_id,
+            subsection_order=data.get('subsection_order'),
+            updated_at=data.get('updated_at')
+        )
+
+        if error == "Course was modified, reload it and try again":
+            return jsonify({"error": error}), 409
+
+        if error in ("Course not found", "Section or subsection not found"):
+            return jsonify({"error": error}), 404
+
+        if error:
+            return jsonify({"error": error}), 400
+
+        return jsonify({
+            "message": "Subsections reordered successfully",
+            **outline
+        }), 200
+    except requests.RequestException as e:
+        return jsonify({'error': f'Network error: {str(e)}'}), 503
+
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+'''
+PUT /api/courses/<course_id>/sections/<section_id>/subsections/<subsection_id>/content/order
+- Reorders the content data of a subsection in a single update.
+- Expects a JSON payload with 'data_order', a list of data_id and order
+  pairs, and optionally the 'updated_at' of the course being edited.
+- Returns the new outline of the course or an error message.
+'''
+@courses_bp.route('/<course_id>/sections/<section_id>/subsections/<subsection_id>/content/order', methods=['PUT'])
+@jwt_required()
+@admin_required
+@validate_json('data_order')
+@yaml_from_file('docs/swagger/courses/reorder_content_data_admin_only.yaml')
+def reorder_content_data(course_id, section_id, subsection_id):
+    try:
+        data = sanitize_input(request.get_json())
+
+        outline, error = ContentService.reorder_content_data(
+            course_id=course_id,
+            section_id=section_id,
+            subsection_id=subsection_id,
+            data_order=data.get('data_order'),
+            updated_at=data.get('updated_at')
+        )
+
+        if error == "Course was modified, reload it and try again":
+            return jsonify({"error": error}), 409
+
+        if error in ("Course not found", "Section or subsection not found"):
+            return jsonify({"error": error}), 404
+
+        if error:
+            return jsonify({"error": error}), 400
+
+        return jsonify({
+            "message": "Content data reordered successfully",
+            **outline
+        }), 200
+    except requests.RequestException as e:
+        return jsonify({'error': f'Network error: {str(e)}'}), 503
+
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 '''
 POST /api/courses/enroll
 - Enrolls the authenticated user in a course.
@@ -717,27 +1019,14 @@ def enroll_user_in_course():
         user_id = get_jwt_identity()
         course_id = data.get('course_id')
 
-        manage_cooldown(user_id=user_id)
-        
-        # Check if user's in_progress_courses length is 0
-        user = User.find_by_id(user_id)
+        # Enroll user in the given course, unless another one is in progress
+        enrollment, error = EnrollmentService.enroll(user_id=user_id, course_id=course_id)
 
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-        
-        if user.get('progress', {}).get('in_progress_courses', '') == course_id:
-            return jsonify({
-                "message": "User enrolled in course successfully"
-            }), 200
-        
-        if len(user.get('progress', {}).get('in_progress_courses', '')) > 0:
-            return jsonify({"error": "Complete your in-progress course firstly"}), 400
-        
-        # Enroll user in the given course
-        success = Course.enroll_user(course_id=course_id, user_id=user_id)
+        if error == "User not found":
+            return jsonify({"error": error}), 404
 
-        if not success:
-            return jsonify({"error": "Failed to enroll in course"}), 400
+        if error:
+            return jsonify({"error": error}), 400
         
         return jsonify({
             "message": "User enrolled in course successfully"
@@ -766,8 +1055,6 @@ def mark_course_as_completed():
         user_id = get_jwt_identity()
         course_id = data.get('course_id')
 
-        manage_cooldown(user_id=user_id)
-        
         # Mark the course as completed for the user
         success = Course.mark_course_as_completed(course_id=course_id, user_id=user_id)
         if not success:
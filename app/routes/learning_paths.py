@@ -2,11 +2,12 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import requests
 from app.models.learning_path import LearningPath
+from app.utils.pagination import next_cursor, SORT_BY_ID
 from app.services.recommendation import RecommendationService
 from app.utils.auth import admin_required
+from app.utils.conditional import make_validators, not_modified, with_validators
 from app.utils.validation import validate_json, sanitize_input
 from app.utils.swagger_utils import yaml_from_file
-from app.utils.cooldown_manager import manage_cooldown
 
 learning_paths_bp = Blueprint('learning_paths', __name__)
 
@@ -19,7 +20,6 @@ GET /api/learning_paths/recommended
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the learning paths, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the learning paths, returns an error message.
 '''
 @learning_paths_bp.route('/recommended', methods=['GET'])
@@ -30,8 +30,6 @@ def get_recommended_paths():
 
         user_id = get_jwt_identity()
 
-        manage_cooldown(user_id=user_id)
-        
         # Get personalized learning path recommendations
         recommended_paths = RecommendationService.get_learning_path_recommendations(user_id)
         
@@ -55,7 +53,6 @@ GET /api/learning_paths/<path_id>
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the learning path, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the learning path, returns an error message.
 '''
 @learning_paths_bp.route('/<path_id>', methods=['GET'])
@@ -63,14 +60,20 @@ GET /api/learning_paths/<path_id>
 def get_learning_path(path_id):
     try:
             
+        version = LearningPath.get_version(path_id)
+        if version is None:
+            return jsonify({"error": "Learning path not found"}), 404
+        validators = make_validators('learning_path', path_id, version)
+        response = not_modified(validators)
+        if response is not None:
+            return response
+
         path = LearningPath.find_by_id(path_id)
         
         if not path:
             return jsonify({"error": "Learning path not found"}), 404
         
-        path['_id'] = str(path['_id'])
-        
-        return jsonify(path), 200
+        return with_validators(jsonify(path), validators), 200
 
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
@@ -93,21 +96,26 @@ def get_learning_paths():
         limit = int(request.args.get('limit', 20))
         skip = int(request.args.get('skip', 0))
         skill = request.args.get('skill')
+        after = request.args.get('cursor')
         
+        cursor = None
         if skill is not None:
             paths = LearningPath.find_by_skill(skill=skill, limit=limit, skip=skip)
         else:
-            paths = LearningPath.find_all(limit=limit, skip=skip)
+            # Only the unfiltered list supports cursor pagination
+            paths = LearningPath.find_all(limit=limit, skip=skip, after=after)
+            cursor = next_cursor(paths, SORT_BY_ID, limit)
 
-        for path in paths:
-            path['_id'] = str(path['_id'])
-        
         return jsonify({
             "learning_paths": paths,
             "count": len(paths),
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": cursor
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -124,7 +132,6 @@ POST /api/learning_paths
 - Requires admin privileges.
 - If the user is not authenticated, returns an error message.
 - If the user does not have admin privileges, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the learning paths, returns an error message.
 '''
 @learning_paths_bp.route('', methods=['POST'])
@@ -166,7 +173,6 @@ PUT /api/learning_paths/<path_id>
 - Requires admin privileges.
 - If the user is not authenticated, returns an error message.
 - If the user does not have admin privileges, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the learning paths, returns an error message.
 '''
 @learning_paths_bp.route('/<path_id>', methods=['PUT'])
@@ -193,8 +199,6 @@ def update_learning_path(path_id):
         if not updated_path:
             return jsonify({"error": "Learning path not found"}), 404
         
-        updated_path['_id'] = str(updated_path['_id'])
-        
         return jsonify({
             "message": "Learning path updated successfully",
             "learning_path": updated_path
@@ -5,6 +5,7 @@ from app.utils.swagger_utils import yaml_from_file
 from app.models.question import Question
 from app.services.assessment import AssessmentService
 from app.services.question import QuestionService
+from app.utils.pagination import next_cursor, SORT_BY_NEWEST
 from app.utils.auth import admin_required
 from app.utils.validation import validate_json, sanitize_input
 
@@ -20,7 +21,6 @@ GET /api/questions/<question_id>
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the question, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the question, returns an error message.
 '''
 @questions_bp.route('/<question_id>', methods=['GET'])
@@ -127,7 +127,6 @@ GET /api/questions
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the questions, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the questions, returns an error message.
 '''
 @questions_bp.route('', methods=['GET'])
@@ -139,9 +138,10 @@ def get_questions():
             
         limit = int(request.args.get('limit', 20))
         skip = int(request.args.get('skip', 0))
+        after = request.args.get('cursor')
         
         # Get all questions with pagination
-        questions = QuestionService.find_all_questions(limit, skip)
+        questions = QuestionService.find_all_questions(limit, skip, after=after)
 
         if not questions:
             return jsonify({"error": "No questions found"}), 404
@@ -150,9 +150,13 @@ def get_questions():
             "questions": questions,
             "count": QuestionService.count_questions(),
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor(questions, SORT_BY_NEWEST, limit)
         }), 200
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -169,7 +173,6 @@ GET /api/questions/tags
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the questions, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the questions, returns an error message.
 '''
 @questions_bp.route('/tags', methods=['GET'])
@@ -213,7 +216,6 @@ GET /api/questions/assessment/<assessment_id>
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the assessment questions, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessment questions, returns an error message.
 '''
 @questions_bp.route('/assessment/<assessment_id>', methods=['GET'])
@@ -247,7 +249,6 @@ GET /api/questions/assessment/<assessment_id>/tags
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the assessment questions, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the assessment questions, returns an error message.
 '''
 @questions_bp.route('/assessment/<assessment_id>/tags', methods=['GET'])
@@ -296,7 +297,6 @@ POST /api/questions
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to create questions, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to create questions, returns an error message.
 '''
 @questions_bp.route('', methods=['POST'])
@@ -355,7 +355,6 @@ POST /api/questions/bulk/<assessment_id>
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to create questions, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to create questions, returns an error message.
 '''
 @questions_bp.route('/bulk/<assessment_id>', methods=['POST'])
@@ -422,7 +421,6 @@ PUT /api/questions/<question_id>
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to update questions, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to update questions, returns an error message.
 '''
 @questions_bp.route('/<question_id>', methods=['PUT'])
@@ -486,7 +484,6 @@ DELETE /api/questions/<question_id>
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to delete questions, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to delete questions, returns an error message.
 '''
 @questions_bp.route('/<question_id>', methods=['DELETE'])
@@ -563,7 +560,6 @@ DELETE /api/questions/<question_id>/assessment/<assessment_id>
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to remove questions from assessments, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to remove questions from assessments, returns an error message.
 '''
 @questions_bp.route('/<question_id>/assessment/<assessment_id>', methods=['DELETE'])
@@ -3,7 +3,6 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 import requests
 from app.services.recommendation import RecommendationService
 from app.utils.validation import validate_json, sanitize_input
-from app.utils.cooldown_manager import manage_cooldown
 from app.utils.swagger_utils import yaml_from_file
 
 recommendations_bp = Blueprint('recommendations', __name__)
@@ -23,15 +22,9 @@ def get_course_recommendations():
         user_id = get_jwt_identity()
         limit = int(request.args.get('limit', 4))
 
-        manage_cooldown(user_id=user_id)
-        
         # Get course recommendations
         recommended_courses = RecommendationService.get_course_recommendations(user_id, limit)
-        parsed_rec_cos =[]
-        if recommended_courses is not None and len(recommended_courses) > 0:
-            for rec_course in recommended_courses:
-                rec_course['_id'] = str(rec_course['_id'])
-                parsed_rec_cos.append(rec_course)
+        parsed_rec_cos = list(recommended_courses or [])
         
         return jsonify({
             "recommended_courses": parsed_rec_cos,
@@ -53,7 +46,6 @@ GET /api/recommendations/learning_paths
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the learning paths, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the learning paths, returns an error message.
 '''
 @recommendations_bp.route('/learning_paths', methods=['GET'])
@@ -65,8 +57,6 @@ def get_learning_path_recommendations():
         user_id = get_jwt_identity()
         limit = int(request.args.get('limit', 3))
 
-        manage_cooldown(user_id=user_id)
-                
         # Get learning path recommendations
         recommended_paths = RecommendationService.get_learning_path_recommendations(user_id, limit)
         
@@ -91,7 +81,6 @@ POST /api/recommendations/personalized
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the recommendations, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the recommendations, returns an error message.
 '''
 @recommendations_bp.route('/personalized', methods=['POST'])
@@ -104,8 +93,6 @@ def get_personalized_recommendations():
         data = sanitize_input(request.get_json() or {})
         limit = int(request.args.get('limit', 4))
 
-        manage_cooldown(user_id=user_id)
-        
         # Get personalized recommendations
         recommended_courses = RecommendationService.get_personalized_recommendations(
             user_id=user_id, preference_data=data, limit=limit
@@ -131,7 +118,6 @@ GET /api/recommendations/similar/<course_id>
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the similar courses, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the similar courses, returns an error message.
 '''
 @recommendations_bp.route('/similar/<course_id>', methods=['GET'])
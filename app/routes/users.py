@@ -3,9 +3,9 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 import requests
 from app.models.user import User
 from app.models.assessment import AssessmentResult
+from app.utils.pagination import next_cursor, SORT_BY_ID
 from app.utils.validation import validate_json, sanitize_input
 from app.utils.swagger_utils import yaml_from_file
-from app.utils.cooldown_manager import manage_cooldown
 from app.utils.auth import admin_required
 
 users_bp = Blueprint('users', __name__)
@@ -30,24 +30,28 @@ def get_all_users():
     try:
         limit = request.args.get('limit', 100)
         skip = request.args.get('skip', 0)
+        after = request.args.get('cursor')
 
-        users = User.find_all_users(limit=limit, skip=skip)
+        users = User.find_all_users(limit=limit, skip=skip, after=after)
 
         if not users:
             return jsonify({"error": "No users found"}), 404
         
         # Remove sensitive information
         for user in users:
-            user['_id'] = str(user['_id'])
             user.pop('password_hash', None)
 
         return jsonify({
             "users": users,
             "count": len(users),
             "limit": limit,
-            "skip": skip
+            "skip": skip,
+            "next_cursor": next_cursor(users, SORT_BY_ID, limit)
             }), 200
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except requests.RequestException as e:
         return jsonify({'error': f'Network error: {str(e)}'}), 503
 
@@ -64,7 +68,6 @@ GET /api/users/<user_id>
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the user information, returns an error message.
 - Admin role required.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the user information, returns an error message.
 '''
 @users_bp.route('/<user_id>', methods=['GET'])
@@ -122,7 +125,6 @@ GET /api/users/profile
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the profile, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the profile, returns an error message.
 '''
 @users_bp.route('/profile', methods=['GET'])
@@ -136,8 +138,6 @@ def get_profile():
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        manage_cooldown(user_id=user_id)
-        
         # Remove sensitive information
         user.pop('password_hash', None)
         
@@ -170,7 +170,6 @@ GET /api/users/cooldown
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the cooldown data, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the cooldown data, returns an error message.
 '''
 @users_bp.route('/cooldown', methods=['GET'])
@@ -179,8 +178,6 @@ GET /api/users/cooldown
 def get_cooldown():
     try:
         user_id = get_jwt_identity()
-        
-        manage_cooldown(user_id=user_id)
 
         user = User.find_by_id(user_id=user_id)
 
@@ -213,7 +210,6 @@ PUT /api/users/profile
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the profile, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the profile, returns an error message.
 '''
 @users_bp.route('/profile', methods=['PUT'])
@@ -225,8 +221,6 @@ def update_profile():
         user_id = get_jwt_identity()
         data = sanitize_input(request.get_json())
 
-        manage_cooldown(user_id=user_id)
-
         # Update user profile
         updated_user = User.update_profile(
             user_id=user_id,
@@ -262,7 +256,6 @@ GET /api/users/progress
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the progress information, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the progress information, returns an error message.
 '''
 @users_bp.route('/progress', methods=['GET'])
@@ -274,8 +267,6 @@ def get_progress():
         user_id = get_jwt_identity()
         user = User.find_by_id(user_id)
 
-        manage_cooldown(user_id=user_id)
-        
         if not user:
             return jsonify({"error": "User not found"}), 404
         
@@ -327,7 +318,6 @@ PUT /api/users/progress
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the progress information, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the progress information, returns an error message.
 '''
 @users_bp.route('/progress', methods=['PUT'])
@@ -343,8 +333,6 @@ def update_progress():
         user_id = get_jwt_identity()
         data = sanitize_input(request.get_json())
 
-        manage_cooldown(user_id=user_id)
-
         progress_data = {
             'course_id': data.get('course_id'),
             'percentage': data.get('percentage', 0),
@@ -381,7 +369,6 @@ GET /api/users/preferences
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the preferences, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the preferences, returns an error message.
 '''
 @users_bp.route('/preferences', methods=['GET'])
@@ -392,8 +379,6 @@ def get_preferences():
         user_id = get_jwt_identity()
         user = User.find_by_id(user_id)
 
-        manage_cooldown(user_id=user_id)
-        
         if not user:
             return jsonify({"error": "User not found"}), 404
         
@@ -427,7 +412,6 @@ PUT /api/users/preferences
 - Requires user authentication.
 - If the user is not authenticated, returns an error message.
 - If the user does not have access to the preferences, returns an error message.
-- If the user is authenticated, manages cooldown for the user.
 - If the user does not have access to the preferences, returns an error message.
 '''
 @users_bp.route('/preferences', methods=['PUT'])
@@ -439,8 +423,6 @@ def update_preferences():
         user_id = get_jwt_identity()
         data = sanitize_input(request.get_json())
 
-        manage_cooldown(user_id=user_id)
-        
         # Update user preferences
         updated_user = User.update_preferences(user_id, data)
         
@@ -1,8 +1,9 @@
 from dateutil import parser
 from datetime import datetime, timedelta, timezone
 from app import db
-from app.models.assessment import Assessment, AssessmentResult
+from app.models.assessment import Assessment, AssessmentResult, AnswerKey
 from app.models.question import Question
+from app.models.user import User
 from app.models.concept_link import ConceptLinks
 from app.utils.validation import html_tags_unconverter
 from config import Config
@@ -83,35 +84,27 @@ class AssessmentService:
         - knowledge_gaps: list of concepts the user needs to improve on
         - demonstrated_strengths: list of concepts the user has demonstrated proficiency in
         """
-        assessment = Assessment.find_by_id(assessment_id)
-        if not assessment:
+        # The compiled answer key is served from memory on a cache hit
+        answer_key = AnswerKey.get(assessment_id)
+        if not answer_key:
             return None
-        questions = assessment.get('questions', [])
-        total_questions = len(questions)
+        correct_keys = answer_key['correct_answers']
+        total_questions = len(correct_keys)
         correct_answers = 0
-        knowledge_gaps = []
-        demonstrated_strengths = []
-        for i, question in enumerate(questions):
-            # find the question
-            question = Question.find_by_id(question_id=question)
-            if i < len(answers) and answers[i] == question.get('correct_answer'):
+        knowledge_gaps = set()
+        demonstrated_strengths = set()
+        for i, tags in enumerate(answer_key['tags']):
+            if i in answer_key['missing']:
+                continue
+            if i < len(answers) and answers[i] == correct_keys[i]:
                 correct_answers += 1
-                demonstrated_strengths.extend(question.get('tags', []))
+                demonstrated_strengths.update(tags)
             else:
-                knowledge_gaps.extend(question.get('tags', []))
-        
-        # Remove duplicates
-        knowledge_gaps = list(
-            set(
-                [html_tags_unconverter(kw_gap) for kw_gap in knowledge_gaps]
-            )
-        )
-        
-        demonstrated_strengths = list(
-            set(
-                [html_tags_unconverter(ds) for ds in demonstrated_strengths]
-            )
-        )
+                knowledge_gaps.update(tags)
+
+        # The tags of the answer key are already unescaped
+        knowledge_gaps = list(knowledge_gaps)
+        demonstrated_strengths = list(demonstrated_strengths)
         
         score = correct_answers / total_questions if total_questions > 0 else 0
         passed = score >= Config.ASSESSMENT_PASS_THRESHOLD
@@ -150,7 +143,9 @@ class AssessmentService:
         if not result:
             return None, "Assessment not found"
         
-        questions = [Question.find_by_id(question_id) for question_id in questions_id]
+        # Scoring only reads the answer key, so this is the one read of
+        # the questions themselves, a single query through the loader
+        questions = Question.loader().load_many(questions_id)
 
         # Store the result
         assessment_result = AssessmentResult.create(
@@ -164,6 +159,8 @@ class AssessmentService:
             started_at=parser.isoparse(started_at).isoformat(),
             questions=questions,
         )
+        # The result changes the knowledge gaps the user is recommended for
+        User.invalidate_recommendations(user_id)
         
         return assessment_result, None
 
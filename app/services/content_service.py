@@ -1,4 +1,165 @@
+from copy import deepcopy
+from bson import ObjectId
+from app.models.content_block import ContentBlock, CONTENT_STORAGE_BLOCKS
 from app.models.course import Course
+from app.utils.content_index import build_content_index
+from app.utils.validation import validate_content_structure
+
+# Fields of the content data in an outline, see ContentService.outline
+OUTLINE_DATA_FIELDS = ('data_id', 'type', 'order')
+
+'''
+ContentTreeBuilder class for preparing course content in memory.
+It assigns the IDs and orders of sections, subsections and content data
+the same way Course.add_section, add_subsection and add_content_data do,
+so a whole tree can be persisted with a single write instead of one
+read and one update per node.
+A content structure is a list of sections, each with optional
+sub_sections, each with an optional data list (see
+validate_content_structure). When the builder is given the existing
+sections of a course, a section or subsection of the structure that
+carries a section_id or subsection_id refers to that existing node, and
+only its children are appended.
+'''
+class ContentTreeBuilder:
+    '''
+    Args:
+        existing_sections (list, optional): The content.sections of the
+        course the structure is appended to. Omitted for a new course.
+    '''
+    def __init__(self, existing_sections=None):
+        self._sections = {
+            section.get('section_id'): section
+            for section in existing_sections or []
+        }
+        self._section_order = self._max_order(existing_sections or [])
+
+    '''
+    Builds the nodes of a content structure.
+    Args:
+        content_structure (list): The sections to build.
+    Returns:
+        dict: The nodes to persist, with
+        - sections: the new sections, with their subsections and data
+        - sub_sections: the new subsections of existing sections, as
+          (section_id, list of subsections) pairs
+        - data: the new content data of existing subsections, as
+          (section_id, subsection_id, list of data objects) tuples
+    Raises:
+        ValueError: If the structure is invalid or refers to a section
+        or subsection that does not exist.
+    '''
+    def build(self, content_structure):
+        structure = self._resolve_titles(content_structure)
+        if not validate_content_structure(structure):
+            raise ValueError("Invalid content structure")
+
+        tree = {'sections': [], 'sub_sections': [], 'data': []}
+        for section_data in structure:
+            section_id = section_data.get('section_id')
+            if section_id is None:
+                tree['sections'].append(self._new_section(section_data))
+                continue
+
+            section = self._sections[section_id]
+            existing_subsections = {
+                subsection.get('subsection_id'): subsection
+                for subsection in section.get('sub_sections', [])
+            }
+            new_subsections = []
+            subsection_order = self._max_order(section.get('sub_sections', []))
+            for subsection_data in section_data.get('sub_sections', []):
+                subsection_id = subsection_data.get('subsection_id')
+                if subsection_id is None:
+                    order, subsection_order = self._order(subsection_data, subsection_order)
+                    new_subsections.append(self._new_subsection(subsection_data, order))
+                    continue
+                subsection = existing_subsections[subsection_id]
+                data = self._new_data(
+                    subsection_data.get('data', []),
+                    self._max_order(subsection.get('data', []))
+                )
+                if data:
+                    tree['data'].append((section_id, subsection_id, data))
+            if new_subsections:
+                tree['sub_sections'].append((section_id, new_subsections))
+        return tree
+
+    def _resolve_titles(self, content_structure):
+        # References to existing nodes may leave out the title, which
+        # validate_content_structure requires
+        if not isinstance(content_structure, list):
+            return content_structure
+        structure = deepcopy(content_structure)
+        for section_data in structure:
+            if not isinstance(section_data, dict) or 'section_id' not in section_data:
+                continue
+            section = self._sections.get(section_data['section_id'])
+            if section is None:
+                raise ValueError(f"Section {section_data['section_id']} not found")
+            section_data.setdefault('title', section.get('title'))
+            subsections = {
+                subsection.get('subsection_id'): subsection
+                for subsection in section.get('sub_sections', [])
+            }
+            sub_sections = section_data.get('sub_sections')
+            if not isinstance(sub_sections, list):
+                continue
+            for subsection_data in sub_sections:
+                if not isinstance(subsection_data, dict) or 'subsection_id' not in subsection_data:
+                    continue
+                subsection = subsections.get(subsection_data['subsection_id'])
+                if subsection is None:
+                    raise ValueError(
+                        f"Subsection {subsection_data['subsection_id']} not found"
+                    )
+                subsection_data.setdefault('title', subsection.get('title'))
+        return structure
+
+    def _new_section(self, section_data):
+        order, self._section_order = self._order(section_data, self._section_order)
+        sub_sections = []
+        subsection_order = 0
+        for subsection_data in section_data.get('sub_sections', []):
+            subsection_data_order, subsection_order = self._order(subsection_data, subsection_order)
+            sub_sections.append(self._new_subsection(subsection_data, subsection_data_order))
+        return {
+            'section_id': str(ObjectId()),
+            'title': section_data.get('title'),
+            'order': order,
+            'sub_sections': sub_sections
+        }
+
+    def _new_subsection(self, subsection_data, order):
+        return {
+            'subsection_id': str(ObjectId()),
+            'title': subsection_data.get('title'),
+            'order': order,
+            'data': self._new_data(subsection_data.get('data', []), 0)
+        }
+
+    def _new_data(self, data_objects, max_order):
+        data = []
+        for data_object in data_objects:
+            data_object = dict(data_object)
+            data_object['order'], max_order = self._order(data_object, max_order)
+            data_object['data_id'] = str(ObjectId())
+            data.append(data_object)
+        return data
+
+    @staticmethod
+    def _order(node, current_max):
+        # An explicit order is kept, otherwise the node goes last.
+        # Returns the order of the node and the new highest order.
+        order = node.get('order')
+        if not isinstance(order, int):
+            order = current_max + 1
+        return order, max(current_max, order)
+
+    @staticmethod
+    def _max_order(nodes):
+        return max([node.get('order') for node in nodes
+                    if isinstance(node.get('order'), int)] + [0])
 
 
 '''
@@ -17,7 +178,8 @@ class ContentService:
     description, category, and optional prerequisites.
     It also allows for the addition of a predefined content structure,
     which includes sections, subsections, and content data.
-    The content structure must be validated before being passed to this method.
+    The content structure is built in memory by ContentTreeBuilder and
+    inserted along with the course, in a single write.
     The method returns the created course object.
     Args:
         title (str): Course title
@@ -33,7 +195,12 @@ class ContentService:
     @staticmethod
     def create_course_with_content(title, description, category, prerequisites=None,
                                    content_structure=None, difficulty=None, tags=None):
-        # Create the course with basic structure
+        sections = []
+        # If content structure is provided, build its sections, subsections, and content
+        if content_structure and isinstance(content_structure, list):
+            sections = ContentTreeBuilder().build(content_structure)['sections']
+
+        # Create the course along with its content
         course = Course.create(
             title=title,
             description=description,
@@ -41,42 +208,46 @@ class ContentService:
             prerequisites=prerequisites or [],
             difficulty=difficulty,
             tags=tags or [],
+            sections=sections,
         )
-        
-        # If content structure is provided, populate the course with sections, subsections, and content
-        if content_structure and isinstance(content_structure, list):
-            for section_data in content_structure:
-                # Add section
-                section_id = Course.add_section(
-                    course_id=course['_id'],
-                    title=section_data.get('title'),
-                    order=section_data.get('order')
-                )
-                
-                # Add subsections
-                for subsection_data in section_data.get('sub_sections', []):
-                    subsection_id = Course.add_subsection(
-                        course_id=course['_id'],
-                        section_id=section_id,
-                        title=subsection_data.get('title'),
-                        order=subsection_data.get('order')
-                    )
-                    
-                    # Add content data
-                    for data_obj in subsection_data.get('data', []):
-                        Course.add_content_data(
-                            course_id=course['_id'],
-                            section_id=section_id,
-                            subsection_id=subsection_id,
-                            data_object=data_obj
-                        )
-        course['_id'] = str(course['_id'])
         return course
     
+    '''
+    This method appends a content structure to an existing course.
+    Sections without a section_id are added to the course. A section
+    with the section_id of an existing section only adds its
+    sub_sections to it, and likewise a subsection with an existing
+    subsection_id only adds its data. The whole structure is applied
+    with one read of the course's sections and one bulk write.
+    Args:
+        course_id (str): The ID of the course
+        content_structure (list): The sections to append
+    Returns:
+        dict: The appended nodes (see ContentTreeBuilder.build), or None
+        if the course does not exist
+    Raises:
+        ValueError: If the content structure is invalid
+    '''
+    @staticmethod
+    def append_content(course_id, content_structure):
+        content = Course.get_sections_with_version(course_id)
+        if content is None:
+            return None
+        existing_sections, _, storage = content
+        if storage == CONTENT_STORAGE_BLOCKS:
+            # The orders of the blocks, so new data goes after them
+            ContentBlock.attach(course_id, existing_sections, fields=('data_id', 'order'))
+
+        tree = ContentTreeBuilder(existing_sections).build(content_structure)
+        if not Course.append_content(course_id, tree, storage):
+            return None
+        return tree
+
     '''
     This method retrieves the full content structure of a course.
     It returns a dictionary containing the sections, subsections,
-    and content data of the course.
+    and content data of the course, with the content blocks of a course
+    that stores blocks.
     Args:
         course_id (str): The ID of the course
     Returns:
@@ -84,98 +255,187 @@ class ContentService:
     '''
     @staticmethod
     def get_course_content_structure(course_id):
-        course = Course.find_by_id(course_id)
+        course, _ = Course.find_with_version(course_id, attach_blocks=True)
         if not course:
             return None
-        
+
         return course.get('content', {'sections': []})
     
+    # Attempts of a reorder without a precondition from the client,
+    # when concurrent updates keep moving the course under it
+    REORDER_ATTEMPTS = 3
+
     '''
-    This method allows for the reordering of sections, subsections,
-    and content data within a course.
-    It takes the course ID, section ID, subsection ID, and a list
-    of dictionaries containing the IDs and new order values.
-    The method updates the order of the specified sections,
-    subsections, or content data in the course.
+    This method reorders the sections of a course.
+    The new order is computed from the sections read once, and the
+    reordered array is written back with a single update, guarded by the
+    course's updated_at so that a concurrent edit is never overwritten.
+    Sections that are not listed keep their order. The array is sorted
+    by order, so reads return the sections in order.
     Args:
         course_id (str): The ID of the course
-        section_id (str): The ID of the section
-        subsection_id (str): The ID of the subsection
-        data_order (list): List of dictionaries with data_id and new order
+        section_order (list): List of dictionaries with section_id and new order
+        updated_at (str, optional): updated_at of the course the client
+        edited. If the course changed since, nothing is written.
     Returns:
-        bool: Success status
+        tuple: (outline, None) if successful, where outline holds the
+        course's updated_at and sections (see ContentService.outline),
+        else (None, error message)
     '''
     @staticmethod
-    def reorder_sections(course_id, section_order):
-        course = Course.find_by_id(course_id)
-        if not course:
-            return False
-        
-        for order_item in section_order:
-            Course.update_section(
-                course_id=course_id,
-                section_id=order_item.get('section_id'),
-                update_data={'order': order_item.get('order')}
-            )
-        
-        return True
-    
+    def reorder_sections(course_id, section_order, updated_at=None):
+        return ContentService._reorder(
+            course_id, section_order, 'section_id', updated_at,
+            lambda sections: ('content.sections', sections)
+        )
+
     '''
-    This method allows for the reordering of subsections within a section.
-    It takes the course ID, section ID, and a list of dictionaries
-    containing the subsection IDs and new order values.
-    The method updates the order of the specified subsections
-    in the section.
+    This method reorders the subsections of a section, the same way
+    reorder_sections reorders sections.
     Args:
         course_id (str): The ID of the course
         section_id (str): The ID of the section
         subsection_order (list): List of dictionaries with subsection_id and new order
+        updated_at (str, optional): updated_at of the course the client edited
     Returns:
-        bool: Success status
+        tuple: (outline, None) if successful, else (None, error message)
     '''
     @staticmethod
-    def reorder_subsections(course_id, section_id, subsection_order):
-        section = Course.get_section(course_id, section_id)
-        if not section:
-            return False
-        
-        for order_item in subsection_order:
-            Course.update_subsection(
-                course_id=course_id,
-                section_id=section_id,
-                subsection_id=order_item.get('subsection_id'),
-                update_data={'order': order_item.get('order')}
-            )
-        
-        return True
-    
+    def reorder_subsections(course_id, section_id, subsection_order, updated_at=None):
+        def locate(sections):
+            for i, section in enumerate(sections):
+                if section.get('section_id') == section_id:
+                    return f'content.sections.{i}.sub_sections', section.get('sub_sections', [])
+            return None
+
+        return ContentService._reorder(
+            course_id, subsection_order, 'subsection_id', updated_at, locate
+        )
+
     '''
-    This method allows for the reordering of content data within a subsection.
-    It takes the course ID, section ID, subsection ID, and a list
-    of dictionaries containing the content data IDs and new order values.
-    The method updates the order of the specified content data
-    in the subsection.
+    This method reorders the content data of a subsection, the same way
+    reorder_sections reorders sections.
     Args:
         course_id (str): The ID of the course
         section_id (str): The ID of the section
         subsection_id (str): The ID of the subsection
         data_order (list): List of dictionaries with data_id and new order
+        updated_at (str, optional): updated_at of the course the client edited
     Returns:
-        bool: Success status
+        tuple: (outline, None) if successful, else (None, error message)
     '''
     @staticmethod
-    def reorder_content_data(course_id, section_id, subsection_id, data_order):
-        subsection = Course.get_subsection(course_id, section_id, subsection_id)
-        if not subsection:
-            return False
-        
-        for order_item in data_order:
-            Course.update_content_data(
-                course_id=course_id,
-                section_id=section_id,
-                subsection_id=subsection_id,
-                data_id=order_item.get('data_id'),
-                update_data={'order': order_item.get('order')}
-            )
-        
-        return True
+    def reorder_content_data(course_id, section_id, subsection_id, data_order, updated_at=None):
+        def locate(sections):
+            for i, section in enumerate(sections):
+                if section.get('section_id') != section_id:
+                    continue
+                for j, subsection in enumerate(section.get('sub_sections', [])):
+                    if subsection.get('subsection_id') == subsection_id:
+                        return (
+                            f'content.sections.{i}.sub_sections.{j}.data',
+                            subsection.get('data', [])
+                        )
+            return None
+
+        return ContentService._reorder(
+            course_id, data_order, 'data_id', updated_at, locate
+        )
+
+    '''
+    This method returns the outline of a course's content: its sections
+    and subsections, and the id, type and order of each content data,
+    without the content itself.
+    Args:
+        sections (list): The content sections of the course
+    Returns:
+        list: The outline of the sections
+    '''
+    @staticmethod
+    def outline(sections):
+        return [
+            {
+                'section_id': section.get('section_id'),
+                'title': section.get('title'),
+                'order': section.get('order'),
+                'sub_sections': [
+                    {
+                        'subsection_id': subsection.get('subsection_id'),
+                        'title': subsection.get('title'),
+                        'order': subsection.get('order'),
+                        'data': [
+                            {
+                                'data_id': data.get('data_id'),
+                                'type': data.get('type'),
+                                'order': data.get('order'),
+                            }
+                            for data in subsection.get('data', [])
+                        ],
+                    }
+                    for subsection in section.get('sub_sections', [])
+                ],
+            }
+            for section in sections
+        ]
+
+    @staticmethod
+    def _reorder(course_id, order_items, id_field, expected_updated_at, locate):
+        if not isinstance(order_items, list) or not all(
+            isinstance(item, dict) and item.get(id_field) and isinstance(item.get('order'), int)
+            for item in order_items
+        ):
+            return None, f"Each item must have a {id_field} and an integer order"
+        new_orders = {item[id_field]: item['order'] for item in order_items}
+
+        attempts = 1 if expected_updated_at else ContentService.REORDER_ATTEMPTS
+        for _ in range(attempts):
+            content = Course.get_sections_with_version(course_id)
+            if content is None:
+                return None, "Course not found"
+            sections, updated_at, storage = content
+            if expected_updated_at and expected_updated_at != updated_at:
+                return None, "Course was modified, reload it and try again"
+            # The content data of such a course is in its blocks, which are
+            # reordered instead of an array of the course
+            reorder_blocks = storage == CONTENT_STORAGE_BLOCKS and id_field == 'data_id'
+            if reorder_blocks:
+                ContentBlock.attach(course_id, sections, fields=OUTLINE_DATA_FIELDS)
+
+            target = locate(sections)
+            if target is None:
+                return None, "Section or subsection not found"
+            path, nodes = target
+            unknown = set(new_orders) - {node.get(id_field) for node in nodes}
+            if unknown:
+                return None, f"Unknown {id_field}: {', '.join(sorted(unknown))}"
+
+            for node in nodes:
+                if node.get(id_field) in new_orders:
+                    node['order'] = new_orders[node.get(id_field)]
+            # Stable sort, nodes without an order stay last
+            nodes.sort(key=lambda node: (node.get('order') is None, node.get('order') or 0))
+
+            if reorder_blocks:
+                # The blocks are written before the course version moves,
+                # so no read caches the previous order under the new one
+                ContentBlock.set_orders(
+                    course_id, {node[id_field]: node['order'] for node in nodes}
+                )
+                new_updated_at = Course.touch(course_id, updated_at)
+                if new_updated_at is None:
+                    # Another write came in between, the new orders are
+                    # stored all the same and must not be cached as older
+                    new_updated_at = Course.touch(course_id)
+            else:
+                new_updated_at = Course.set_content_array(
+                    course_id, path, nodes, updated_at, build_content_index(sections)
+                )
+                if new_updated_at is not None and storage == CONTENT_STORAGE_BLOCKS:
+                    ContentBlock.attach(course_id, sections, fields=OUTLINE_DATA_FIELDS)
+            if new_updated_at is not None:
+                # nodes is part of sections, which now mirror the stored tree
+                return {
+                    'updated_at': new_updated_at,
+                    'sections': ContentService.outline(sections),
+                }, None
+        return None, "Course was modified, reload it and try again"
@@ -0,0 +1,125 @@
+import numpy as np
+from scipy import sparse
+from app.models.course_similarity import CourseSimilarity
+from app.models.user import User
+
+# How the co-enrollment counts are normalized into scores
+SIMILARITY_METRICS = ('cosine', 'jaccard')
+
+'''
+CourseSimilarityService class for the item-item similarity of courses,
+the basis of collaborative recommendations.
+Two courses are similar when the same users take them. The courses each
+user completed or is taking form a sparse users x courses matrix X of
+ones, so X.T @ X counts, for every pair of courses, the users who took
+both, and its diagonal the users who took each course. The counts are
+normalized into scores:
+- cosine: n(a, b) / sqrt(n(a) * n(b))
+- jaccard: n(a, b) / (n(a) + n(b) - n(a, b))
+Only the top_k neighbors of each course are kept. Building reads every
+user, so it runs offline, see `flask recommendations build-similarities`.
+'''
+class CourseSimilarityService:
+    '''
+    Computes the nearest neighbors of every course.
+    Args:
+        user_courses (iterable): The set of course IDs of each user.
+        metric (str): 'cosine' or 'jaccard'.
+        top_k (int): Number of neighbors kept per course.
+    Returns:
+        dict: The neighbors of each course taken with another one, by
+        course ID, most similar first, each a dict with course_id, score
+        and support, the number of users who took both courses.
+    Raises:
+        ValueError: If the metric is unknown.
+    '''
+    @staticmethod
+    def compute(user_courses, metric='cosine', top_k=20):
+        """Compute the nearest neighbors of every course"""
+        if metric not in SIMILARITY_METRICS:
+            raise ValueError(f'Unknown similarity metric: {metric}')
+
+        columns = {}
+        rows = []
+        cols = []
+        users = 0
+        for courses in user_courses:
+            for course_id in courses:
+                rows.append(users)
+                cols.append(columns.setdefault(course_id, len(columns)))
+            users += 1
+        if not columns:
+            return {}
+
+        taken = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+            shape=(users, len(columns))
+        )
+        # A course listed twice for a user still counts once
+        taken.data[:] = 1.0
+
+        co_enrollments = (taken.T @ taken).tocsr()
+        counts = co_enrollments.diagonal()
+        co_enrollments.setdiag(0)
+        co_enrollments.eliminate_zeros()
+        co_enrollments.sort_indices()
+
+        course_ids = [None] * len(columns)
+        for course_id, column in columns.items():
+            course_ids[column] = course_id
+
+        neighbors = {}
+        for row in range(len(course_ids)):
+            start, end = co_enrollments.indptr[row], co_enrollments.indptr[row + 1]
+            if start == end:
+                continue
+            others = co_enrollments.indices[start:end]
+            support = co_enrollments.data[start:end]
+            if metric == 'cosine':
+                scores = support / np.sqrt(counts[row] * counts[others])
+            else:
+                scores = support / (counts[row] + counts[others] - support)
+
+            if len(scores) > top_k:
+                # Every course scoring at least the top_k-th best one, so
+                # ties at the cut are broken below as well
+                cut = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+                best = np.flatnonzero(scores >= cut)
+            else:
+                best = np.arange(len(scores))
+            # Highest score first, ties by support, then by column
+            best = best[np.lexsort((others[best], -support[best], -scores[best]))][:top_k]
+            neighbors[course_ids[row]] = [
+                {
+                    'course_id': course_ids[others[i]],
+                    'score': float(scores[i]),
+                    'support': int(support[i]),
+                }
+                for i in best
+            ]
+        return neighbors
+
+    '''
+    Builds the neighbors of every course from the progress of every user
+    and replaces the stored ones.
+    Args:
+        metric (str): 'cosine' or 'jaccard'.
+        top_k (int): Number of neighbors kept per course.
+        batch_size (int): Number of users read, and of courses written,
+        per round trip.
+    Returns:
+        tuple: (int, None) with the number of courses written if
+        successful, else (None, error message).
+    '''
+    @staticmethod
+    def build(metric='cosine', top_k=20, batch_size=1000):
+        """Build the neighbors of every course"""
+        if metric not in SIMILARITY_METRICS:
+            return None, f'Unknown similarity metric: {metric}'
+        if top_k < 1:
+            return None, 'top_k must be at least 1'
+
+        neighbors = CourseSimilarityService.compute(
+            User.iter_taken_courses(batch_size=batch_size), metric=metric, top_k=top_k
+        )
+        return CourseSimilarity.replace_all(neighbors, metric, batch_size=batch_size), None
@@ -0,0 +1,64 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from app.models.course import Course
+from app.models.enrollment import Enrollment
+from app.models.user import User
+
+'''
+Service class for enrolling users in courses.
+A first enrollment reads the course once and makes two conditional
+writes, whose results tell whether they took effect, so it never reads
+a document back:
+- the user starts the course, unless a course is in progress
+- the enrollment is upserted, which tells whether it is new
+The enrollment_count of the course is only incremented for a new one,
+and is added to the course later, see Course.increment_enrollment_count.
+Enrolling again in the same course leaves the user, and thus their
+recommendations, and the count unchanged.
+'''
+class EnrollmentService:
+    '''
+    Enrolls a user in a course.
+    Args:
+        user_id (str): The user's ID.
+        course_id (str): The course's ID.
+    Returns:
+        tuple: (dict, None) with course_id, user_id and created (whether
+        the enrollment is new) if successful, else (None, error message).
+    '''
+    @staticmethod
+    def enroll(user_id, course_id):
+        """
+        Enrolls a user in a course
+        - Checks that the course exists
+        - Sets the course in progress for the user
+        - Creates the enrollment if the user is not enrolled yet
+        - Counts a new enrollment in the enrollment count of the course
+        """
+        try:
+            course_id = str(ObjectId(course_id))
+        except (InvalidId, TypeError):
+            return None, "Course not found"
+
+        # Also refuses enrolling again in a course deleted since
+        if Course.get_version(course_id) is None:
+            return None, "Course not found"
+
+        if User.start_course(user_id, course_id) is None:
+            # Only read when the course was not started, to tell why
+            user = User.find_by_id(user_id)
+            if user is None:
+                return None, "User not found"
+            in_progress = (user.get('progress') or {}).get('in_progress_courses')
+            if in_progress != course_id:
+                return None, "Complete your in-progress course firstly"
+
+        created = Enrollment.enroll(course_id, user_id)
+        if created:
+            Course.increment_enrollment_count(course_id)
+
+        return {
+            'course_id': course_id,
+            'user_id': str(user_id),
+            'created': created,
+        }, None
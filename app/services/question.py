@@ -2,7 +2,7 @@ from datetime import datetime, timezone
 from bson import ObjectId
 from app import db
 from app.models.question import Question
-from app.models.assessment import Assessment, AssessmentResult
+from app.models.assessment import Assessment, AssessmentResult, AnswerKey
 from app.utils.validation import html_tags_converter, html_tags_unconverter
 from config import Config
 
@@ -49,9 +49,7 @@ class QuestionService:
 
         if question is not None:
             for k, v in question.items():
-                if k == '_id':
-                    question[k] = str(v)
-                elif k == 'correct_answer' or k == 'question_text':
+                if k == 'correct_answer' or k == 'question_text':
                     question[k] = html_tags_unconverter(v)
                 elif k == 'options' or k == 'tags':
                     question[k] = [html_tags_unconverter(option) for option in v]
@@ -77,9 +75,7 @@ class QuestionService:
         if questions is not None or len(questions) > 0:
             for question in questions:
                 for k, v in question.items():
-                    if k == '_id':
-                        question[k] = str(v)
-                    elif k == 'correct_answer' or k == 'question_text':
+                    if k == 'correct_answer' or k == 'question_text':
                         question[k] = html_tags_unconverter(v)
                     elif k == 'options' or k == 'tags':
                         question[k] = [html_tags_unconverter(option) for option in v]
@@ -105,9 +101,7 @@ class QuestionService:
         if questions is not None or len(questions) > 0:
             for question in questions:
                 for k, v in question.items():
-                    if k == '_id':
-                        question[k] = str(v)
-                    elif k == 'correct_answer' or k == 'question_text':
+                    if k == 'correct_answer' or k == 'question_text':
                         question[k] = html_tags_unconverter(v)
                     elif k == 'options' or k == 'tags':
                         question[k] = [html_tags_unconverter(option) for option in v]
@@ -131,9 +125,7 @@ class QuestionService:
         if len(questions) > 0:
             for question in questions:
                 for k, v in question.items():
-                    if k == '_id':
-                        question[k] = str(v)
-                    elif k == 'correct_answer' or k == 'question_text':
+                    if k == 'correct_answer' or k == 'question_text':
                         question[k] = html_tags_unconverter(v)
                     elif k == 'options' or k == 'tags':
                         question[k] = [html_tags_unconverter(option) for option in v]
@@ -146,20 +138,19 @@ class QuestionService:
     Args:
         limit (int, optional): Maximum number of questions to return.
         skip (int, optional): Number of questions to skip.
+        after (str, optional): Cursor of the previous page.
     Returns:
-        list: List of question objects.
+        list: List of question objects, newest first.
     '''
     @staticmethod
-    def find_all_questions(limit=20, skip=0):
+    def find_all_questions(limit=20, skip=0, after=None):
         """Find all questions with pagination"""
-        questions = Question.find_all(limit, skip)
+        questions = Question.find_all(limit, skip, after=after)
         
         if questions is not None or len(questions) > 0:
             for question in questions:
                 for k, v in question.items():
-                    if k == '_id':
-                        question[k] = str(v)
-                    elif k == 'correct_answer' or k == 'question_text':
+                    if k == 'correct_answer' or k == 'question_text':
                         question[k] = html_tags_unconverter(v)
                     elif k == 'options' or k == 'tags':
                         question[k] = [html_tags_unconverter(option) for option in v]
@@ -190,9 +181,11 @@ class QuestionService:
         """Update a question and replace it in the assessment result if it exists"""
         updated_question = Question.update(question_id, update_data)
         if updated_question is not None:
+            # Assessments using the question must recompile their answer key
+            AnswerKey.invalidate_for_question(updated_question)
             assessment_result = AssessmentResult.find_by_question_id(question_id)
-        if assessment_result is not None:
-            AssessmentResult.update_question(updated_question)
+            if assessment_result is not None:
+                AssessmentResult.update_question(updated_question)
         return updated_question
 
     '''
@@ -205,6 +198,9 @@ class QuestionService:
     @staticmethod
     def delete_question(question_id):
         """Delete a question"""
+        question = Question.find_by_id(question_id)
+        if question is not None:
+            AnswerKey.invalidate_for_question(question)
         return Question.delete(question_id)
 
     '''
@@ -1,11 +1,187 @@
-from flask import jsonify
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import bson
+from flask import current_app, jsonify
+import pymongo
 import requests
 from app.models.assessment import AssessmentResult, Assessment
 from app.models.course import Course
+from app.models.course_similarity import CourseSimilarity
 from app.models.learning_path import LearningPath
 from app.models.user import User
-from collections import Counter
+from app.utils.cache import LRUCache
 from app.utils.validation import html_tags_unconverter
+from config import Config
+
+
+'''
+Recommendation lists computed by RecommendationService, by kind, user
+and arguments, as (recommendations_version of the user, stored_at, BSON
+of the list). A list is fresh while the version of the user still
+matches it, see User.invalidate_recommendations, which also covers the
+writes of other workers, and for RECOMMENDATION_CACHE_TTL seconds. A
+stale list is served as is for up to RECOMMENDATION_CACHE_STALE_TTL
+more seconds while it is recomputed in the background, so a request
+only waits on a recompute when the user has no usable list.
+'''
+_recommendations = LRUCache(
+    max_entries=Config.RECOMMENDATION_CACHE_SIZE,
+    max_bytes=Config.RECOMMENDATION_CACHE_MAX_BYTES,
+    sizeof=lambda entry: len(entry[2])
+)
+# Keys of _recommendations being recomputed in the background
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+# Recomputes stale lists, created on first use, in the worker
+_refresher = None
+
+'''
+Stores a recommendation list in _recommendations.
+Args:
+    key (tuple): The key of the list.
+    version (int): The recommendations version of the user it was
+    computed for.
+    recommendations (list): The list.
+Returns:
+    list: The list.
+'''
+def _store_recommendations(key, version, recommendations):
+    _recommendations.set(
+        key, (version, time.monotonic(), bson.encode({'items': recommendations}))
+    )
+    return recommendations
+
+'''
+Recomputes a recommendation list on the refresher threads, unless it is
+being recomputed already.
+Args:
+    key (tuple): The key of the list.
+    version (int): The current recommendations version of the user.
+    compute (callable): Computes the list.
+Returns:
+    None
+'''
+def _refresh_recommendations(key, version, compute):
+    global _refresher
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        if _refresher is None:
+            _refresher = ThreadPoolExecutor(
+                max_workers=Config.RECOMMENDATION_REFRESH_WORKERS,
+                thread_name_prefix='recommendations'
+            )
+    app = current_app._get_current_object()
+
+    def run():
+        try:
+            with app.app_context():
+                _store_recommendations(key, version, compute())
+        except Exception as e:
+            app.logger.error(f'Refreshing recommendations {key} failed: {e}')
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    _refresher.submit(run)
+
+'''
+Returns a recommendation list of a user from _recommendations, or
+computes it when the user has no usable one.
+Args:
+    kind (str): What is recommended, e.g. 'courses'.
+    user_id (str): The ID of the user.
+    arguments (tuple): The other arguments the list depends on.
+    compute (callable): Computes the list.
+Returns:
+    list: The list, empty if the user does not exist.
+'''
+def _cached_recommendations(kind, user_id, arguments, compute):
+    version = User.get_recommendations_version(user_id)
+    if version is None:
+        return []
+    key = (kind, str(user_id), arguments)
+
+    entry = _recommendations.get(key)
+    if entry is not None:
+        cached_version, stored_at, body = entry
+        age = time.monotonic() - stored_at
+        if age <= Config.RECOMMENDATION_CACHE_TTL + Config.RECOMMENDATION_CACHE_STALE_TTL:
+            if cached_version != version or age > Config.RECOMMENDATION_CACHE_TTL:
+                _refresh_recommendations(key, version, compute)
+            return bson.decode(body)['items']
+
+    return _store_recommendations(key, version, compute())
+
+# Runs the strategies of course recommendations, created on first use,
+# in the worker
+_strategy_pool = None
+_strategy_pool_lock = threading.Lock()
+# One per thread of _strategy_pool, held by each strategy from its
+# submission until it finishes, so that a submitted strategy never waits
+# in the queue of the pool, behind strategies that outlived their deadline
+_strategy_slots = threading.BoundedSemaphore(Config.RECOMMENDATION_STRATEGY_WORKERS)
+
+'''
+Runs recommendation strategies concurrently on a bounded thread pool,
+each with its own deadline, counted from now. A strategy runs under
+pymongo.timeout, so its queries are sent with a maxTimeMS of the time
+it has left, and fail rather than keep running once it was given up on.
+A strategy is only submitted when a thread of the pool is free for it,
+see _strategy_slots, and skipped otherwise.
+Args:
+    strategies (dict): (deadline in seconds, callable) of each strategy,
+    by name.
+Returns:
+    dict: The result of each strategy that finished in time, by name.
+    Strategies that were skipped, timed out or failed are left out.
+'''
+def _run_strategies(strategies):
+    global _strategy_pool
+    with _strategy_pool_lock:
+        if _strategy_pool is None:
+            _strategy_pool = ThreadPoolExecutor(
+                max_workers=Config.RECOMMENDATION_STRATEGY_WORKERS,
+                thread_name_prefix='recommendation-strategy'
+            )
+    app = current_app._get_current_object()
+    started = time.monotonic()
+
+    def run(deadline, strategy):
+        # Time spent waiting for a thread counts against the deadline
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            return None
+        with app.app_context(), pymongo.timeout(remaining):
+            return strategy()
+
+    futures = {}
+    for name, (deadline, strategy) in strategies.items():
+        if not _strategy_slots.acquire(blocking=False):
+            app.logger.warning(f'Recommendation strategy {name} skipped, no thread is free')
+            continue
+        future = _strategy_pool.submit(run, deadline, strategy)
+        # Also called when the future is cancelled
+        future.add_done_callback(lambda _: _strategy_slots.release())
+        futures[name] = (deadline, future)
+    results = {}
+    for name, (deadline, future) in futures.items():
+        try:
+            result = future.result(timeout=max(0.0, started + deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            app.logger.warning(f'Recommendation strategy {name} timed out after {deadline}s')
+            continue
+        except Exception as e:
+            app.logger.error(f'Recommendation strategy {name} failed: {e}')
+            continue
+        if result is not None:
+            results[name] = result
+    return results
 
 
 '''
@@ -17,6 +193,23 @@ This class includes methods for:
 - Personalized recommendations based on user preferences.
 '''
 class RecommendationService:
+    '''
+    Returns the personalized course recommendations of a user, cached
+    until the user's progress, assessment results or preferences change
+    (see _cached_recommendations).
+    Args:
+        user_id: The ID of the user
+        limit: Maximum number of recommendations to return
+    Returns:
+        list: Recommended courses
+    '''
+    @staticmethod
+    def get_course_recommendations(user_id, limit=5):
+        return _cached_recommendations(
+            'courses', user_id, (int(limit),),
+            lambda: RecommendationService._compute_course_recommendations(user_id, limit)
+        )
+
     '''
     Generates personalized course recommendations based on:
     - Assessment results
@@ -31,7 +224,7 @@ class RecommendationService:
         list: Recommended courses
     '''
     @staticmethod
-    def get_course_recommendations(user_id, limit=5):
+    def _compute_course_recommendations(user_id, limit=5):
         try:
             # Get user data
             user = User.find_by_id(user_id)
@@ -56,18 +249,36 @@ class RecommendationService:
 
             in_progress_courses = user.get('progress', {}).get('in_progress_courses', [])
             
-            # Combine different recommendation strategies
-            knowledge_based_recs = RecommendationService._get_knowledge_gap_recommendations(
-                knowledge_gaps, limit=limit
-            )
-            
-            collaborative_recs = RecommendationService._get_collaborative_recommendations(
-                user_id, completed_courses, in_progress_courses, limit=limit
-            )
-            
-            content_based_recs = RecommendationService._get_content_based_recommendations(
-                user_id, completed_courses, in_progress_courses, limit=limit
-            )
+            # Combine different recommendation strategies, run concurrently
+            strategy_results = _run_strategies({
+                'knowledge_gap': (
+                    Config.RECOMMENDATION_KNOWLEDGE_GAP_TIMEOUT,
+                    lambda: RecommendationService._get_knowledge_gap_recommendations(
+                        knowledge_gaps, limit=limit
+                    )
+                ),
+                'collaborative': (
+                    Config.RECOMMENDATION_COLLABORATIVE_TIMEOUT,
+                    lambda: RecommendationService._get_collaborative_recommendations(
+                        user_id, completed_courses, in_progress_courses, limit=limit
+                    )
+                ),
+                'content_based': (
+                    Config.RECOMMENDATION_CONTENT_BASED_TIMEOUT,
+                    lambda: RecommendationService._get_content_based_recommendations(
+                        user_id, completed_courses, in_progress_courses, limit=limit
+                    )
+                ),
+            })
+
+            # Every strategy timed out or failed
+            if not strategy_results:
+                return Course.find_popular_courses(limit=limit)
+
+            # Strategies that did not finish in time add nothing
+            knowledge_based_recs = strategy_results.get('knowledge_gap', [])
+            collaborative_recs = strategy_results.get('collaborative', [])
+            content_based_recs = strategy_results.get('content_based', [])
 
             # Combine and rank recommendations
             all_recommendations = []
@@ -92,6 +303,7 @@ class RecommendationService:
                         unique_recommendations[course_id] = (course, priority)
 
             # Sort by priority (descending) and return the courses
+            sorted_recommendations = []
             if len(unique_recommendations) > 0:
                 sorted_recommendations = sorted(
                     unique_recommendations.values(), 
@@ -121,50 +333,38 @@ class RecommendationService:
 
     
     '''
-    Recommends courses that address specific knowledge gaps.
+    Recommends courses that address specific knowledge gaps, with a
+    single query. A course scores the number of times each gap it covers
+    appears in knowledge_gaps, i.e. across the user's recent failed
+    results, so the courses covering the most frequent gaps come first.
     Args:
-        knowledge_gaps: List of knowledge gaps
+        knowledge_gaps: List of knowledge gaps, with repeats
         limit: Maximum number of recommendations to return
     Returns:
         list: Recommended courses
     '''
+    @staticmethod
     def _get_knowledge_gap_recommendations(knowledge_gaps, limit=3):
         try:
-            if not knowledge_gaps:
+            gap_weights = Counter(gap for gap in knowledge_gaps or [] if gap)
+            if not gap_weights:
                 return []
-            
-            # Remove duplicates from knowledge gaps
-            unique_gaps = list(set(knowledge_gaps))
-            
-            # Find courses that address these knowledge gaps
-            # In a real implementation, you would have tags or concepts
-            # associated with courses to enable this matching
-            recommended_courses = []
-            
-            # Query courses that match the knowledge gaps
-            # This assumes you have a 'tags' or 'concepts' field in your courses
-            for gap in unique_gaps:
-                matching_courses = Course.find_all(
-                    filters={'content.tags': {'$in': [gap]}},
-                    limit=2
-                )
-                recommended_courses.extend(matching_courses)
-                
-                if len(recommended_courses) >= limit:
-                    break
-            
-            return recommended_courses[:limit]
+
+            return Course.find_by_weighted_tags(gap_weights, limit=limit)
         except Exception as e:
             raise e
 
     '''
     Recommends courses based on collaborative filtering.
-    Collaborative filtering finds users with similar course consumption patterns
-    and recommends courses they have taken that the current user has not.
+    Collaborative filtering recommends the courses most often taken by
+    the users who took the same courses as the user. The neighbors of
+    every course are built offline (see CourseSimilarityService), so
+    this reads the neighbors of the user's courses with a single query,
+    sums the scores of each candidate course and reads the best ones.
     Args:
         user_id: The ID of the user
         completed_courses: List of completed course IDs
-        in_progress_courses: List of in-progress course IDs
+        in_progress_courses: ID of the course in progress
         limit: Maximum number of recommendations to return
     Returns:
         list: Recommended courses
@@ -172,81 +372,37 @@ class RecommendationService:
     @staticmethod
     def _get_collaborative_recommendations(user_id, completed_courses, in_progress_courses, limit=3):
         try:
-            # Find users who have taken similar courses
-            similar_users = []
-
             # Combine completed and in-progress courses
-            user_courses = completed_courses + [in_progress_courses]
-
-            unique_user_courses = None
+            user_courses = set(completed_courses or [])
+            if isinstance(in_progress_courses, list):
+                user_courses.update(in_progress_courses)
+            else:
+                user_courses.add(in_progress_courses)
+            user_courses = {str(course_id) for course_id in user_courses if course_id}
 
-            if len(user_courses) > 1:
-                unique_user_courses = set(user_courses)
-            
-            if not unique_user_courses:
+            if not user_courses:
                 return []
 
-            # Find users who have completed or are taking the same courses
-            for course_id in unique_user_courses:
-                users_with_course = User.find_all_users(
-                    filters={
-                        '$or': [
-                            {'progress.completed_courses': course_id},
-                            {'progress.in_progress_courses': course_id}
-                        ],
-                        '_id': {'$ne': user_id}  # Exclude the current user
-                    },
-                    limit=20
-                )
-                similar_users.extend(users_with_course)
-            
-            if not similar_users:
+            neighbors = CourseSimilarity.find_neighbors(user_courses)
+
+            # A course similar to several of the user's courses adds up
+            # its scores
+            scores = {}
+            for course_neighbors in neighbors.values():
+                for neighbor in course_neighbors:
+                    course_id = neighbor['course_id']
+                    if course_id not in user_courses:
+                        scores[course_id] = scores.get(course_id, 0.0) + neighbor['score']
+
+            if not scores:
                 return []
-            
-            # Count how many times each user appears (more overlap = more similar)
-            user_counts = Counter([str(user.get('_id')) for user in similar_users])
-            
-            # Get the most similar users
-            most_similar_users = [
-                user_id for user_id, count in user_counts.most_common(10)
-            ]
-            
-            # Find courses these similar users have taken that this user hasn't yet
-            recommended_course_ids = set()
-            
-            for similar_user_id in most_similar_users:
-                similar_user = User.find_by_id(similar_user_id)
-                if not similar_user:
-                    continue                
-                    
-                similar_user_courses = (
-                    similar_user.get('progress', {}).get('completed_courses', []) +
-                    [similar_user.get('progress', {}).get('in_progress_courses', '')]
-                )
-                
-                # Add courses, which the similar user has taken but this user hasn't yet
-                for course_id in similar_user_courses:
-                    if course_id and course_id not in unique_user_courses:
-                        recommended_course_ids.add(course_id)
-                        
-                        if len(recommended_course_ids) >= limit:
-                            break
-                
-                if len(recommended_course_ids) >= limit:
-                    break
-            
+
+            recommended_course_ids = sorted(
+                scores, key=lambda course_id: (-scores[course_id], course_id)
+            )[:limit]
+
             # Fetch the full course objects
-            recommended_courses = []
-            for course_id in recommended_course_ids:
-                course = Course.find_by_id(course_id)
-                if course is not None:
-                    course['_id'] = str(course['_id'])
-                    recommended_courses.append(course)
-            
-            if len(recommended_courses) > 0:
-                return recommended_courses[:limit]
-            
-            return []
+            return Course.find_by_ids(recommended_course_ids)
 
         except Exception as e:
             raise e
@@ -320,6 +476,22 @@ class RecommendationService:
         except Exception as e:
             raise e
     
+    '''
+    Returns the learning path recommendations of a user, cached like the
+    course recommendations.
+    Args:
+        user_id: The ID of the user
+        limit: Maximum number of recommendations to return
+    Returns:
+        list: Recommended learning paths
+    '''
+    @staticmethod
+    def get_learning_path_recommendations(user_id, limit=3):
+        return _cached_recommendations(
+            'learning_paths', user_id, (int(limit),),
+            lambda: RecommendationService._compute_learning_path_recommendations(user_id, limit)
+        )
+
     '''
     Generates personalized learning path recommendations based on:
     - Assessment results (both strengths and knowledge gaps)
@@ -331,7 +503,7 @@ class RecommendationService:
         list: Recommended learning paths
     '''
     @staticmethod
-    def get_learning_path_recommendations(user_id, limit=3):
+    def _compute_learning_path_recommendations(user_id, limit=3):
 
         try:
 
@@ -437,7 +609,8 @@ class RecommendationService:
             raise e
 
     '''
-    Generates personalized course recommendations based on user preferences.
+    Returns the course recommendations of a user based on preferences,
+    cached like the course recommendations, and by preference data.
     Args:
         user_id: The ID of the user
         preference_data: Optional dictionary of user preferences
@@ -447,6 +620,25 @@ class RecommendationService:
     '''
     @staticmethod
     def get_personalized_recommendations(user_id, preference_data=None, limit=4):
+        arguments = (int(limit), json.dumps(preference_data or {}, sort_keys=True, default=str))
+        return _cached_recommendations(
+            'personalized', user_id, arguments,
+            lambda: RecommendationService._compute_personalized_recommendations(
+                user_id, preference_data, limit
+            )
+        )
+
+    '''
+    Generates personalized course recommendations based on user preferences.
+    Args:
+        user_id: The ID of the user
+        preference_data: Optional dictionary of user preferences
+        limit: Maximum number of recommendations to return
+    Returns:
+        list: Recommended courses
+    '''
+    @staticmethod
+    def _compute_personalized_recommendations(user_id, preference_data=None, limit=4):
 
         try:
                 
@@ -477,7 +669,7 @@ class RecommendationService:
                 return Course.find_all(limit=limit)
             
             # Get recommendations based on course history
-            return RecommendationService.get_course_recommendations(user_id, limit)
+            return RecommendationService._compute_course_recommendations(user_id, limit)
 
         except Exception as e:
             raise e
@@ -578,7 +770,8 @@ class RecommendationService:
         except Exception as e:
             raise e
     '''
-    Find courses similar to a given course
+    Find courses similar to a given course, ranked by the cosine
+    similarity of their TF-IDF vectors (see Course.find_similar)
     
     Args:
         course_id: The ID of the course
@@ -589,38 +782,9 @@ class RecommendationService:
     '''
     @staticmethod
     def get_similar_courses(course_id, limit=3):
-
-        try :
-                
-            course = Course.find_by_id(course_id)
-            if not course:
-                return []
-            
-            # Get courses in the same category
-            category = course.get('category')
-            similar_courses = Course.find_by_category(category, limit=limit+1)
-            
-            # Remove the original course from the results
-            similar_courses = [c for c in similar_courses if str(c.get('_id')) != str(course_id)]
-            
-            # If we need more recommendations, look at courses with similar tags
-            if len(similar_courses) < limit and 'content' in course and 'tags' in course['content']:
-                tags = course['content']['tags']
-                
-                if tags:
-                    tag_courses = Course.find_all(
-                        filters={'content.tags': {'$in': tags}, '_id': {'$ne': course_id}},
-                        limit=limit - len(similar_courses)
-                    )
-                    
-                    for tag_course in tag_courses:
-                        if tag_course not in similar_courses:
-                            similar_courses.append(tag_course)
-                            
-                            if len(similar_courses) >= limit:
-                                break
-            
-            return similar_courses[:limit]
+        try:
+            # Ranked by the content similarity index of the courses
+            return Course.find_similar(course_id, limit)
 
         except Exception as e:
             raise e
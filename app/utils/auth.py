@@ -1,6 +1,6 @@
 from functools import wraps
 from flask import jsonify, request
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from app import limiter
@@ -16,6 +16,10 @@ input validation, and rate limiting.
 Decorator to restrict access to admin users only.
 Ensures the incoming request contains a valid JWT and that the user has the 'admin' role.
 If the user is not an admin or the token is invalid, returns a 403 Forbidden response.
+The role is taken from the token's claims as long as its role version is
+still the user's current one, which is cached for a short time, so most
+admin requests do not read the user document. Tokens without the claims,
+or issued before a role change, have the role read from the database.
 Args:
     fn (function): The Flask route handler to decorate.
 Returns:
@@ -31,9 +35,15 @@ def admin_required(fn):
     def wrapper(*args, **kwargs):
         verify_jwt_in_request()
         user_id = get_jwt_identity()
-        user = User.find_by_id(user_id)
-        
-        if not user or user.get('role') != 'admin':
+        claims = get_jwt()
+
+        if 'role' in claims and 'role_version' in claims \
+                and User.get_role_version(user_id) == claims['role_version']:
+            role = claims['role']
+        else:
+            role = User.find_role(user_id)
+
+        if role != 'admin':
             return jsonify({"error": "Admin privileges required"}), 403
         
         return fn(*args, **kwargs)
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+
+'''
+In-process caching utilities.
+The caches below live in the memory of a single worker process, so
+every worker holds its own copy. Entries that other workers may change
+should therefore either be validated against the database or carry a
+ttl that bounds how long a stale entry can be served.
+'''
+
+'''
+Thread safe least recently used cache
+- Evicts the least recently used entries once max_entries, or
+  max_bytes when a sizeof function is given, would be exceeded
+- Entries older than ttl seconds are treated as missing
+- Keeps hit, miss and eviction counters for monitoring
+'''
+class LRUCache:
+    '''
+    Args:
+        max_entries (int): Maximum number of entries to keep.
+        ttl (float, optional): Seconds an entry stays valid. Entries
+        never expire when omitted.
+        max_bytes (int, optional): Maximum total size of the entries,
+        as measured by sizeof.
+        sizeof (callable, optional): Returns the size in bytes of a
+        value. Required when max_bytes is given.
+    '''
+    def __init__(self, max_entries, ttl=None, max_bytes=None, sizeof=None):
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("max_bytes requires a sizeof function")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        # Maps a key to (value, stored_at, size)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    '''
+    Returns the value stored for a key.
+    Args:
+        key: The key to look up.
+        default: Returned when the key is missing or expired.
+    Returns:
+        The stored value, or default.
+    '''
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            value, stored_at, size = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    '''
+    Stores a value, evicting the least recently used entries if needed.
+    A value larger than max_bytes on its own is not stored.
+    Args:
+        key: The key to store the value under.
+        value: The value to store.
+    Returns:
+        bool: True if the value was stored.
+    '''
+    def set(self, key, value):
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+        return True
+
+    '''
+    Removes a key from the cache.
+    Args:
+        key: The key to remove.
+    Returns:
+        bool: True if the key was cached.
+    '''
+    def pop(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    '''
+    Removes every entry from the cache.
+    Returns:
+        None
+    '''
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    '''
+    Returns the cache counters.
+    Returns:
+        dict: entries, bytes, hits, misses, evictions and hit_ratio.
+    '''
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_ratio': self._hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
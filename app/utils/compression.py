@@ -0,0 +1,121 @@
+import gzip
+from flask import request
+from app.utils.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+'''
+Response compression.
+Responses of at least COMPRESSION_MIN_SIZE bytes are compressed with
+the best encoding the client accepts in Accept-Encoding, br when the
+Brotli package is installed, gzip otherwise. Responses with an ETag
+(see app.utils.conditional) are versioned, so their compressed bodies
+are cached by ETag and encoding and compressed once per version. Their
+ETag becomes weak, as the compressed body is a different representation
+of the same version; If-None-Match is compared weakly, so clients still
+get their 304s.
+'''
+
+# Media types worth compressing, besides text/*
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/javascript', 'application/xml')
+
+# Encodings by order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+'''
+Compresses a body.
+Args:
+    body (bytes): The body.
+    encoding (str): 'br' or 'gzip'.
+    level (int): Compression level, from 1 to 9.
+Returns:
+    bytes: The compressed body.
+'''
+def compress(body, encoding, level):
+    if encoding == 'br':
+        # The level doubles as the Brotli quality, which goes up to 11
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+'''
+Returns the encoding to use for the current request.
+Returns:
+    str: The preferred encoding the client accepts, or None.
+'''
+def _negotiate():
+    accepted = request.accept_encodings
+    for encoding in ENCODINGS:
+        # Quality of the encoding itself, else of '*', 0 if neither
+        if accepted[encoding] > 0:
+            return encoding
+    return None
+
+'''
+Checks whether a response should be compressed, ignoring its size.
+Args:
+    response (Response): The response.
+Returns:
+    bool: True if the response can be compressed.
+'''
+def _is_compressible(response):
+    return (
+        response.status_code == 200
+        and not response.direct_passthrough
+        and not response.is_streamed
+        and 'Content-Encoding' not in response.headers
+        and (response.mimetype.startswith('text/')
+             or response.mimetype in COMPRESSIBLE_MIMETYPES)
+    )
+
+'''
+Registers the compression of the responses of an app, configured by
+COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL, COMPRESSION_CACHE_SIZE and
+COMPRESSION_CACHE_MAX_BYTES.
+Args:
+    app (Flask): The app.
+Returns:
+    LRUCache: The cache of compressed bodies, also stored in
+    app.extensions['compression'].
+'''
+def init_compression(app):
+    min_size = app.config['COMPRESSION_MIN_SIZE']
+    level = app.config['COMPRESSION_LEVEL']
+    compressed_bodies = LRUCache(
+        max_entries=app.config['COMPRESSION_CACHE_SIZE'],
+        max_bytes=app.config['COMPRESSION_CACHE_MAX_BYTES'],
+        sizeof=len
+    )
+
+    @app.after_request
+    def compress_response(response):
+        compressible = _is_compressible(response)
+        if compressible or response.status_code == 304:
+            # The body depends on Accept-Encoding, whether or not this one
+            # is compressed
+            response.vary.add('Accept-Encoding')
+        if not compressible or (response.content_length or 0) < min_size:
+            return response
+        encoding = _negotiate()
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        if etag is None or weak:
+            body = compress(response.get_data(), encoding, level)
+        else:
+            key = (etag, encoding)
+            body = compressed_bodies.get(key)
+            if body is None:
+                body = compress(response.get_data(), encoding, level)
+                compressed_bodies.set(key, body)
+            response.set_etag(etag, weak=True)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    app.extensions['compression'] = compressed_bodies
+    return compressed_bodies
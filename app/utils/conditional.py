@@ -0,0 +1,92 @@
+import hashlib
+from datetime import datetime, timezone
+from flask import Response, request
+
+'''
+Conditional GET support.
+Read routes tag their responses with an ETag derived from the version
+of the document they render, and a Last-Modified from its updated_at.
+Clients send them back in If-None-Match and If-Modified-Since, and get
+a 304 Not Modified while the document did not change. The version is
+read with a projection of only the version fields, so a 304 neither
+fetches the document nor renders it. The version of a document is its
+version field where it has one (courses), and its updated_at otherwise.
+'''
+
+'''
+Returns the validators of a version of a document.
+Args:
+    kind (str): What the response holds, e.g. 'course' or 'sections'.
+    Responses of the same document in different shapes get different
+    ETags.
+    document_id (str): ID of the document.
+    stamp (dict): The version and updated_at fields of the document.
+Returns:
+    tuple: (etag, last_modified), last_modified being None when the
+    document has no valid updated_at.
+'''
+def make_validators(kind, document_id, stamp):
+    version = stamp.get('version')
+    updated_at = stamp.get('updated_at')
+    etag = hashlib.sha1(
+        f'{kind}:{document_id}:{version}:{updated_at}'.encode()
+    ).hexdigest()
+    return etag, _parse_timestamp(updated_at)
+
+'''
+Parses an isoformat timestamp as stored in the documents.
+Args:
+    value (str): The timestamp.
+Returns:
+    datetime: The timestamp in UTC, or None if it is missing or invalid.
+'''
+def _parse_timestamp(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+'''
+Checks the preconditions of the current request against validators.
+If-Modified-Since is only used when the request has no If-None-Match,
+and has a precision of one second.
+Args:
+    validators (tuple): See make_validators.
+Returns:
+    Response: A 304 response if the client has this version, None otherwise.
+'''
+def not_modified(validators):
+    etag, last_modified = validators
+    if request.if_none_match:
+        matches = request.if_none_match.contains_weak(etag)
+    else:
+        matches = (
+            last_modified is not None
+            and request.if_modified_since is not None
+            and last_modified.replace(microsecond=0) <= request.if_modified_since
+        )
+    if not matches:
+        return None
+    return with_validators(Response(status=304), validators)
+
+'''
+Sets the validators on a response. The response may be stored by
+clients, but has to be revalidated before it is used.
+Args:
+    response (Response): The response.
+    validators (tuple): See make_validators.
+Returns:
+    Response: The response.
+'''
+def with_validators(response, validators):
+    etag, last_modified = validators
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,150 @@
+import os
+import threading
+from pymongo import MongoClient
+from pymongo.database import Database
+
+'''
+Fork-safe MongoDB connection management.
+A MongoClient owns sockets and background monitoring threads, so it
+must never be shared between a gunicorn master and its forked workers.
+The manager below creates the client lazily, on first use, in the
+process that actually uses it, and recreates it whenever it notices it
+is running in a different process than the one that created it.
+The models keep importing `db` from the app package; that object is a
+LazyDatabase whose collections resolve to the current process' client
+on every call, so module level bindings such as
+`courses_collection = db.courses` survive a fork unchanged.
+'''
+
+'''
+Owns the MongoClient of the current process.
+The client is configured from the Flask config (see Config) through
+init_app and only created on first use.
+'''
+class MongoConnectionManager:
+    def __init__(self):
+        self._uri = None
+        self._database_name = None
+        self._options = {}
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    '''
+    Reads the connection settings from the application config.
+    Args:
+        app (Flask): The application whose config holds the settings.
+    Returns:
+        None
+    '''
+    def init_app(self, app):
+        config = app.config
+        self._uri = config['MONGO_URI']
+        self._database_name = config['DATABASE_NAME']
+        options = {
+            'maxPoolSize': config.get('MONGO_MAX_POOL_SIZE'),
+            'minPoolSize': config.get('MONGO_MIN_POOL_SIZE'),
+            'waitQueueTimeoutMS': config.get('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+            'maxIdleTimeMS': config.get('MONGO_MAX_IDLE_TIME_MS'),
+        }
+        # Unset options fall back to the pymongo defaults
+        self._options = {k: v for k, v in options.items() if v is not None}
+        self.reset()
+
+    '''
+    Returns the MongoClient of the current process, creating it if
+    needed.
+    Returns:
+        MongoClient: The client bound to the current process.
+    '''
+    @property
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    if self._uri is None:
+                        raise RuntimeError(
+                            "MongoDB is not configured, call create_app first"
+                        )
+                    # connect=False defers the first connection until the
+                    # first operation, in this process
+                    self._client = MongoClient(
+                        self._uri, connect=False, **self._options
+                    )
+                    self._pid = os.getpid()
+        return self._client
+
+    '''
+    Returns the configured database of the current process' client.
+    Returns:
+        Database: The pymongo database.
+    '''
+    def get_database(self):
+        return self.client[self._database_name]
+
+    '''
+    Forgets the client inherited from the parent process.
+    The inherited client is dropped without being closed: closing it
+    would end sessions over sockets that still belong to the parent.
+    Meant to be called from gunicorn's post_fork hook.
+    Returns:
+        None
+    '''
+    def reset(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    '''
+    Closes the client of the current process, if any.
+    Returns:
+        None
+    '''
+    def close(self):
+        if self._client is not None and self._pid == os.getpid():
+            self._client.close()
+        self._client = None
+        self._pid = None
+
+
+'''
+Stand-in for a pymongo Database that resolves every attribute against
+the database of the current process' client.
+Attribute access returns a LazyCollection for collection names and the
+real Database attribute for Database methods such as command().
+'''
+class LazyDatabase:
+    def __init__(self, manager):
+        self._manager = manager
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if hasattr(Database, name):
+            return getattr(self._manager.get_database(), name)
+        return LazyCollection(self._manager, name)
+
+    def __getitem__(self, name):
+        return LazyCollection(self._manager, name)
+
+
+'''
+Stand-in for a pymongo Collection that forwards every attribute to the
+collection of the current process' client.
+'''
+class LazyCollection:
+    def __init__(self, manager, name):
+        self._manager = manager
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self._manager.get_database()[self._name], attr)
+
+    def __repr__(self):
+        return f'LazyCollection({self._name!r})'
@@ -0,0 +1,151 @@
+from bson import ObjectId
+
+'''
+Position index of the content tree of a course.
+The content of a course is a tree of arrays, sections holding
+sub_sections holding data. Matching a node by its ID makes MongoDB scan
+these arrays level by level, which is what array_filters and $unwind do
+on every edit and read. Instead, each course stores a content_index that
+maps the ID of every node to its position in the tree:
+    {
+        'sections': {section_id: [i]},
+        'sub_sections': {subsection_id: [i, j]},
+        'data': {data_id: [i, j, k]},
+    }
+so a node is addressed directly, e.g. content.sections.i.sub_sections.j.
+The index is only valid for the tree it was built from. Every write that
+moves nodes increments the course's content_version, and either updates
+content_index in the same write or removes it, in which case it is
+rebuilt on the next access.
+'''
+
+# (key in the index, ID field, children array) of each level of the tree
+CONTENT_LEVELS = (
+    ('sections', 'section_id', 'sub_sections'),
+    ('sub_sections', 'subsection_id', 'data'),
+    ('data', 'data_id', None),
+)
+
+'''
+Checks that a node ID can be used as a key of the index, and therefore
+in a field path. IDs are generated as ObjectId strings.
+Args:
+    node_id (str): The ID of a node.
+Returns:
+    bool: True if the ID can be indexed.
+'''
+def is_indexable(node_id):
+    return isinstance(node_id, str) and ObjectId.is_valid(node_id)
+
+'''
+Builds the position index of a content tree.
+Args:
+    sections (list): The content sections of a course.
+Returns:
+    dict: The index, see the module docstring.
+'''
+def build_content_index(sections):
+    index = {key: {} for key, _, _ in CONTENT_LEVELS}
+
+    def visit(nodes, depth, parent):
+        key, id_field, children = CONTENT_LEVELS[depth]
+        for position, node in enumerate(nodes or []):
+            node_position = parent + [position]
+            if is_indexable(node.get(id_field)):
+                index[key][node[id_field]] = node_position
+            if children:
+                visit(node.get(children), depth + 1, node_position)
+
+    visit(sections, 0, [])
+    return index
+
+'''
+Returns the dotted path of a node, e.g. content.sections.0.sub_sections.2
+Args:
+    position (list): The position of the node.
+Returns:
+    str: The path of the node in the course document.
+'''
+def node_path(position):
+    path = 'content'
+    for depth, i in enumerate(position):
+        parent_array = 'sections' if depth == 0 else CONTENT_LEVELS[depth - 1][2]
+        path = f'{path}.{parent_array}.{i}'
+    return path
+
+'''
+Returns the dotted path of the array that holds a node.
+Args:
+    position (list): The position of the node.
+Returns:
+    str: The path of the array, e.g. content.sections.0.sub_sections
+'''
+def array_path(position):
+    return node_path(position).rsplit('.', 1)[0]
+
+'''
+Looks a node up in the index, along with its ancestors.
+Args:
+    index (dict): The content index of the course.
+    node_ids (tuple): The IDs of the node and its ancestors, from the
+    section down, e.g. (section_id, subsection_id).
+Returns:
+    list: The position of the node, or None if it is not in the index
+    or not a child of the given ancestors.
+'''
+def locate(index, node_ids):
+    position = None
+    for depth, node_id in enumerate(node_ids):
+        key = CONTENT_LEVELS[depth][0]
+        if not is_indexable(node_id):
+            return None
+        found = index.get(key, {}).get(node_id)
+        if found is None or len(found) != depth + 1 or (
+            position is not None and found[:depth] != position
+        ):
+            return None
+        position = found
+    return position
+
+'''
+Returns the filter that matches a course only if its nodes are still at
+the given position, so a write through a dotted path never lands on a
+node that was moved in the meantime.
+Args:
+    position (list): The position of the node.
+    node_ids (tuple): The IDs of the node and its ancestors.
+Returns:
+    dict: The query conditions.
+'''
+def position_guard(position, node_ids):
+    return {
+        f'{node_path(position[:depth + 1])}.{CONTENT_LEVELS[depth][1]}': node_id
+        for depth, node_id in enumerate(node_ids)
+    }
+
+'''
+Returns the index of the tree after a node was removed from it: the node
+and its descendants leave the index and the nodes that followed it in
+its array move up by one.
+Args:
+    index (dict): The content index before the removal.
+    position (list): The position of the removed node.
+Returns:
+    dict: The new index.
+'''
+def remove_from_index(index, position):
+    depth = len(position) - 1
+    parent, removed = position[:depth], position[depth]
+    new_index = {}
+    for key, _, _ in CONTENT_LEVELS:
+        entries = {}
+        for node_id, node_position in index.get(key, {}).items():
+            if len(node_position) > depth and node_position[:depth] == parent:
+                if node_position[depth] == removed:
+                    continue
+                if node_position[depth] > removed:
+                    node_position = list(node_position)
+                    node_position[depth] -= 1
+            entries[node_id] = node_position
+        new_index[key] = entries
+    return new_index
@@ -1,25 +1,73 @@
-from app.models.user import User
+import threading
+import time
 from datetime import datetime, timezone
+from pymongo.errors import PyMongoError
 
 '''
-Manages cooldown field in a user's or leaner's record.
+Cooldown handling for a user's or learner's record.
+A failed assessment places a cooldown object, whose duration is the
+ISO timestamp at which it ends, in the user's document. Expiry is
+evaluated when the document is read, so an expired cooldown is never
+served and requests do not need an extra query or write to clear it.
+The expired fields themselves are removed in bulk by a periodic sweep.
+'''
+
+'''
+Checks whether a cooldown has ended.
 Args:
-    user_id (str): the user ID of the learner or user whose
-    record is to be chacked and updated, it required.
+    cooldown (dict): The cooldown object of a user's record.
+    now (datetime, optional): The time to compare against. Defaults to
+    the current UTC time.
 Returns:
-    Nothing is returned.
+    bool: True if the cooldown has a duration that lies in the past.
 '''
-def manage_cooldown(user_id):
-    user = User.find_by_id(user_id=user_id)
-    
-    if user is not None:
-        cooldown = user.get('cooldown', {})
+def is_cooldown_expired(cooldown, now=None):
+    if not cooldown or not cooldown.get('duration'):
+        return False
+    now = now or datetime.now(timezone.utc)
+    return datetime.fromisoformat(cooldown.get('duration')) < now
 
-    if cooldown and cooldown.get('duration'):
-        today = datetime.now(timezone.utc)
-        cooldown_duration = datetime.fromisoformat(
-            cooldown.get('duration')
-        )
+'''
+Removes an expired cooldown from a user's record, in memory only.
+Args:
+    user (dict): The user's record, may be None.
+Returns:
+    dict: The same record, without its cooldown if that has ended.
+'''
+def strip_expired_cooldown(user):
+    if user is not None and is_cooldown_expired(user.get('cooldown')):
+        user.pop('cooldown', None)
+    return user
+
+'''
+Clears every expired cooldown in the users collection.
+Returns:
+    int: The number of users whose cooldown was cleared.
+'''
+def sweep_expired_cooldowns():
+    from app.models.user import User
+
+    return User.clear_expired_cooldowns()
+
+'''
+Runs sweep_expired_cooldowns periodically on a daemon thread.
+Args:
+    interval (float): Seconds between two sweeps.
+    logger (Logger): Logger used to report the sweeps.
+Returns:
+    Thread: The started thread.
+'''
+def start_cooldown_sweeper(interval, logger):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                cleared = sweep_expired_cooldowns()
+                if cleared:
+                    logger.info(f'Cleared {cleared} expired cooldowns')
+            except PyMongoError as e:
+                logger.error(f'Cooldown sweep failed: {e}')
 
-        if cooldown_duration < today:
-            User.remove_cooldown_field(user_id=user_id)
+    thread = threading.Thread(target=run, name='cooldown-sweeper', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,205 @@
+import threading
+from pymongo import IndexModel
+from pymongo.errors import PyMongoError
+
+'''
+Index registry utilities for the MongoDB collections.
+Every model declares the indexes its query shapes need, next to the
+model itself, by calling register_indexes at import time. The index
+manager then reconciles the registry against the live database,
+builds whatever is missing and reports any drift between the two.
+'''
+
+# Maps a collection name to the list of IndexModel declared for it
+_registry = {}
+
+# Index options that take part in comparing a declared index with a live one
+_COMPARED_OPTIONS = (
+    'unique',
+    'sparse',
+    'expireAfterSeconds',
+    'partialFilterExpression',
+)
+
+'''
+Declares the indexes that a collection needs.
+Args:
+    collection_name (str): Name of the collection the indexes belong to.
+    indexes (list): List of pymongo IndexModel objects.
+Returns:
+    list: The full list of indexes registered for the collection.
+'''
+def register_indexes(collection_name, indexes):
+    declared = _registry.setdefault(collection_name, [])
+    known_names = [index.document['name'] for index in declared]
+    for index in indexes:
+        if not isinstance(index, IndexModel):
+            raise TypeError("register_indexes expects IndexModel instances")
+        # Re-importing a model must not register its indexes twice
+        if index.document['name'] not in known_names:
+            declared.append(index)
+            known_names.append(index.document['name'])
+    return declared
+
+'''
+Returns a copy of the index registry.
+Returns:
+    dict: Collection name mapped to its declared IndexModel list.
+'''
+def registered_indexes():
+    return {name: list(indexes) for name, indexes in _registry.items()}
+
+'''
+Builds the comparable signature of an index specification.
+Args:
+    spec (dict): An IndexModel document or an index_information() entry.
+Returns:
+    tuple: (key pattern, options) that can be compared for equality.
+'''
+def _index_signature(spec):
+    keys = spec['key']
+    if isinstance(keys, dict):
+        keys = keys.items()
+    key = tuple((field, direction) for field, direction in keys)
+    # expireAfterSeconds may legitimately be 0, so only None/False are dropped
+    options = tuple(
+        (option, spec.get(option))
+        for option in _COMPARED_OPTIONS
+        if spec.get(option) is not None and spec.get(option) is not False
+    )
+    return key, options
+
+'''
+Compares the declared indexes of every registered collection against
+the indexes that exist in the database.
+Args:
+    database (Database): The pymongo database to inspect.
+Returns:
+    dict: Per collection report with the following lists:
+        - missing: declared indexes that do not exist yet
+        - changed: indexes whose key pattern exists with different options
+        - extra: live indexes that are not declared in the registry
+'''
+def plan_indexes(database):
+    plan = {}
+    for collection_name, declared in _registry.items():
+        existing = database[collection_name].index_information()
+        existing_by_key = {}
+        for name, info in existing.items():
+            if name == '_id_':
+                continue
+            key, options = _index_signature(info)
+            existing_by_key[key] = (name, options)
+
+        missing = []
+        changed = []
+        matched_names = set()
+        for index in declared:
+            key, options = _index_signature(index.document)
+            live = existing_by_key.get(key)
+            if live is None:
+                missing.append(index)
+                continue
+            matched_names.add(live[0])
+            if live[1] != options:
+                changed.append({
+                    'name': live[0],
+                    'declared': dict(options),
+                    'live': dict(live[1]),
+                })
+
+        extra = [
+            name for name in existing
+            if name != '_id_' and name not in matched_names
+        ]
+        plan[collection_name] = {
+            'missing': missing,
+            'changed': changed,
+            'extra': extra,
+        }
+    return plan
+
+'''
+Reconciles the index registry with the database.
+Missing indexes are built with the background option so that the
+build does not block other operations on the collection. Changed and
+extra indexes are only reported, never dropped, since dropping an
+index on a live collection is a decision for a human.
+Args:
+    database (Database): The pymongo database to reconcile.
+    dry_run (bool): If True, only report what would be built.
+Returns:
+    dict: Per collection report with 'created', 'changed', 'extra' and
+    'errors' lists.
+'''
+def ensure_indexes(database, dry_run=False):
+    report = {}
+    for collection_name, plan in plan_indexes(database).items():
+        created = []
+        errors = []
+        for index in plan['missing']:
+            name = index.document['name']
+            if dry_run:
+                created.append(name)
+                continue
+            try:
+                database[collection_name].create_indexes([index])
+                created.append(name)
+            except PyMongoError as e:
+                errors.append(f'{name}: {e}')
+        report[collection_name] = {
+            'created': created,
+            'changed': plan['changed'],
+            'extra': plan['extra'],
+            'errors': errors,
+        }
+    return report
+
+'''
+Formats an index reconciliation report as human readable lines.
+Args:
+    report (dict): The report returned by ensure_indexes.
+    dry_run (bool): Whether the report comes from a dry run.
+Returns:
+    list: Lines describing the report, one per finding.
+'''
+def format_index_report(report, dry_run=False):
+    verb = 'would build' if dry_run else 'built'
+    lines = []
+    for collection_name, entry in sorted(report.items()):
+        for name in entry['created']:
+            lines.append(f'{collection_name}: {verb} index {name}')
+        for change in entry['changed']:
+            lines.append(
+                f"{collection_name}: index {change['name']} drifted "
+                f"(declared {change['declared']}, live {change['live']})"
+            )
+        for name in entry['extra']:
+            lines.append(f'{collection_name}: index {name} is not declared')
+        for error in entry['errors']:
+            lines.append(f'{collection_name}: failed to build index {error}')
+    if not lines:
+        lines.append('All declared indexes are in place')
+    return lines
+
+'''
+Runs ensure_indexes on a daemon thread so that application startup is
+never held up by an index build, and logs the resulting report.
+Args:
+    database (Database): The pymongo database to reconcile.
+    logger (Logger): Logger used to report the reconciliation outcome.
+Returns:
+    Thread: The started thread.
+'''
+def ensure_indexes_in_background(database, logger):
+    def run():
+        try:
+            report = ensure_indexes(database)
+            for line in format_index_report(report):
+                logger.info(line)
+        except PyMongoError as e:
+            logger.error(f'Index reconciliation failed: {e}')
+
+    thread = threading.Thread(target=run, name='ensure-indexes', daemon=True)
+    thread.start()
+    return thread
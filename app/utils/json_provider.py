@@ -0,0 +1,90 @@
+from datetime import date, datetime
+from bson import Decimal128, ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+JSON provider of the app (app.json), used by jsonify.
+- Encodes ObjectId as its hex string, datetime and date in ISO 8601, as
+  the timestamps stored by the models, and Decimal128 as a decimal
+  string, so documents can be returned as read from MongoDB, without
+  converting their fields first.
+- Serializes with orjson when it is installed, which is several times
+  faster than the json module on large responses, and falls back to
+  the json module otherwise, and for values orjson cannot encode, e.g.
+  integers beyond 64 bits.
+- Like the default provider, keys are sorted, and responses are
+  indented in debug mode. orjson leaves non ASCII characters as UTF-8
+  instead of escaping them.
+'''
+class MongoJSONProvider(DefaultJSONProvider):
+    '''
+    Encodes the values the json module does not know.
+    Args:
+        o: The value.
+    Returns:
+        A value the encoder knows.
+    Raises:
+        TypeError: If the value cannot be encoded.
+    '''
+    @staticmethod
+    def default(o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        if isinstance(o, Decimal128):
+            return str(o.to_decimal())
+        return DefaultJSONProvider.default(o)
+
+    '''
+    Serializes data as JSON.
+    Args:
+        obj: The data.
+        **kwargs: Arguments of json.dumps, which use the json module.
+    Returns:
+        str: The JSON document.
+    '''
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj, indent=False).decode()
+
+    '''
+    Serializes data as a JSON response, see jsonify.
+    Returns:
+        Response: The response.
+    '''
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            self._encode(obj, indent) + b'\n', mimetype=self.mimetype
+        )
+
+    '''
+    Serializes data with orjson.
+    Args:
+        obj: The data.
+        indent (bool): Whether to indent the document.
+    Returns:
+        bytes: The JSON document, as UTF-8.
+    '''
+    def _encode(self, obj, indent):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except orjson.JSONEncodeError:
+            if indent:
+                return super().dumps(obj, indent=2).encode()
+            return super().dumps(obj, separators=(',', ':')).encode()
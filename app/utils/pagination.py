@@ -0,0 +1,99 @@
+import base64
+import binascii
+import json
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+
+'''
+Keyset (cursor) pagination utilities.
+Instead of skipping over the previous pages, a list finder resumes
+right after the last item it returned. The client receives an opaque
+cursor token that encodes the sort key and _id of that item, and sends
+it back to get the next page. Given an index that matches the sort,
+every page then costs the same, however deep it is.
+'''
+
+# Sort orders used by the list finders. _id is always the last key, so
+# the order is total and a cursor identifies a single position.
+SORT_BY_ID = [('_id', ASCENDING)]
+SORT_BY_NEWEST = [('created_at', DESCENDING), ('_id', DESCENDING)]
+
+'''
+Encodes the position of a document in a sort order as a cursor token.
+Args:
+    document (dict): The last document of a page.
+    sort (list): The (field, direction) pairs of the sort order.
+Returns:
+    str: The opaque cursor token.
+'''
+def encode_cursor(document, sort):
+    values = [str(document.get(field)) if field == '_id' else document.get(field)
+              for field, _ in sort]
+    payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+'''
+Decodes a cursor token produced by encode_cursor.
+Args:
+    token (str): The cursor token.
+    sort (list): The (field, direction) pairs of the sort order.
+Returns:
+    list: The sort key values of the position, _id as an ObjectId.
+Raises:
+    ValueError: If the token is not a valid cursor for the sort order.
+'''
+def decode_cursor(token, sort):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(sort):
+            raise ValueError
+        return [ObjectId(value) if field == '_id' else value
+                for (field, _), value in zip(sort, values)]
+    except (ValueError, TypeError, InvalidId, binascii.Error, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+'''
+Restricts a query to the documents that come after a cursor.
+Args:
+    query (dict): The filter of the list finder.
+    sort (list): The (field, direction) pairs of the sort order.
+    token (str, optional): The cursor token of the previous page.
+Returns:
+    dict: The filter for the page that follows the cursor, or the
+    query itself when no cursor is given.
+Raises:
+    ValueError: If the token is not a valid cursor for the sort order.
+'''
+def keyset_filter(query, sort, token=None):
+    if not token:
+        return query
+    values = decode_cursor(token, sort)
+
+    # (a > x) or (a == x and b > y) or ..., with < for descending keys
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        branch = {sort[j][0]: values[j] for j in range(i)}
+        operator = '$gt' if direction == ASCENDING else '$lt'
+        branch[field] = {operator: values[i]}
+        branches.append(branch)
+    after = branches[0] if len(branches) == 1 else {'$or': branches}
+
+    if not query:
+        return after
+    return {'$and': [query, after]}
+
+'''
+Builds the cursor of the page that follows a list of results.
+Args:
+    results (list): The documents of the current page.
+    sort (list): The (field, direction) pairs of the sort order.
+    limit (int): The page size that was asked for.
+Returns:
+    str: The cursor of the next page, or None if this page is the last.
+'''
+def next_cursor(results, sort, limit):
+    if not results or len(results) < int(limit):
+        return None
+    return encode_cursor(results[-1], sort)
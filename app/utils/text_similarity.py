@@ -0,0 +1,298 @@
+import re
+import threading
+from collections import Counter
+import numpy as np
+from scipy import sparse
+
+'''
+In-memory text similarity.
+TfidfIndex holds the TF-IDF vectors of a set of documents as the rows of
+a sparse matrix, L2 normalized, so the cosine similarity of two
+documents is the dot product of their rows, and keeps the top_k most
+similar documents of each one, so looking them up is a dictionary read.
+The index lives in the memory of a single worker process, like the
+caches of app.utils.cache.
+'''
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Words too common to tell documents apart, and the HTML entities left
+# by html escaping
+STOP_WORDS = frozenset((
+    'a', 'about', 'all', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can',
+    'for', 'from', 'how', 'in', 'into', 'is', 'it', 'its', 'of', 'on', 'or',
+    'our', 'that', 'the', 'their', 'this', 'to', 'what', 'with', 'you', 'your',
+    'amp', 'gt', 'lt', 'nbsp', 'quot', 'x27',
+))
+
+# Rows whose similarities are computed at once by a build
+BUILD_BLOCK_SIZE = 256
+
+'''
+Splits a text into the terms that are indexed.
+Args:
+    text (str): The text.
+Returns:
+    list: The lowercase words and numbers of the text, without stop
+    words and single characters.
+'''
+def tokenize(text):
+    return [
+        term for term in TOKEN_PATTERN.findall(text.lower())
+        if len(term) > 1 and term not in STOP_WORDS
+    ]
+
+'''
+Thread safe TF-IDF index with precomputed nearest neighbors
+- Term frequencies are sublinear, 1 + log(count), and the inverse
+  document frequencies smoothed, 1 + log((1 + n) / (1 + df))
+- build indexes a whole set of documents at once
+- upsert and remove change a single document: the vectors are
+  recomputed with the new document frequencies, which only takes a pass
+  over the matrix, the neighbors of the document are recomputed, and the
+  document is inserted in, or dropped from, the neighbors of the others.
+  The scores of the other pairs keep the document frequencies of when
+  they were computed until the next build.
+'''
+class TfidfIndex:
+    '''
+    Args:
+        top_k (int): Number of neighbors kept per document.
+    '''
+    def __init__(self, top_k=20):
+        self.top_k = top_k
+        self._lock = threading.RLock()
+        self._reset()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    '''
+    Empties the index.
+    '''
+    def _reset(self):
+        # Row of each document, and document of each row, None once removed
+        self._rows = {}
+        self._keys = []
+        self._free_rows = []
+        # Columns and sublinear term frequencies of each row
+        self._row_columns = []
+        self._row_frequencies = []
+        self._vocabulary = {}
+        self._document_frequencies = np.zeros(0, dtype=np.int64)
+        self._matrix = sparse.csr_matrix((0, 0))
+        # Neighbors of each document as (key, score), most similar first,
+        # and the documents listing each document as a neighbor
+        self._neighbors = {}
+        self._referrers = {}
+
+    '''
+    Indexes a set of documents, replacing the indexed ones.
+    Args:
+        documents (iterable): (key, terms) of each document, as returned
+        by tokenize.
+    Returns:
+        None
+    '''
+    def build(self, documents):
+        with self._lock:
+            self._reset()
+            for key, terms in documents:
+                self._store(key, terms)
+            self._vectorize()
+            rows = [row for row, key in enumerate(self._keys) if key is not None]
+            for start in range(0, len(rows), BUILD_BLOCK_SIZE):
+                block = rows[start:start + BUILD_BLOCK_SIZE]
+                scores = (self._matrix[block] @ self._matrix.T).toarray()
+                for row, row_scores in zip(block, scores):
+                    self._set_neighbors(self._keys[row], self._top_k(row, row_scores))
+
+    '''
+    Indexes a new document, or the new text of an indexed one.
+    Args:
+        key: The key of the document.
+        terms (list): The terms of the document, as returned by tokenize.
+    Returns:
+        None
+    '''
+    def upsert(self, key, terms):
+        with self._lock:
+            row = self._store(key, terms)
+            self._vectorize()
+            scores = (self._matrix @ self._matrix[row].T).toarray().ravel()
+            self._set_neighbors(key, self._top_k(row, scores))
+            self._update_referrers(key, scores)
+
+    '''
+    Removes a document from the index.
+    Args:
+        key: The key of the document.
+    Returns:
+        bool: True if the document was indexed.
+    '''
+    def remove(self, key):
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is None:
+                return False
+            self._document_frequencies[self._row_columns[row]] -= 1
+            self._keys[row] = None
+            self._row_columns[row] = np.zeros(0, dtype=np.int64)
+            self._row_frequencies[row] = np.zeros(0)
+            self._free_rows.append(row)
+            self._set_neighbors(key, [])
+            self._vectorize()
+            self._update_referrers(key, np.zeros(len(self._keys)))
+            self._referrers.pop(key, None)
+            return True
+
+    '''
+    Returns the most similar documents of a document.
+    Args:
+        key: The key of the document.
+        limit (int): Maximum number of documents to return.
+    Returns:
+        list: (key, score) of the most similar documents, most similar
+        first, or None if the document is not indexed.
+    '''
+    def neighbors(self, key, limit):
+        with self._lock:
+            if key not in self._rows:
+                return None
+            return self._neighbors.get(key, [])[:limit]
+
+    '''
+    Stores the term frequencies of a document, without computing its
+    vector.
+    Returns:
+        int: The row of the document.
+    '''
+    def _store(self, key, terms):
+        row = self._rows.get(key)
+        if row is not None:
+            self._document_frequencies[self._row_columns[row]] -= 1
+        elif self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = len(self._keys)
+            self._keys.append(None)
+            self._row_columns.append(None)
+            self._row_frequencies.append(None)
+        self._rows[key] = row
+        self._keys[row] = key
+
+        counts = Counter(terms)
+        for term in counts:
+            self._vocabulary.setdefault(term, len(self._vocabulary))
+        if len(self._vocabulary) > len(self._document_frequencies):
+            grown = np.zeros(max(len(self._vocabulary), 2 * len(self._document_frequencies)),
+                             dtype=np.int64)
+            grown[:len(self._document_frequencies)] = self._document_frequencies
+            self._document_frequencies = grown
+
+        columns = np.fromiter((self._vocabulary[term] for term in counts), dtype=np.int64,
+                              count=len(counts))
+        self._row_columns[row] = columns
+        self._row_frequencies[row] = 1 + np.log(
+            np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        )
+        self._document_frequencies[columns] += 1
+        return row
+
+    '''
+    Recomputes the normalized TF-IDF matrix from the term frequencies.
+    '''
+    def _vectorize(self):
+        shape = (len(self._keys), len(self._vocabulary))
+        if not self._rows or not self._vocabulary:
+            self._matrix = sparse.csr_matrix(shape)
+            return
+        document_frequencies = self._document_frequencies[:len(self._vocabulary)]
+        idf = 1 + np.log((1 + len(self._rows)) / (1 + document_frequencies))
+
+        lengths = np.fromiter((len(columns) for columns in self._row_columns), dtype=np.int64,
+                              count=len(self._row_columns))
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        indices = np.concatenate(self._row_columns)
+        data = np.concatenate(self._row_frequencies) * idf[indices]
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=shape)
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        # Rows of removed documents, or without any term, stay empty
+        norms[norms == 0] = 1.0
+        self._matrix = (sparse.diags(1 / norms) @ matrix).tocsr()
+
+    '''
+    Picks the top_k most similar documents of a row.
+    Args:
+        row (int): The row.
+        scores (ndarray): The similarity of the row to every row.
+    Returns:
+        list: (key, score) of the neighbors, most similar first.
+    '''
+    def _top_k(self, row, scores):
+        scores = scores.copy()
+        scores[row] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > self.top_k:
+            # Every row scoring at least the top_k-th best one, so ties at
+            # the cut are broken by row as well
+            cut = np.partition(scores[candidates], len(candidates) - self.top_k)[
+                len(candidates) - self.top_k
+            ]
+            candidates = candidates[scores[candidates] >= cut]
+        # Highest score first, ties by row
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))][:self.top_k]
+        return [(self._keys[other], float(scores[other])) for other in candidates]
+
+    '''
+    Replaces the neighbors of a document, keeping _referrers in sync.
+    '''
+    def _set_neighbors(self, key, neighbors):
+        for other, _ in self._neighbors.get(key, []):
+            self._referrers.get(other, set()).discard(key)
+        if neighbors:
+            self._neighbors[key] = neighbors
+        else:
+            self._neighbors.pop(key, None)
+        for other, _ in neighbors:
+            self._referrers.setdefault(other, set()).add(key)
+
+    '''
+    Inserts a changed document in, or drops it from, the neighbors of
+    the other documents. A document whose full neighbors lose the
+    changed one has its neighbors recomputed, as the next best one is
+    not known.
+    Args:
+        key: The key of the changed document.
+        scores (ndarray): Its similarity to every row, 0 once removed.
+    '''
+    def _update_referrers(self, key, scores):
+        affected = set(self._referrers.get(key, ()))
+        affected.update(
+            self._keys[row] for row in np.flatnonzero(scores > 0) if self._keys[row] != key
+        )
+        recompute = []
+        for other in affected:
+            if other is None:
+                continue
+            current = self._neighbors.get(other, [])
+            neighbors = [neighbor for neighbor in current if neighbor[0] != key]
+            was_full = len(neighbors) < len(current) and len(current) >= self.top_k
+            score = float(scores[self._rows[other]])
+            if score > 0 and (len(neighbors) < self.top_k or score > neighbors[-1][1]):
+                neighbors.append((key, score))
+                neighbors.sort(key=lambda neighbor: -neighbor[1])
+                neighbors = neighbors[:self.top_k]
+            elif was_full:
+                recompute.append(self._rows[other])
+                continue
+            self._set_neighbors(other, neighbors)
+
+        if recompute:
+            scores = (self._matrix[recompute] @ self._matrix.T).toarray()
+            for row, row_scores in zip(recompute, scores):
+                self._set_neighbors(self._keys[row], self._top_k(row, row_scores))
@@ -0,0 +1,271 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+# Child of the Flask application logger
+logger = logging.getLogger('app.token_blocklist')
+
+'''
+Per process cache of the revoked JWT identifiers (jti).
+Checking the blocklist runs on every authenticated request, so instead
+of querying MongoDB each time every worker keeps:
+- a bloom filter of every revoked jti, which answers the common case
+  (the token was not revoked) from memory
+- an exact set of the most recent revocations, which answers most of
+  the positive lookups from memory
+Only a bloom filter positive that is not in the exact set, i.e. an old
+revocation or a false positive, is checked against the database.
+The cache catches up with revocations made by other workers either
+through a change stream, when the deployment supports one, or by
+polling for entries inserted since the last sync once the configured
+staleness bound has passed.
+'''
+
+'''
+Bloom filter over strings, backed by a bytearray.
+Args:
+    capacity (int): Number of items the filter is sized for.
+    error_rate (float): Target false positive rate at capacity.
+'''
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.num_bits = max(
+            int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8
+        )
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: position_i = h1 + i * h2
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+'''
+Blocklist cache of one worker process.
+Args:
+    source: Object giving access to the stored revocations, with the
+    methods contains(jti), find_since(object_id), find_active() and
+    watch_inserts() (see TokenBlacklist).
+    max_staleness (float): Seconds after which the cache must catch up
+    with the database before answering.
+    rebuild_interval (float): Seconds between full rebuilds, which drop
+    the expired revocations from the bloom filter.
+    capacity (int): Number of revocations the bloom filter is sized for.
+    error_rate (float): Target false positive rate of the bloom filter.
+    recent_size (int): Number of revocations kept in the exact set.
+    use_change_stream (bool): Whether to try a change stream first.
+'''
+class TokenBlocklistCache:
+    # Inserts whose ObjectId was generated up to this many seconds before
+    # the last sync are fetched again, to tolerate clock skew between hosts
+    CLOCK_SKEW_SECONDS = 30
+
+    def __init__(self, source, max_staleness=5, rebuild_interval=3600,
+                 capacity=100000, error_rate=0.001, recent_size=10000,
+                 use_change_stream=True):
+        self._source = source
+        self.max_staleness = max_staleness
+        self.rebuild_interval = rebuild_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.recent_size = recent_size
+        self.use_change_stream = use_change_stream
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._recent = OrderedDict()
+        self._sync_from = None
+        self._last_sync = None
+        self._last_rebuild = None
+        self._stream_active = False
+        self._hits = 0
+        self._misses = 0
+        self._false_positives = 0
+
+    '''
+    Checks whether a token was revoked.
+    Args:
+        jti (str): Unique identifier of the token.
+    Returns:
+        bool: True if the token was revoked.
+    '''
+    def contains(self, jti):
+        self._refresh()
+        if jti not in self._bloom:
+            self._hits += 1
+            return False
+        if jti in self._recent:
+            self._hits += 1
+            return True
+
+        # Older revocation or bloom filter false positive
+        self._misses += 1
+        revoked = self._source.contains(jti)
+        if revoked:
+            self._remember(jti)
+        else:
+            self._false_positives += 1
+        return revoked
+
+    '''
+    Records a revocation made by this process, so it applies at once.
+    Args:
+        jti (str): Unique identifier of the revoked token.
+    Returns:
+        None
+    '''
+    def add(self, jti):
+        if self._bloom is None or self._pid != os.getpid():
+            # Not built yet, the next refresh loads the revocation anyway
+            return
+        with self._lock:
+            self._learn(jti)
+
+    '''
+    Returns the cache counters.
+    Returns:
+        dict: hits (answered from memory), misses (database lookups),
+        hit_ratio, false_positives, the sizes of the bloom filter and of
+        the exact set, the age of the last sync in seconds and whether a
+        change stream keeps the cache up to date.
+    '''
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_ratio': self._hits / lookups if lookups else 0.0,
+            'false_positives': self._false_positives,
+            'bloom_entries': self._bloom.count if self._bloom else 0,
+            'recent_entries': len(self._recent),
+            'sync_age_seconds': (
+                time.monotonic() - self._last_sync
+                if self._last_sync is not None else None
+            ),
+            'change_stream': self._stream_active,
+        }
+
+    def _learn(self, jti):
+        # Entries fetched again because of the clock skew window are
+        # already known and must not be counted twice
+        if jti not in self._recent:
+            self._bloom.add(jti)
+        self._remember(jti)
+
+    def _remember(self, jti):
+        self._recent[jti] = True
+        self._recent.move_to_end(jti)
+        while len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+
+    def _refresh(self):
+        if self._pid != os.getpid():
+            # Forked: nothing built by the parent may be trusted
+            self._reset()
+        now = time.monotonic()
+        if self._bloom is None or now - self._last_rebuild > self.rebuild_interval:
+            with self._lock:
+                if self._bloom is None or now - self._last_rebuild > self.rebuild_interval:
+                    self._rebuild()
+            return
+        if now - self._last_sync <= self.max_staleness:
+            return
+        # A single thread catches up, the others wait for it so that the
+        # staleness bound holds for every answer
+        with self._lock:
+            if time.monotonic() - self._last_sync > self.max_staleness:
+                self._sync()
+
+    def _rebuild(self):
+        if self._last_rebuild is not None:
+            # Periodic rebuild, report how the cache did since the last one
+            logger.info(f'Token blocklist cache stats: {self.stats()}')
+        started = time.monotonic()
+        since = datetime.now(timezone.utc)
+        entries = list(self._source.find_active())
+        bloom = BloomFilter(max(self.capacity, 2 * len(entries)), self.error_rate)
+        recent = OrderedDict()
+        # Entries come oldest first, so the newest end up in the exact set
+        for entry in entries:
+            bloom.add(entry['jti'])
+            recent[entry['jti']] = True
+            if len(recent) > self.recent_size:
+                recent.popitem(last=False)
+        self._bloom = bloom
+        self._recent = recent
+        self._sync_from = since
+        self._last_sync = started
+        self._last_rebuild = started
+        if self.use_change_stream and not self._stream_active:
+            self._start_change_stream()
+
+    def _sync(self):
+        started = time.monotonic()
+        since = datetime.now(timezone.utc)
+        object_id = ObjectId.from_datetime(
+            self._sync_from - timedelta(seconds=self.CLOCK_SKEW_SECONDS)
+        )
+        for entry in self._source.find_since(object_id):
+            self._learn(entry['jti'])
+        self._sync_from = since
+        self._last_sync = started
+
+    def _start_change_stream(self):
+        thread = threading.Thread(
+            target=self._follow_change_stream,
+            name='token-blocklist-stream',
+            daemon=True,
+        )
+        thread.start()
+
+    def _follow_change_stream(self):
+        pid = os.getpid()
+        try:
+            with self._source.watch_inserts() as stream:
+                # Revocations inserted between the snapshot of the last
+                # rebuild and the opening of the stream are in neither,
+                # so poll for them once before the stream moves
+                # _sync_from past them
+                with self._lock:
+                    self._sync()
+                self._stream_active = True
+                while stream.alive and pid == os.getpid():
+                    change = stream.try_next()
+                    with self._lock:
+                        if change is not None:
+                            self._learn(change['fullDocument']['jti'])
+                        # The stream is caught up, which counts as a sync
+                        self._last_sync = time.monotonic()
+                        self._sync_from = datetime.now(timezone.utc)
+        except PyMongoError:
+            # Standalone servers have no change streams, polling takes over
+            pass
+        finally:
+            self._stream_active = False
@@ -0,0 +1,185 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+from bson import ObjectId
+
+'''
+Compares content reads and edits of large courses before and after the
+content index (see app/utils/content_index.py).
+The previous paths are replayed with the queries Course used to run:
+the double $unwind aggregation of get_subsection, and the three level
+array_filters update of update_content_data. The new paths are
+Course.get_subsection and Course.update_content_data, which address the
+node through its position in the content index. Courses of 50, 500 and
+5000 content blocks are spread over 10 sections of 5 subsections, and
+every operation targets the last block, the one a scan reaches last.
+Everything runs against a scratch database of the MongoDB server in
+MONGO_URI, which is dropped afterwards. Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/content_index.py --iterations 200
+Unverified: it has only been run against mongomock, to check that it
+executes, which says nothing about the server's query plans or
+latencies. No results have been recorded against a MongoDB server yet.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECTIONS = 10
+SUBSECTIONS = 5
+
+'''
+Builds a content tree with the given number of content blocks.
+Args:
+    blocks (int): Number of content data objects in the tree.
+Returns:
+    list: The sections of the tree.
+'''
+def build_sections(blocks):
+    per_subsection = max(1, blocks // (SECTIONS * SUBSECTIONS))
+    return [
+        {
+            'section_id': str(ObjectId()),
+            'title': f'Section {i}',
+            'order': i + 1,
+            'sub_sections': [
+                {
+                    'subsection_id': str(ObjectId()),
+                    'title': f'Subsection {j}',
+                    'order': j + 1,
+                    'data': [
+                        {
+                            'data_id': str(ObjectId()),
+                            'type': 'text',
+                            'content': 'Lorem ipsum dolor sit amet. ' * 8,
+                            'order': k + 1,
+                        }
+                        for k in range(per_subsection)
+                    ],
+                }
+                for j in range(SUBSECTIONS)
+            ],
+        }
+        for i in range(SECTIONS)
+    ]
+
+
+'''
+get_subsection before the content index.
+'''
+def previous_get_subsection(db, course_id, section_id, subsection_id):
+    return list(db.courses.aggregate([
+        {'$match': {'_id': course_id}},
+        {'$unwind': '$content.sections'},
+        {'$match': {'content.sections.section_id': section_id}},
+        {'$unwind': '$content.sections.sub_sections'},
+        {'$match': {'content.sections.sub_sections.subsection_id': subsection_id}},
+        {'$project': {'subsection': '$content.sections.sub_sections'}}
+    ]))
+
+
+'''
+update_content_data before the content index.
+'''
+def previous_update_content_data(db, course_id, section_id, subsection_id, data_id, content):
+    prefix = 'content.sections.$[section].sub_sections.$[subsection].data.$[data]'
+    db.courses.update_one(
+        {
+            '_id': course_id,
+            'content.sections.section_id': section_id,
+            'content.sections.sub_sections.subsection_id': subsection_id,
+            'content.sections.sub_sections.data.data_id': data_id
+        },
+        {
+            '$set': {
+                f'{prefix}.content': content,
+                f'{prefix}.order': 1,
+                f'{prefix}.type': 'text'
+            }
+        },
+        array_filters=[
+            {'section.section_id': section_id},
+            {'subsection.subsection_id': subsection_id},
+            {'data.data_id': data_id}
+        ]
+    )
+
+
+'''
+Runs an operation repeatedly and measures it.
+Args:
+    operation (callable): Called with the iteration number.
+    iterations (int): Number of runs.
+Returns:
+    dict: Mean and p95 latency in ms.
+'''
+def measure(operation, iterations):
+    latencies = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        operation(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'mean': statistics.mean(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 5000])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--database', default='content_index_benchmark')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_NAME'] = args.database
+    os.environ.setdefault('MONGO_ENSURE_INDEXES', 'false')
+    sys.path.insert(0, ROOT)
+
+    from app import create_app, db, mongo
+    from app.models.course import Course
+
+    app = create_app()
+    rows = []
+    with app.app_context():
+        try:
+            for blocks in args.sizes:
+                sections = build_sections(blocks)
+                course = Course.create('Benchmark', '', 'benchmark', sections=sections)
+                course_id = ObjectId(course['_id'])
+                section = sections[-1]
+                subsection = section['sub_sections'][-1]
+                ids = (section['section_id'], subsection['subsection_id'])
+                data_id = subsection['data'][-1]['data_id']
+
+                rows.append((blocks, 'get_subsection', measure(
+                    lambda i: previous_get_subsection(db, course_id, *ids), args.iterations
+                ), measure(
+                    lambda i: Course.get_subsection(course_id, *ids), args.iterations
+                )))
+                rows.append((blocks, 'update_content_data', measure(
+                    lambda i: previous_update_content_data(
+                        db, course_id, *ids, data_id, f'previous {i}'
+                    ),
+                    args.iterations
+                ), measure(
+                    lambda i: Course.update_content_data(
+                        course_id, *ids, data_id,
+                        {'content': f'indexed {i}', 'order': 1, 'type': 'text'}
+                    ),
+                    args.iterations
+                )))
+        finally:
+            mongo.client.drop_database(args.database)
+
+    print(f'{"blocks":>7}  {"operation":<20}{"previous mean":>14}{"p95":>9}'
+          f'{"indexed mean":>14}{"p95":>9}')
+    for blocks, name, previous, indexed in rows:
+        print(
+            f'{blocks:>7}  {name:<20}{previous["mean"]:>14.3f}{previous["p95"]:>9.3f}'
+            f'{indexed["mean"]:>14.3f}{indexed["p95"]:>9.3f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+from pymongo import monitoring
+
+'''
+Compares the database round trips and latency of enrolling a user in a
+course before and after EnrollmentService.
+The previous path is replayed with the same operations the enroll route
+used to run: User.find_by_id in the route, then Course.enroll_user with
+its $inc, $addToSet and find_one of the whole course, then
+User.update_course_progress with its update and find_one. The new path
+is EnrollmentService.enroll, whose enrollment counts are written once
+per run, as a worker does every ENROLLMENT_COUNT_FLUSH_SECONDS, and
+counted in its commands. Both run against a scratch database of the
+MongoDB server in MONGO_URI, which is dropped afterwards. Every command
+sent to the server is counted with a pymongo command listener. Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/enrollment_round_trips.py --users 500
+Unverified: it has only been run against mongomock, to check that it
+executes. mongomock sends no commands, so neither the command counts
+nor the latencies have been measured against a MongoDB server yet. By
+construction, a first enrollment through the service sends three
+commands (the course read and two writes) against six before, plus one
+bulk write per flush of the enrollment counts.
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+'''
+Counts the commands sent to the server, e.g. find, update, insert.
+'''
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name not in ('endSessions', 'ping', 'hello', 'isMaster'):
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+'''
+The enrollment path before EnrollmentService, operation for operation.
+Args:
+    db: The scratch database.
+    user_id (ObjectId): The user to enroll.
+    course_id (ObjectId): The course to enroll the user in.
+Returns:
+    None
+'''
+def previous_enroll(db, user_id, course_id):
+    db.users.find_one({'_id': user_id})
+    db.courses.update_one({'_id': course_id}, {'$inc': {'enrollment_count': 1}})
+    db.courses.update_one({'_id': course_id}, {'$addToSet': {'enrolled_users': str(user_id)}})
+    db.courses.find_one({'_id': course_id})
+    db.users.update_one(
+        {'_id': user_id, 'course_progress.course_id': str(course_id)},
+        {'$set': {'course_progress.$': {'course_id': str(course_id), 'percentage': 0}}}
+    )
+    db.users.find_one({'_id': user_id})
+
+
+'''
+Runs one enrollment per user and measures it.
+Args:
+    enroll (callable): Enrolls the user with the given ID.
+    user_ids (list): The users to enroll.
+    counter (CommandCounter): The command listener.
+    flush (callable, optional): Run after the enrollments, its commands
+    are counted but not timed.
+Returns:
+    dict: Commands per enrollment and mean and p95 latency in ms.
+'''
+def measure(enroll, user_ids, counter, flush=None):
+    counter.count = 0
+    latencies = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        enroll(user_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+    if flush is not None:
+        flush()
+    latencies.sort()
+    return {
+        'commands': counter.count / len(user_ids),
+        'mean': statistics.mean(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--database', default='enrollment_benchmark')
+    args = parser.parse_args()
+
+    # The listener must be registered before the client is created
+    counter = CommandCounter()
+    monitoring.register(counter)
+    os.environ['DATABASE_NAME'] = args.database
+    os.environ.setdefault('MONGO_ENSURE_INDEXES', 'false')
+    sys.path.insert(0, ROOT)
+
+    from app import create_app, db, mongo
+    from app.models.course import _flush_enrollment_counts
+    from app.services.enrollment import EnrollmentService
+    from app.utils.indexes import ensure_indexes
+
+    app = create_app()
+    with app.app_context():
+        ensure_indexes(db)
+        course_id = db.courses.insert_one({'title': 'Benchmark', 'enrollment_count': 0}).inserted_id
+        user_ids = db.users.insert_many([
+            {
+                'email': f'user{i}@example.com',
+                'username': f'user{i}',
+                'progress': {'in_progress_courses': '', 'completed_courses': []},
+            }
+            for i in range(2 * args.users)
+        ]).inserted_ids
+        before, after = user_ids[:args.users], user_ids[args.users:]
+
+        try:
+            results = {
+                'previous': measure(
+                    lambda user_id: previous_enroll(db, user_id, course_id), before, counter
+                ),
+                'service': measure(
+                    lambda user_id: EnrollmentService.enroll(str(user_id), str(course_id)),
+                    after, counter, _flush_enrollment_counts
+                ),
+                'service, again': measure(
+                    lambda user_id: EnrollmentService.enroll(str(user_id), str(course_id)),
+                    after, counter, _flush_enrollment_counts
+                ),
+            }
+        finally:
+            mongo.client.drop_database(args.database)
+
+    print(f'{"path":<16}{"commands":>10}{"mean ms":>10}{"p95 ms":>10}')
+    for name, result in results.items():
+        print(
+            f'{name:<16}{result["commands"]:>10.1f}'
+            f'{result["mean"]:>10.3f}{result["p95"]:>10.3f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
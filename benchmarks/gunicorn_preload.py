@@ -0,0 +1,130 @@
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+'''
+Compares gunicorn startup time and memory with and without preload_app.
+Starts gunicorn with the project's gunicorn_config.py in both modes,
+waits until every worker has loaded the application, requests the
+swagger UI page once and then reads the memory of the master and workers
+from /proc (Linux only). RSS counts shared pages once per process, PSS
+splits them between the processes that share them, and USS is the
+memory private to each process, so PSS/USS show the copy-on-write gain.
+The application only configures MongoDB at startup, so no database
+needs to be running. Usage:
+    python benchmarks/gunicorn_preload.py --workers 4 --runs 3
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Appended to gunicorn_config.py, marks each worker once the app is loaded,
+# after running the project's own post_worker_init
+HOOK = '''
+_project_post_worker_init = post_worker_init
+
+def post_worker_init(worker):
+    _project_post_worker_init(worker)
+    open(os.path.join({ready_dir!r}, str(os.getpid())), 'w').close()
+'''
+
+'''
+Reads the memory figures of a process from /proc.
+Args:
+    pid (int): The process id.
+Returns:
+    dict: rss, pss and uss in kB.
+'''
+def read_memory(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':'):
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+'''
+Starts gunicorn once and measures it.
+Args:
+    preload (bool): Whether to preload the app in the master.
+    workers (int): Number of worker processes.
+    port (int): Port to bind to.
+Returns:
+    dict: Startup time in seconds and summed memory in kB.
+'''
+def measure(preload, workers, port):
+    work_dir = tempfile.mkdtemp()
+    ready_dir = os.path.join(work_dir, 'ready')
+    os.mkdir(ready_dir)
+    config_path = os.path.join(work_dir, 'gunicorn_bench.py')
+    with open(os.path.join(ROOT, 'gunicorn_config.py')) as f:
+        config = f.read()
+    with open(config_path, 'w') as f:
+        f.write(config + HOOK.format(ready_dir=ready_dir))
+
+    env = dict(os.environ)
+    env['GUNICORN_PRELOAD'] = 'true' if preload else 'false'
+    env.setdefault('MONGO_ENSURE_INDEXES', 'false')
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '-c', config_path,
+        '--workers', str(workers),
+        '--bind', f'127.0.0.1:{port}',
+        '--max-requests', '0',
+        '--access-logfile', '/dev/null',
+        '--error-logfile', os.path.join(work_dir, 'error.log'),
+        'wsgi:application',
+    ]
+    started = time.perf_counter()
+    master = subprocess.Popen(command, cwd=ROOT, env=env)
+    try:
+        while len(os.listdir(ready_dir)) < workers:
+            if master.poll() is not None:
+                raise RuntimeError(f'gunicorn exited, see {work_dir}/error.log')
+            time.sleep(0.01)
+        startup = time.perf_counter() - started
+        urllib.request.urlopen(f'http://127.0.0.1:{port}/api/docs/').read()
+
+        totals = {'rss': 0, 'pss': 0, 'uss': 0}
+        for pid in [master.pid] + [int(p) for p in os.listdir(ready_dir)]:
+            for key, value in read_memory(pid).items():
+                totals[key] += value
+        return {'startup': startup, **totals}
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f'{"mode":<12}{"startup s":>12}{"RSS MiB":>12}{"PSS MiB":>12}{"USS MiB":>12}')
+    for preload in (False, True):
+        results = [measure(preload, args.workers, args.port) for _ in range(args.runs)]
+        best = min(results, key=lambda r: r['startup'])
+        print(
+            f'{"preload" if preload else "no preload":<12}'
+            f'{best["startup"]:>12.2f}'
+            f'{sum(r["rss"] for r in results) / len(results) / 1024:>12.1f}'
+            f'{sum(r["pss"] for r in results) / len(results) / 1024:>12.1f}'
+            f'{sum(r["uss"] for r in results) / len(results) / 1024:>12.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
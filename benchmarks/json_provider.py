@@ -0,0 +1,202 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from bson import ObjectId
+
+'''
+Compares the serialization of large list responses before and after
+the JSON provider of the app (see app/utils/json_provider.py).
+The previous path converts the _id of every document to a string, as
+the models used to, and serializes with Flask's default provider. The
+new path hands the documents to MongoJSONProvider as read, once with
+the json module and once with orjson when it is installed.
+The documents are courses of 10 sections of 5 subsections, as returned
+by the full view of the course list, and assessment results of 20
+questions, as returned by AssessmentResult.find_by_user. No database is
+needed. Usage:
+    python benchmarks/json_provider.py --iterations 50
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+'''
+Builds a course document as read from MongoDB.
+Args:
+    blocks (int): Number of content data objects per subsection.
+Returns:
+    dict: The course.
+'''
+def build_course(blocks):
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        '_id': ObjectId(),
+        'title': 'Introduction to Python',
+        'description': 'A comprehensive introduction to Python programming',
+        'category': 'programming',
+        'difficulty': 'beginner',
+        'prerequisites': [],
+        'content': {
+            'tags': ['python', 'programming', 'basics'],
+            'sections': [
+                {
+                    'section_id': str(ObjectId()),
+                    'title': f'Section {i}',
+                    'order': i + 1,
+                    'sub_sections': [
+                        {
+                            'subsection_id': str(ObjectId()),
+                            'title': f'Subsection {j}',
+                            'order': j + 1,
+                            'data': [
+                                {
+                                    'data_id': str(ObjectId()),
+                                    'type': 'text',
+                                    'content': 'Lorem ipsum dolor sit amet. ' * 8,
+                                    'order': k + 1,
+                                }
+                                for k in range(blocks)
+                            ],
+                        }
+                        for j in range(5)
+                    ],
+                }
+                for i in range(10)
+            ],
+        },
+        'enrollment_count': 120,
+        'completion_count': 40,
+        'version': 7,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+'''
+Builds an assessment result document as read from MongoDB.
+Returns:
+    dict: The assessment result.
+'''
+def build_result():
+    return {
+        '_id': ObjectId(),
+        'user_id': str(ObjectId()),
+        'assessment_id': str(ObjectId()),
+        'score': 75.0,
+        'passed': True,
+        'answers': ['B'] * 20,
+        'questions': [
+            {
+                '_id': ObjectId(),
+                'question_text': 'Which keyword defines a function in Python?',
+                'options': ['func', 'def', 'lambda', 'fn'],
+                'correct_answer': 'def',
+                'tags': ['functions', 'syntax'],
+            }
+            for _ in range(20)
+        ],
+        'knowledge_gaps': ['functions'],
+        'created_at': datetime.now(timezone.utc),
+    }
+
+
+'''
+Serializes a list response the way the routes did before the provider.
+'''
+def previous_response(provider, key, documents):
+    results = []
+    for document in documents:
+        document['_id'] = str(document['_id'])
+        for question in document.get('questions', []):
+            question['_id'] = str(question['_id'])
+        results.append(document)
+    return provider.response({key: results, 'count': len(results)}).get_data()
+
+
+'''
+Runs an operation repeatedly and measures it.
+Args:
+    operation (callable): The operation.
+    iterations (int): Number of runs.
+Returns:
+    dict: Mean and p95 latency in ms.
+'''
+def measure(operation, iterations):
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        operation()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'mean': statistics.mean(latencies),
+        'p95': latencies[max(0, int(len(latencies) * 0.95) - 1)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--blocks', type=int, default=4)
+    parser.add_argument('--results', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+    from app.utils import json_provider
+    from app.utils.json_provider import MongoJSONProvider
+
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    provider = MongoJSONProvider(app)
+    workloads = [
+        ('courses', [build_course(args.blocks) for _ in range(args.courses)]),
+        ('results', [build_result() for _ in range(args.results)]),
+    ]
+
+    rows = []
+    for key, documents in workloads:
+        # The previous path converts in place, so it gets its own copies
+        previous_documents = [
+            {**document, 'questions': [dict(q) for q in document.get('questions', [])]}
+            for document in documents
+        ]
+        row = [key, len(documents), measure(
+            lambda: previous_response(default, key, previous_documents), args.iterations
+        )]
+
+        orjson = json_provider.orjson
+        json_provider.orjson = None
+        try:
+            row.append(measure(
+                lambda: provider.response({key: documents, 'count': len(documents)}).get_data(),
+                args.iterations
+            ))
+        finally:
+            json_provider.orjson = orjson
+
+        if orjson is not None:
+            row.append(measure(
+                lambda: provider.response({key: documents, 'count': len(documents)}).get_data(),
+                args.iterations
+            ))
+        rows.append(row)
+
+    print(f'{"response":<10}{"documents":>10}{"previous mean":>15}{"p95":>9}'
+          f'{"json mean":>11}{"p95":>9}{"orjson mean":>13}{"p95":>9}')
+    for key, count, previous, stdlib, *fast in rows:
+        line = (f'{key:<10}{count:>10}{previous["mean"]:>15.3f}{previous["p95"]:>9.3f}'
+                f'{stdlib["mean"]:>11.3f}{stdlib["p95"]:>9.3f}')
+        if fast:
+            line += f'{fast[0]["mean"]:>13.3f}{fast[0]["p95"]:>9.3f}'
+        else:
+            line += f'{"not installed":>22}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,10 @@ from datetime import timedelta
 '''
 Central configuration class for the Flask application.
 Loads environment variables and defines default settings for:
-- Security keys and JWT configuration
-- MongoDB and database connection
+- Security keys and JWT configuration, including the blocklist cache
+- MongoDB and database connection, including pool sizing and index reconciliation
 - Rate limiting
-- Assessment thresholds and cooldowns
+- Assessment thresholds, cooldowns and answer key caching
 - Image upload parameters and allowed file types
 - Mail server and email settings
 - Frontend domain and support email
@@ -18,13 +18,107 @@ class Config:
     MONGO_URI = os.environ.get('MONGO_URI')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    # Per worker cache of revoked tokens: how stale it may get before it
+    # catches up, how often it is rebuilt, and the bloom filter sizing
+    JWT_BLOCKLIST_MAX_STALENESS_SECONDS = float(os.environ.get('JWT_BLOCKLIST_MAX_STALENESS_SECONDS', 5))
+    JWT_BLOCKLIST_REBUILD_SECONDS = float(os.environ.get('JWT_BLOCKLIST_REBUILD_SECONDS', 3600))
+    JWT_BLOCKLIST_BLOOM_CAPACITY = int(os.environ.get('JWT_BLOCKLIST_BLOOM_CAPACITY', 100000))
+    JWT_BLOCKLIST_BLOOM_ERROR_RATE = float(os.environ.get('JWT_BLOCKLIST_BLOOM_ERROR_RATE', 0.001))
+    JWT_BLOCKLIST_CHANGE_STREAM = os.environ.get('JWT_BLOCKLIST_CHANGE_STREAM', 'true').lower() in ['true', '1']
+    # Role versions cached per worker; a role change made elsewhere is seen
+    # by every worker after at most this many seconds
+    ROLE_VERSION_CACHE_SIZE = int(os.environ.get('ROLE_VERSION_CACHE_SIZE', 10000))
+    ROLE_VERSION_CACHE_TTL_SECONDS = int(os.environ.get('ROLE_VERSION_CACHE_TTL_SECONDS', 30))
     RATELIMIT_DEFAULT = "100 per minute"
     RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI')
     ASSESSMENT_PASS_THRESHOLD = 0.5  # 50%
     ASSESSMENT_COOLDOWN_HOURS = 72
+    # Seconds between two sweeps of expired cooldowns by each gunicorn
+    # worker, see gunicorn_config.post_worker_init, 0 disables them (use
+    # `flask cooldowns sweep` from a cron instead)
+    COOLDOWN_SWEEP_INTERVAL_SECONDS = int(os.environ.get('COOLDOWN_SWEEP_INTERVAL_SECONDS', 3600))
     DATABASE_NAME = os.environ.get('DATABASE_NAME')
+    # Build missing indexes from the model registry when gunicorn starts,
+    # see gunicorn_config.post_worker_init (`flask db ensure-indexes` otherwise)
+    MONGO_ENSURE_INDEXES = os.environ.get('MONGO_ENSURE_INDEXES', 'true').lower() in ['true', '1']
+    # Connection pool settings, per worker process. Unset values keep the
+    # pymongo defaults (maxPoolSize=100, minPoolSize=0, no timeouts).
+    MONGO_MAX_POOL_SIZE = int(os.environ['MONGO_MAX_POOL_SIZE']) if os.environ.get('MONGO_MAX_POOL_SIZE') else None
+    MONGO_MIN_POOL_SIZE = int(os.environ['MONGO_MIN_POOL_SIZE']) if os.environ.get('MONGO_MIN_POOL_SIZE') else None
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ['MONGO_WAIT_QUEUE_TIMEOUT_MS']) if os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS') else None
+    MONGO_MAX_IDLE_TIME_MS = int(os.environ['MONGO_MAX_IDLE_TIME_MS']) if os.environ.get('MONGO_MAX_IDLE_TIME_MS') else None
     FLASK_ENV = os.environ.get('FLASK_ENV')
     ASSESSMENT_PASS_THRESHOLD = float(os.environ.get('ASSESSMENT_PASS_THRESHOLD', 0.5))  # 50%
+    # Compiled answer keys kept per worker, and how long one is kept
+    ANSWER_KEY_CACHE_SIZE = int(os.environ.get('ANSWER_KEY_CACHE_SIZE', 512))
+    ANSWER_KEY_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_KEY_CACHE_TTL_SECONDS', 300))
+    # Seconds a cached answer key is used without checking the updated_at
+    # of its assessment, i.e. how late edits made through other workers
+    # may apply to scoring
+    ANSWER_KEY_VERSION_CHECK_SECONDS = float(
+        os.environ.get('ANSWER_KEY_VERSION_CHECK_SECONDS', 5)
+    )
+    # Course documents kept per worker by Course.find_by_id, bounded by
+    # count and by encoded size; entries are validated against the
+    # course's version on every read
+    COURSE_CACHE_SIZE = int(os.environ.get('COURSE_CACHE_SIZE', 1000))
+    COURSE_CACHE_MAX_BYTES = int(os.environ.get('COURSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Rendered JSON bodies of course reads kept per worker, by course,
+    # version and view, bounded by count and by total size
+    RENDERED_COURSE_CACHE_SIZE = int(os.environ.get('RENDERED_COURSE_CACHE_SIZE', 500))
+    RENDERED_COURSE_CACHE_MAX_BYTES = int(
+        os.environ.get('RENDERED_COURSE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+    )
+    # Seconds between two writes of the new enrollments of a worker to the
+    # enrollment_count of the courses, i.e. how far the counts may lag
+    ENROLLMENT_COUNT_FLUSH_SECONDS = float(os.environ.get('ENROLLMENT_COUNT_FLUSH_SECONDS', 5))
+    # Responses of at least this many bytes are compressed with gzip, or
+    # with br when the Brotli package is installed, see app.utils.compression
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+    # Compressed bodies of responses with an ETag, kept per worker
+    COMPRESSION_CACHE_SIZE = int(os.environ.get('COMPRESSION_CACHE_SIZE', 500))
+    COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get('COMPRESSION_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+    # Neighbors kept per course by `flask recommendations build-similarities`,
+    # and how co-enrollments are scored: 'cosine' or 'jaccard'
+    COURSE_SIMILARITY_TOP_K = int(os.environ.get('COURSE_SIMILARITY_TOP_K', 20))
+    COURSE_SIMILARITY_METRIC = os.environ.get('COURSE_SIMILARITY_METRIC', 'cosine').lower()
+    # Similar courses kept per course by the content similarity index, and
+    # seconds after which a worker rebuilds it in the background, picking
+    # up the course edits of other workers
+    SIMILAR_COURSES_TOP_K = int(os.environ.get('SIMILAR_COURSES_TOP_K', 20))
+    SIMILAR_COURSES_INDEX_TTL = int(os.environ.get('SIMILAR_COURSES_INDEX_TTL', 600))
+    # Recommendation lists kept per worker, by user and arguments. A list is
+    # fresh for RECOMMENDATION_CACHE_TTL seconds and until the user submits
+    # an assessment, starts or completes a course or edits preferences.
+    # A stale list is still served, for up to RECOMMENDATION_CACHE_STALE_TTL
+    # more seconds, while RECOMMENDATION_REFRESH_WORKERS threads recompute it
+    RECOMMENDATION_CACHE_SIZE = int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 5000))
+    RECOMMENDATION_CACHE_MAX_BYTES = int(
+        os.environ.get('RECOMMENDATION_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+    )
+    RECOMMENDATION_CACHE_TTL = int(os.environ.get('RECOMMENDATION_CACHE_TTL', 900))
+    RECOMMENDATION_CACHE_STALE_TTL = int(os.environ.get('RECOMMENDATION_CACHE_STALE_TTL', 3600))
+    RECOMMENDATION_REFRESH_WORKERS = int(os.environ.get('RECOMMENDATION_REFRESH_WORKERS', 2))
+    # Threads per worker running the strategies of course recommendations
+    # concurrently, and the seconds each strategy is given, its queries
+    # included (sent with the matching maxTimeMS). Strategies that miss
+    # their deadline, or find every thread busy, are left out, popular
+    # courses are returned if all are
+    RECOMMENDATION_STRATEGY_WORKERS = int(os.environ.get('RECOMMENDATION_STRATEGY_WORKERS', 8))
+    RECOMMENDATION_KNOWLEDGE_GAP_TIMEOUT = float(
+        os.environ.get('RECOMMENDATION_KNOWLEDGE_GAP_TIMEOUT', 2.0)
+    )
+    RECOMMENDATION_COLLABORATIVE_TIMEOUT = float(
+        os.environ.get('RECOMMENDATION_COLLABORATIVE_TIMEOUT', 2.0)
+    )
+    RECOMMENDATION_CONTENT_BASED_TIMEOUT = float(
+        os.environ.get('RECOMMENDATION_CONTENT_BASED_TIMEOUT', 2.0)
+    )
+    # Where new courses store their content data: 'embedded' in the course
+    # document, or 'blocks' in the content_blocks collection, which leaves
+    # the course document with an outline (see `flask db migrate-content-blocks`)
+    COURSE_CONTENT_STORAGE = os.environ.get('COURSE_CONTENT_STORAGE', 'embedded').lower()
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS')
 
     # For image uplaod parameters
@@ -1,4 +1,5 @@
 # gunicorn_config.py
+import os
 import multiprocessing
 
 # Bind to this socket
@@ -26,11 +27,38 @@ errorlog = "-"
 # Process name
 proc_name = "learning_platform"
 
-# Preload application code before forking worker processes
-preload_app = False
+# Preload application code before forking worker processes, so that the
+# workers share the imported app and swagger specs copy-on-write. This is
+# safe because the MongoClient is only created after the fork (post_fork).
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ['true', '1']
 
 # Restart workers after this many requests
 max_requests = 1000
 
 # Restart workers after this many seconds
 max_requests_jitter = 50
+
+# Drop any MongoClient inherited from the master process. Each worker
+# then creates its own client, with its own pool, on first use.
+def post_fork(server, worker):
+    from app import mongo
+    mongo.reset()
+
+# Start the background work of the app in the workers, once they loaded
+# it, so that the master never starts a thread or opens a connection
+# before forking:
+# - the declared indexes are reconciled once per start, by the first
+#   worker, the workers forked later, e.g. by max_requests, skip it
+# - every worker sweeps the expired cooldowns, so the sweeps go on when a
+#   worker is replaced; a sweep is a single idempotent update
+def post_worker_init(worker):
+    app = worker.wsgi
+    if worker.age == 1 and app.config.get('MONGO_ENSURE_INDEXES'):
+        from app import db
+        from app.utils.indexes import ensure_indexes_in_background
+        ensure_indexes_in_background(db, app.logger)
+
+    # Expired cooldowns are ignored at read time; clear them periodically
+    if app.config.get('COOLDOWN_SWEEP_INTERVAL_SECONDS'):
+        from app.utils.cooldown_manager import start_cooldown_sweeper
+        start_cooldown_sweeper(app.config['COOLDOWN_SWEEP_INTERVAL_SECONDS'], app.logger)
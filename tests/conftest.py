@@ -0,0 +1,10 @@
+import os
+import sys
+
+# config.Config reads these at import time, the units under test never
+# send mail nor reach the database
+os.environ.setdefault('MAIL_PORT', '587')
+os.environ.setdefault('MAIL_USE_TLS', 'false')
+os.environ.setdefault('MAIL_USE_SSL', 'false')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,111 @@
+from bson import ObjectId
+from app.utils.content_index import (
+    array_path, build_content_index, is_indexable, locate, node_path, position_guard,
+    remove_from_index
+)
+
+
+# Sections with the given number of data objects per subsection
+def make_sections(shape):
+    return [
+        {
+            'section_id': str(ObjectId()),
+            'sub_sections': [
+                {
+                    'subsection_id': str(ObjectId()),
+                    'data': [{'data_id': str(ObjectId())} for _ in range(data)],
+                }
+                for data in subsections
+            ],
+        }
+        for subsections in shape
+    ]
+
+
+# IDs of the node at the position and of its ancestors
+def ids(sections, *position):
+    section = sections[position[0]]
+    node_ids = [section['section_id']]
+    if len(position) > 1:
+        subsection = section['sub_sections'][position[1]]
+        node_ids.append(subsection['subsection_id'])
+        if len(position) > 2:
+            node_ids.append(subsection['data'][position[2]]['data_id'])
+    return tuple(node_ids)
+
+
+def test_is_indexable_only_accepts_object_id_strings():
+    assert is_indexable(str(ObjectId()))
+    assert not is_indexable(ObjectId())
+    assert not is_indexable('a.b')
+    assert not is_indexable(None)
+
+
+def test_build_skips_nodes_without_a_valid_id():
+    sections = make_sections([[1]])
+    sections.append({'section_id': 'not-an-id', 'sub_sections': []})
+
+    index = build_content_index(sections)
+
+    assert list(index['sections'].values()) == [[0]]
+
+
+def test_locate_finds_every_node():
+    sections = make_sections([[2, 1], [0, 3]])
+    index = build_content_index(sections)
+
+    assert locate(index, ids(sections, 1)) == [1]
+    assert locate(index, ids(sections, 0, 1)) == [0, 1]
+    assert locate(index, ids(sections, 1, 1, 2)) == [1, 1, 2]
+
+
+def test_locate_rejects_nodes_under_other_ancestors():
+    sections = make_sections([[2], [2]])
+    index = build_content_index(sections)
+    section_id = ids(sections, 0)[0]
+    _, subsection_id, data_id = ids(sections, 1, 0, 1)
+
+    assert locate(index, (section_id, subsection_id)) is None
+    assert locate(index, (section_id, subsection_id, data_id)) is None
+    # A data ID asked for as a subsection
+    assert locate(index, (ids(sections, 1)[0], data_id)) is None
+    assert locate(index, (str(ObjectId()),)) is None
+    assert locate(index, ('not-an-id',)) is None
+
+
+def test_paths_and_guard_address_the_node():
+    sections = make_sections([[1], [0, 2]])
+    node_ids = ids(sections, 1, 1, 0)
+
+    assert node_path([1, 1, 0]) == 'content.sections.1.sub_sections.1.data.0'
+    assert array_path([1, 1, 0]) == 'content.sections.1.sub_sections.1.data'
+    assert array_path([1]) == 'content.sections'
+    assert position_guard([1, 1, 0], node_ids) == {
+        'content.sections.1.section_id': node_ids[0],
+        'content.sections.1.sub_sections.1.subsection_id': node_ids[1],
+        'content.sections.1.sub_sections.1.data.0.data_id': node_ids[2],
+    }
+
+
+def test_remove_from_index_matches_a_rebuild():
+    shape = [[2, 3], [1, 0, 2], [2]]
+    for position in ([1], [0, 0], [1, 2], [0, 1, 1], [2, 0, 0], [1, 2, 1]):
+        sections = make_sections(shape)
+        index = build_content_index(sections)
+
+        nodes = sections
+        for depth, i in enumerate(position[:-1]):
+            nodes = nodes[i]['sub_sections' if depth == 0 else 'data']
+        del nodes[position[-1]]
+
+        assert remove_from_index(index, position) == build_content_index(sections), position
+
+
+def test_remove_from_index_leaves_the_index_unchanged():
+    sections = make_sections([[1, 1], [1]])
+    index = build_content_index(sections)
+    before = {key: dict(entries) for key, entries in index.items()}
+
+    remove_from_index(index, [0, 0])
+
+    assert index == before
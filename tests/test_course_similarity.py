@@ -0,0 +1,51 @@
+import pytest
+from app.services.course_similarity import CourseSimilarityService
+
+
+def neighbor_ids(neighbors, course_id):
+    return [neighbor['course_id'] for neighbor in neighbors[course_id]]
+
+
+def test_compute_counts_a_course_listed_twice_once():
+    neighbors = CourseSimilarityService.compute([['a', 'b', 'b'], ['a', 'b'], ['a', 'c']])
+
+    assert neighbors['a'][0] == {'course_id': 'b', 'score': pytest.approx(2 / 6 ** 0.5), 'support': 2}
+    assert neighbors['b'] == [{'course_id': 'a', 'score': pytest.approx(2 / 6 ** 0.5), 'support': 2}]
+
+
+def test_compute_jaccard():
+    neighbors = CourseSimilarityService.compute(
+        [['a', 'b'], ['a', 'b'], ['a'], ['b', 'b']], metric='jaccard'
+    )
+
+    # 2 users took both, 4 took either
+    assert neighbors['a'] == [{'course_id': 'b', 'score': pytest.approx(0.5), 'support': 2}]
+
+
+def test_compute_keeps_the_top_k_most_similar_first():
+    user_courses = [['a', 'b'], ['a', 'b'], ['a', 'b'], ['a', 'c'], ['a', 'c'], ['a', 'd']]
+
+    neighbors = CourseSimilarityService.compute(user_courses, top_k=2)
+
+    assert neighbor_ids(neighbors, 'a') == ['b', 'c']
+    assert [neighbor['support'] for neighbor in neighbors['a']] == [3, 2]
+    assert neighbor_ids(neighbors, 'd') == ['a']
+
+
+def test_compute_breaks_score_ties_by_support():
+    # b and c both score 1 / sqrt(3) against a, c with more users in common
+    user_courses = [['a', 'b']] + [['a', 'c']] * 2 + [['c']] * 2
+
+    neighbors = CourseSimilarityService.compute(user_courses, top_k=1)
+
+    assert neighbor_ids(neighbors, 'a') == ['c']
+
+
+def test_compute_leaves_out_courses_taken_alone():
+    assert CourseSimilarityService.compute([['a'], ['b']]) == {}
+    assert CourseSimilarityService.compute([]) == {}
+
+
+def test_compute_rejects_unknown_metrics():
+    with pytest.raises(ValueError):
+        CourseSimilarityService.compute([['a', 'b']], metric='euclidean')
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+import pytest
+from bson import ObjectId
+from app.utils.pagination import (
+    SORT_BY_ID, SORT_BY_NEWEST, decode_cursor, encode_cursor, keyset_filter, next_cursor
+)
+
+
+def test_cursor_round_trips_by_id():
+    document = {'_id': ObjectId(), 'title': 'Python'}
+
+    token = encode_cursor(document, SORT_BY_ID)
+
+    assert decode_cursor(token, SORT_BY_ID) == [document['_id']]
+    assert '=' not in token
+
+
+def test_cursor_round_trips_by_newest():
+    document = {'_id': ObjectId(), 'created_at': datetime.now(timezone.utc).isoformat()}
+
+    values = decode_cursor(encode_cursor(document, SORT_BY_NEWEST), SORT_BY_NEWEST)
+
+    assert values == [document['created_at'], document['_id']]
+
+
+def test_cursor_keeps_a_missing_sort_key():
+    document = {'_id': ObjectId()}
+
+    values = decode_cursor(encode_cursor(document, SORT_BY_NEWEST), SORT_BY_NEWEST)
+
+    assert values == [None, document['_id']]
+
+
+@pytest.mark.parametrize('token', [
+    'not a cursor',
+    '',
+    encode_cursor({'_id': ObjectId()}, SORT_BY_ID) + '!',
+    # Valid cursor of another sort order
+    encode_cursor({'_id': ObjectId(), 'created_at': 'x'}, SORT_BY_NEWEST),
+    # Valid JSON, not an ObjectId
+    encode_cursor({'_id': 'abc'}, SORT_BY_ID),
+])
+def test_decode_rejects_invalid_cursors(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token, SORT_BY_ID)
+
+
+def test_keyset_filter_by_id():
+    document = {'_id': ObjectId()}
+    token = encode_cursor(document, SORT_BY_ID)
+
+    assert keyset_filter({}, SORT_BY_ID) == {}
+    assert keyset_filter({}, SORT_BY_ID, token) == {'_id': {'$gt': document['_id']}}
+    assert keyset_filter({'category': 'web'}, SORT_BY_ID, token) == {
+        '$and': [{'category': 'web'}, {'_id': {'$gt': document['_id']}}]
+    }
+
+
+def test_keyset_filter_by_newest():
+    document = {'_id': ObjectId(), 'created_at': '2024-01-01T00:00:00+00:00'}
+    token = encode_cursor(document, SORT_BY_NEWEST)
+
+    assert keyset_filter({}, SORT_BY_NEWEST, token) == {'$or': [
+        {'created_at': {'$lt': document['created_at']}},
+        {'created_at': document['created_at'], '_id': {'$lt': document['_id']}},
+    ]}
+
+
+def test_next_cursor_only_for_full_pages():
+    results = [{'_id': ObjectId()} for _ in range(3)]
+
+    assert next_cursor(results[:2], SORT_BY_ID, 3) is None
+    assert next_cursor([], SORT_BY_ID, 3) is None
+    assert decode_cursor(next_cursor(results, SORT_BY_ID, '3'), SORT_BY_ID) == [results[-1]['_id']]
@@ -0,0 +1,116 @@
+import numpy as np
+from app.utils.text_similarity import TfidfIndex, tokenize
+
+DOCUMENTS = {
+    'python': 'python programming basics',
+    'advanced-python': 'advanced python programming',
+    'django': 'web development with python django',
+    'react': 'web development with react',
+    'cooking': 'italian cooking basics',
+}
+
+
+def build(top_k=20, documents=DOCUMENTS):
+    index = TfidfIndex(top_k=top_k)
+    index.build((key, tokenize(text)) for key, text in documents.items())
+    return index
+
+
+def neighbor_keys(index, key):
+    return [other for other, _ in index.neighbors(key, limit=100)]
+
+
+def assert_referrers_match_neighbors(index):
+    expected = {}
+    for key, neighbors in index._neighbors.items():
+        assert key in index
+        for other, _ in neighbors:
+            assert other in index
+            expected.setdefault(other, set()).add(key)
+    actual = {key: referrers for key, referrers in index._referrers.items() if referrers}
+    assert actual == expected
+
+
+def test_tokenize_drops_stop_words_and_single_characters():
+    assert tokenize('The Basics of C and Python 3, &amp; more') == ['basics', 'python', 'more']
+
+
+def test_build_finds_the_most_similar_documents_first():
+    index = build()
+
+    assert neighbor_keys(index, 'python')[0] == 'advanced-python'
+    assert neighbor_keys(index, 'react') == ['django']
+    assert index.neighbors('unknown', limit=5) is None
+    assert_referrers_match_neighbors(index)
+
+
+def test_upsert_adds_a_document_to_the_neighbors_of_the_others():
+    index = build()
+
+    index.upsert('flask', tokenize('web development with python flask'))
+
+    assert 'flask' in neighbor_keys(index, 'django')
+    assert 'flask' in neighbor_keys(index, 'react')
+    assert 'django' in neighbor_keys(index, 'flask')
+    assert 'flask' not in neighbor_keys(index, 'cooking')
+    assert_referrers_match_neighbors(index)
+
+
+def test_upsert_of_new_text_drops_the_document_where_it_no_longer_fits():
+    index = build()
+
+    index.upsert('react', tokenize('italian cooking desserts'))
+
+    assert 'react' not in neighbor_keys(index, 'django')
+    assert 'react' in neighbor_keys(index, 'cooking')
+    assert neighbor_keys(index, 'react') == ['cooking']
+    assert_referrers_match_neighbors(index)
+
+
+def test_remove_drops_the_document_from_every_neighbor_list():
+    index = build()
+
+    assert index.remove('django')
+    assert not index.remove('django')
+
+    assert 'django' not in index
+    assert index.neighbors('django', limit=5) is None
+    for key in index._rows:
+        assert 'django' not in neighbor_keys(index, key)
+    assert_referrers_match_neighbors(index)
+
+
+def test_remove_refills_full_neighbor_lists():
+    index = build(top_k=1)
+    assert neighbor_keys(index, 'advanced-python') == ['python']
+
+    index.remove('python')
+
+    # Its only neighbor is gone, the next best one takes its place
+    assert neighbor_keys(index, 'advanced-python') == ['django']
+    assert_referrers_match_neighbors(index)
+
+
+def test_removed_rows_are_reused():
+    index = build()
+    index.remove('cooking')
+
+    index.upsert('baking', tokenize('baking bread basics'))
+
+    assert len(index) == len(DOCUMENTS)
+    assert len(index._keys) == len(DOCUMENTS)
+    assert 'baking' in neighbor_keys(index, 'python')
+    assert_referrers_match_neighbors(index)
+
+
+def test_ties_at_the_cut_go_to_the_first_indexed():
+    documents = {f'course-{i}': 'python' for i in range(30)}
+    index = build(top_k=25, documents=documents)
+    # Scores of the other rows against row 0, more of them tie at the cut
+    # than fit in it
+    scores = np.array([0.0] + [0.2, 0.9, 0.5] * 9 + [0.9, 0.5])
+
+    neighbors = index._top_k(0, scores)
+
+    expected = sorted(range(1, 30), key=lambda row: (-scores[row], row))[:25]
+    assert [key for key, _ in neighbors] == [f'course-{row}' for row in expected]